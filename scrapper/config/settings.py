@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 import dj_database_url
@@ -57,6 +58,7 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "scrapper.core.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "scrapper.config.urls"
@@ -145,3 +147,220 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ]
 }
+
+# Scrapper Settings
+
+# Maximum number of images downloaded at the same time while scrapping a page
+SCRAPPER_DOWNLOAD_WORKERS = int(
+    os.environ.get("SCRAPPER_DOWNLOAD_WORKERS", 16)
+)
+# Maximum number of images downloaded at the same time from a single host
+SCRAPPER_DOWNLOAD_PER_HOST = int(
+    os.environ.get("SCRAPPER_DOWNLOAD_PER_HOST", 6)
+)
+
+# Scrapping HTTP client, connections are pooled and kept alive per host
+SCRAPPER_HTTP_CONNECT_TIMEOUT = float(
+    os.environ.get("SCRAPPER_HTTP_CONNECT_TIMEOUT", 5)
+)
+SCRAPPER_HTTP_READ_TIMEOUT = float(
+    os.environ.get("SCRAPPER_HTTP_READ_TIMEOUT", 20)
+)
+# Number of hosts to keep a connection pool for
+SCRAPPER_HTTP_POOL_CONNECTIONS = int(
+    os.environ.get("SCRAPPER_HTTP_POOL_CONNECTIONS", 32)
+)
+# Number of connections kept alive per host
+SCRAPPER_HTTP_POOL_MAXSIZE = int(
+    os.environ.get("SCRAPPER_HTTP_POOL_MAXSIZE", SCRAPPER_DOWNLOAD_PER_HOST)
+)
+SCRAPPER_USER_AGENT = os.environ.get(
+    "SCRAPPER_USER_AGENT",
+    "ImageScrapper/1.0 (+https://github.com/khan-asfi-reza/image-scrapper)",
+)
+
+# Per host politeness of the scrapping HTTP client, the limits are stored in
+# the SCRAPPER_POLITENESS_CACHE cache, configure a shared cache (Redis,
+# Memcached, database) in CACHES to enforce them across processes
+SCRAPPER_POLITENESS = (
+    os.environ.get("SCRAPPER_POLITENESS", "true").lower() == "true"
+)
+SCRAPPER_POLITENESS_CACHE = os.environ.get(
+    "SCRAPPER_POLITENESS_CACHE", "default"
+)
+# Token bucket of every host, SCRAPPER_HOST_RATE requests per second (0 for
+# no limit) with bursts of SCRAPPER_HOST_BURST requests, a robots.txt
+# Crawl-delay lowers the rate
+SCRAPPER_HOST_RATE = float(os.environ.get("SCRAPPER_HOST_RATE", 8))
+SCRAPPER_HOST_BURST = int(os.environ.get("SCRAPPER_HOST_BURST", 16))
+# Requests in flight against a single host across every process
+SCRAPPER_HOST_CONCURRENCY = int(
+    os.environ.get("SCRAPPER_HOST_CONCURRENCY", SCRAPPER_DOWNLOAD_PER_HOST)
+)
+# A request waiting longer than this for a host fails instead
+SCRAPPER_POLITENESS_MAX_WAIT = float(
+    os.environ.get("SCRAPPER_POLITENESS_MAX_WAIT", 30)
+)
+# A 429 response (or 503 with Retry-After) backs off the host for the
+# Retry-After delay, SCRAPPER_THROTTLE_BACKOFF seconds when it is missing,
+# the request is retried up to SCRAPPER_THROTTLE_RETRIES times
+SCRAPPER_THROTTLE_BACKOFF = float(
+    os.environ.get("SCRAPPER_THROTTLE_BACKOFF", 5)
+)
+SCRAPPER_THROTTLE_RETRIES = int(
+    os.environ.get("SCRAPPER_THROTTLE_RETRIES", 2)
+)
+# robots.txt of every host is honored and cached for SCRAPPER_ROBOTS_TTL
+# seconds
+SCRAPPER_ROBOTS_TXT = (
+    os.environ.get("SCRAPPER_ROBOTS_TXT", "true").lower() == "true"
+)
+SCRAPPER_ROBOTS_TTL = int(os.environ.get("SCRAPPER_ROBOTS_TTL", 3600))
+
+# Number of addresses dispatched to the workers at once by the image sync
+SCRAPPER_SYNC_CHUNK_SIZE = int(os.environ.get("SCRAPPER_SYNC_CHUNK_SIZE", 500))
+
+# Resized images served by the image view are cached on disk,
+# defaults to MEDIA_ROOT/renditions
+SCRAPPER_RENDITION_CACHE_DIR = os.environ.get("SCRAPPER_RENDITION_CACHE_DIR")
+# Size budget of the rendition cache in bytes, least recently used
+# renditions are evicted once exceeded
+SCRAPPER_RENDITION_CACHE_MAX_BYTES = int(
+    os.environ.get("SCRAPPER_RENDITION_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+)
+
+# Enable to encode the preset renditions (small, medium, large) of every
+# stored image in a background Celery task right after the ingest
+SCRAPPER_PRECOMPUTE_RENDITIONS = (
+    os.environ.get("SCRAPPER_PRECOMPUTE_RENDITIONS", "").lower() == "true"
+)
+# Comma separated formats of the precomputed renditions
+SCRAPPER_PRECOMPUTE_FORMATS = [
+    img_format.strip()
+    for img_format in os.environ.get(
+        "SCRAPPER_PRECOMPUTE_FORMATS", "jpeg,webp"
+    ).split(",")
+    if img_format.strip()
+]
+# Number of processes encoding the precomputed renditions, 0 encodes them
+# in the Celery worker process itself
+SCRAPPER_RENDITION_WORKERS = int(
+    os.environ.get("SCRAPPER_RENDITION_WORKERS", os.cpu_count() or 1)
+)
+
+# Speed / quality preset of the image resize engine: "fast", "balanced",
+# "quality" or "exact" (full resolution decode), clear the rendition cache
+# after changing it
+SCRAPPER_RESIZE_PRESET = os.environ.get("SCRAPPER_RESIZE_PRESET", "balanced")
+
+# Resized images are encoded by a pool of SCRAPPER_TRANSCODE_WORKERS processes
+# outside of the web workers, at most SCRAPPER_TRANSCODE_MAX_PENDING
+# transcodes run or wait at once, the image view answers 503 with a
+# Retry-After header once the limit is reached or a transcode times out
+SCRAPPER_TRANSCODE_WORKERS = int(
+    os.environ.get("SCRAPPER_TRANSCODE_WORKERS", os.cpu_count() or 1)
+)
+SCRAPPER_TRANSCODE_MAX_PENDING = int(
+    os.environ.get(
+        "SCRAPPER_TRANSCODE_MAX_PENDING", max(SCRAPPER_TRANSCODE_WORKERS, 1) * 4
+    )
+)
+SCRAPPER_TRANSCODE_TIMEOUT = float(
+    os.environ.get("SCRAPPER_TRANSCODE_TIMEOUT", 10)
+)
+SCRAPPER_TRANSCODE_RETRY_AFTER = int(
+    os.environ.get("SCRAPPER_TRANSCODE_RETRY_AFTER", 2)
+)
+
+# Cache-Control max-age of the images served by the image view, images are
+# revalidated with their ETag and Last-Modified headers
+SCRAPPER_IMAGE_CACHE_MAX_AGE = int(
+    os.environ.get("SCRAPPER_IMAGE_CACHE_MAX_AGE", 365 * 24 * 60 * 60)
+)
+
+# Original images and precomputed renditions are streamed by Django unless
+# the transfer is delegated to the web server: "x-accel-redirect" (nginx,
+# internal location SCRAPPER_SENDFILE_PREFIX aliased to MEDIA_ROOT) or
+# "x-sendfile" (Apache mod_xsendfile, lighttpd)
+SCRAPPER_SENDFILE = os.environ.get("SCRAPPER_SENDFILE", "").lower()
+SCRAPPER_SENDFILE_PREFIX = os.environ.get(
+    "SCRAPPER_SENDFILE_PREFIX", "/protected-media/"
+)
+
+# Counters and histograms of the scrapping stages and of the image view,
+# exposed to admin and staff users at /api/metrics/ in the Prometheus text
+# format. Disabled metrics cost a single settings lookup
+SCRAPPER_METRICS = os.environ.get("SCRAPPER_METRICS", "").lower() == "true"
+# Every web and Celery process saves its metrics in the
+# SCRAPPER_METRICS_CACHE cache at most every SCRAPPER_METRICS_FLUSH_INTERVAL
+# seconds and after every task, configure a shared cache (Redis, Memcached,
+# database) in CACHES to expose the metrics of every process. The metrics of
+# a process stopped for SCRAPPER_METRICS_TTL seconds are dropped
+SCRAPPER_METRICS_CACHE = os.environ.get("SCRAPPER_METRICS_CACHE", "default")
+SCRAPPER_METRICS_FLUSH_INTERVAL = float(
+    os.environ.get("SCRAPPER_METRICS_FLUSH_INTERVAL", 5)
+)
+SCRAPPER_METRICS_TTL = int(os.environ.get("SCRAPPER_METRICS_TTL", 7 * 86400))
+
+# Staff users can profile a request with the `X-Profile` header or the
+# `?profile` query parameter, the last SCRAPPER_PROFILE_LIMIT profiles are
+# kept in SCRAPPER_PROFILE_DIR and listed at /admin/profiles/. The default
+# temporary directory keeps the dumps out of the source tree and of the
+# publicly served MEDIA_ROOT
+SCRAPPER_PROFILE_DIR = os.environ.get(
+    "SCRAPPER_PROFILE_DIR",
+    Path(tempfile.gettempdir()) / "scrapper-profiles",
+)
+SCRAPPER_PROFILE_LIMIT = int(os.environ.get("SCRAPPER_PROFILE_LIMIT", 50))
+
+# Downloaded images are stored as they are, enable to decode and re-encode
+# them with Pillow before storing
+SCRAPPER_REENCODE_ON_INGEST = (
+    os.environ.get("SCRAPPER_REENCODE_ON_INGEST", "").lower() == "true"
+)
+
+# Limits of the crawl jobs, links are followed up to SCRAPPER_CRAWL_MAX_DEPTH
+# levels from the submitted url and at most SCRAPPER_CRAWL_MAX_PAGES pages
+# are fetched per job, at most SCRAPPER_CRAWL_FRONTIER_SIZE discovered urls
+# wait in the frontier
+SCRAPPER_CRAWL_MAX_DEPTH = int(os.environ.get("SCRAPPER_CRAWL_MAX_DEPTH", 5))
+SCRAPPER_CRAWL_MAX_PAGES = int(
+    os.environ.get("SCRAPPER_CRAWL_MAX_PAGES", 1000)
+)
+SCRAPPER_CRAWL_FRONTIER_SIZE = int(
+    os.environ.get("SCRAPPER_CRAWL_FRONTIER_SIZE", 100000)
+)
+
+# Sitemap ingest, pages are inserted and enqueued SCRAPPER_SITEMAP_BATCH_SIZE
+# at a time, at most SCRAPPER_SITEMAP_MAX_URLS pages and
+# SCRAPPER_SITEMAP_MAX_FILES sitemaps are read per ingest
+SCRAPPER_SITEMAP_BATCH_SIZE = int(
+    os.environ.get("SCRAPPER_SITEMAP_BATCH_SIZE", 500)
+)
+SCRAPPER_SITEMAP_MAX_URLS = int(
+    os.environ.get("SCRAPPER_SITEMAP_MAX_URLS", 500000)
+)
+SCRAPPER_SITEMAP_MAX_FILES = int(
+    os.environ.get("SCRAPPER_SITEMAP_MAX_FILES", 1000)
+)
+
+# Number of image rows inserted per query while scrapping a page
+SCRAPPER_INGEST_BATCH_SIZE = int(
+    os.environ.get("SCRAPPER_INGEST_BATCH_SIZE", 100)
+)
+
+# Number of image rows deleted per query when the images of an url are
+# restored, the files are removed in the background by batches of this size
+SCRAPPER_DELETE_BATCH_SIZE = int(
+    os.environ.get("SCRAPPER_DELETE_BATCH_SIZE", 500)
+)
+
+# Engine extracting the images of a scrapped page: "lxml", "stream" (standard
+# library tokenizer) or "bs4" (BeautifulSoup tree), "auto" picks the fastest
+# available one
+SCRAPPER_HTML_PARSER = os.environ.get("SCRAPPER_HTML_PARSER", "auto")
+
+# Number of images per page of the list endpoints, `?page_size=` is bounded
+# by SCRAPPER_MAX_PAGE_SIZE
+SCRAPPER_PAGE_SIZE = int(os.environ.get("SCRAPPER_PAGE_SIZE", 100))
+SCRAPPER_MAX_PAGE_SIZE = int(os.environ.get("SCRAPPER_MAX_PAGE_SIZE", 1000))
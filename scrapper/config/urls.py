@@ -8,10 +8,22 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from scrapper.config import settings
 from scrapper.config.docs import SchemaView
-from scrapper.core.views import ImageView, IndexView, ScrapeFormView
+from scrapper.core.views import (
+    ImageView,
+    IndexView,
+    ProfileDownloadView,
+    ProfileListView,
+    ScrapeFormView,
+)
 
 urlpatterns = [
     # Admin
+    path("admin/profiles/", ProfileListView.as_view(), name="profile-list"),
+    path(
+        "admin/profiles/<str:profile_id>",
+        ProfileDownloadView.as_view(),
+        name="profile-download",
+    ),
     path("admin/", admin.site.urls, name="admin-view"),
     # Auth
     path(
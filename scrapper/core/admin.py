@@ -3,7 +3,7 @@ Admin
 """
 from django.contrib import admin
 
-from scrapper.core.models import Address, Image
+from scrapper.core.models import Address, Image, Rendition, ScrapeJob, SyncRun
 
 
 class URLAdmin(admin.ModelAdmin):
@@ -26,7 +26,56 @@ class ImageAdmin(admin.ModelAdmin):
     ]
 
 
+class ScrapeJobAdmin(admin.ModelAdmin):
+    """
+    Admin view for background scrapping jobs
+    """
+
+    list_display = [
+        "id",
+        "address",
+        "status",
+        "pages_fetched",
+        "images_saved",
+        "failures",
+        "max_depth",
+        "created",
+    ]
+    list_filter = ["status"]
+
+
+class SyncRunAdmin(admin.ModelAdmin):
+    """
+    Admin view for image sync runs and their checkpoints
+    """
+
+    list_display = [
+        "id",
+        "status",
+        "addresses_done",
+        "new_images",
+        "failures",
+        "last_address_id",
+        "created",
+        "finished",
+    ]
+    list_filter = ["status"]
+
+
+class RenditionAdmin(admin.ModelAdmin):
+    """
+    Admin view for precomputed image renditions
+    """
+
+    list_display = ["id", "image", "width", "height", "format", "file_size"]
+    list_filter = ["format"]
+    raw_id_fields = ["image"]
+
+
 # Registers these models with custom view in /admin route
 
 admin.site.register(Address, URLAdmin)
 admin.site.register(Image, ImageAdmin)
+admin.site.register(ScrapeJob, ScrapeJobAdmin)
+admin.site.register(SyncRun, SyncRunAdmin)
+admin.site.register(Rendition, RenditionAdmin)
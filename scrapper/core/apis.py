@@ -1,34 +1,91 @@
+from typing import Optional
+
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.urls import reverse
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import (
     CreateAPIView,
     GenericAPIView,
+    RetrieveAPIView,
     RetrieveDestroyAPIView,
 )
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from scrapper.core.models import Image
+from scrapper.core import metrics
+from scrapper.core.models import Image, ScrapeJob
+from scrapper.core.pagination import KeysetPagination
 from scrapper.core.permissions import CanDeleteOrGet, IsAdminOrStaff
 from scrapper.core.serializers import (
     ImageOriginalURLQuerySerializer,
+    ImagePageSerializer,
+    ImageRowSerializer,
+    ImageSearchSerializer,
     ImageSerializer,
+    ScrapeJobSerializer,
+    SitemapIngestSerializer,
     URLBaseSerializer,
     URLCreateSerializer,
     URLDeleteAndRecreateSerializer,
 )
+from scrapper.core.tasks import ingest_sitemap, scrape_url
 
 
-class URLImageScrappingAPI(GenericAPIView):
+class ImagePageMixin:
+    """
+    Paginates image querysets with the keyset pagination,
+    the parent url is joined in the same query and the rows are
+    serialized by the read only `ImageRowSerializer`
+
+    Attributes:
+        `next_view_name`: View the next page link points to, the views
+                          scrapping the url link to the stored image list
+                          so following the link does not scrape again
+
+    """
+
+    pagination_class = KeysetPagination
+    next_view_name: Optional[str] = None
+
+    def get_image_page(self, queryset: QuerySet) -> Response:
+        """
+        Args:
+            queryset: Image Queryset
+
+        Returns: Response, one page of serialized images
+
+        """
+        if self.next_view_name:
+            query = self.request.GET.urlencode()
+            self.paginator.next_url = self.request.build_absolute_uri(
+                reverse(self.next_view_name) + (f"?{query}" if query else "")
+            )
+        page = self.paginate_queryset(ImageRowSerializer.values(queryset))
+        data = ImageRowSerializer(self.request).serialize(page)
+        return self.get_paginated_response(data)
+
+
+class URLImageScrappingAPI(ImagePageMixin, GenericAPIView):
     """
     This view takes URL Parameter, scrapes images from the given URL
     and stores images along with meta data in the database
+    With `mode` set to `job`, the scrapping is enqueued as a background
+    ScrapeJob and the job is returned right away
+    Images are paginated, the `next` link points to the image list API
+    and must be sent with the same payload
     """
 
     serializer_class = URLCreateSerializer
+    next_view_name = "image-list-view"
 
     @swagger_auto_schema(
-        responses={200: ImageSerializer(many=True)},
+        responses={
+            200: ImagePageSerializer(),
+            202: ScrapeJobSerializer(),
+        },
     )
     def post(self, request) -> Response:
         """
@@ -41,13 +98,30 @@ class URLImageScrappingAPI(GenericAPIView):
         """
         url = self.serializer_class(data=request.data)
         if url.is_valid():
-            queryset = url.save()
-            serializer = ImageSerializer(
-                instance=queryset, many=True, context={"request": request}
-            )
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            if url.validated_data.get("mode") == URLCreateSerializer.MODE_JOB:
+                return self.enqueue_job(url, request)
+            return self.get_image_page(url.save())
         return Response(url.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def enqueue_job(url: URLCreateSerializer, request) -> Response:
+        """
+        Creates a ScrapeJob and sends it to the Celery worker
+        Args:
+            url: Validated URLCreateSerializer
+            request: HttpRequest
+
+        Returns: Response, 202 with the pending job
+
+        """
+        job = url.create_job()
+        scrape_url.delay(str(job.pk))
+        job.refresh_from_db()
+        serializer = ScrapeJobSerializer(
+            instance=job, context={"request": request}
+        )
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
 
 class URLImagesDeleteScrapeAPI(URLImageScrappingAPI):
     """
@@ -79,10 +153,10 @@ class ImageDetailsAPI(RetrieveDestroyAPIView):
     permission_classes = (CanDeleteOrGet,)
     lookup_field = "id"
     serializer_class = ImageSerializer
-    queryset = Image.objects.get_queryset()
+    queryset = Image.objects.select_related("parent_url")
 
 
-class ImageOriginalURLQueryAPI(APIView):
+class ImageOriginalURLQueryAPI(ImagePageMixin, GenericAPIView):
     """
     Performs query by `original_url` of the image,
     returns Image Data along with Metadata
@@ -91,7 +165,7 @@ class ImageOriginalURLQueryAPI(APIView):
     serializer_class = ImageOriginalURLQuerySerializer
 
     @swagger_auto_schema(
-        responses={200: ImageSerializer(many=True)},
+        responses={200: ImagePageSerializer()},
     )
     def post(self, request):
         """
@@ -103,6 +177,109 @@ class ImageOriginalURLQueryAPI(APIView):
         """
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            image = ImageSerializer(instance=serializer.save())
-            return Response(image.data, status=status.HTTP_200_OK)
+            return self.get_image_page(serializer.save())
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ImageSearchAPI(ImagePageMixin, GenericAPIView):
+    """
+    Searches the stored images by their metadata, with range filters over
+    the dimensions, aspect ratio, file size and creation time,
+    the results are sorted by `sort` and paginated on (sort, id)
+    """
+
+    serializer_class = ImageSearchSerializer
+    ordering = None
+
+    @property
+    def paginator(self) -> KeysetPagination:
+        if not hasattr(self, "_paginator"):
+            self._paginator = self.pagination_class(ordering=self.ordering)
+        return self._paginator
+
+    @swagger_auto_schema(
+        query_serializer=ImageSearchSerializer,
+        responses={200: ImagePageSerializer()},
+    )
+    def get(self, request) -> Response:
+        """
+        Args:
+            request: HttpRequest
+
+        Returns: Response
+
+        """
+        serializer = self.serializer_class(data=request.query_params)
+        if serializer.is_valid():
+            self.ordering = serializer.get_ordering()
+            return self.get_image_page(serializer.search())
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ScrapeJobDetailAPI(RetrieveAPIView):
+    """
+    Returns the progress of a background ScrapeJob,
+    including the image list once the job has succeeded
+    """
+
+    serializer_class = ScrapeJobSerializer
+    queryset = ScrapeJob.objects.select_related("address")
+
+
+class SitemapIngestAPI(GenericAPIView):
+    """
+    Reads a sitemap, sitemap index or gzipped sitemap in a Celery worker,
+    stores every page of the site as an Address and enqueues
+    a ScrapeJob per page, Allow Only Admin Users and Staff Users
+    """
+
+    permission_classes = (IsAdminOrStaff,)
+    serializer_class = SitemapIngestSerializer
+
+    def post(self, request) -> Response:
+        """
+
+        Args:
+            request: HttpRequest
+
+        Returns: Response, 202 with the Celery task ID of the ingest
+
+        """
+        serializer = self.serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        data = serializer.validated_data
+        result = ingest_sitemap.delay(
+            data["url"], scrape=data["scrape"], limit=data.get("limit")
+        )
+        return Response(
+            {**serializer.data, "task_id": result.id},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class MetricsAPI(APIView):
+    """
+    Exposes the pipeline and image view metrics of every process
+    in the Prometheus text format, Allow Only Admin Users and Staff Users
+    """
+
+    permission_classes = (IsAdminOrStaff,)
+    swagger_schema = None
+
+    def get(self, request) -> HttpResponse:
+        """
+        Args:
+            request: HttpRequest
+
+        Returns: HttpResponse, 404 if `SCRAPPER_METRICS` is disabled
+
+        """
+        if not metrics.enabled():
+            raise NotFound("Metrics are disabled")
+        return HttpResponse(
+            metrics.REGISTRY.expose(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -0,0 +1,221 @@
+"""
+End to end benchmark of the scrapping pipeline against a local origin,
+and comparison of benchmark results with a stored baseline
+"""
+
+import math
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from django.test import RequestFactory
+from rest_framework.test import APIRequestFactory
+
+from scrapper.core.apis import ImageListAPI
+from scrapper.core.benchmarks.origin import OriginServer
+from scrapper.core.models import Address, Image
+from scrapper.core.renditions import get_rendition_cache
+from scrapper.core.views import ImageView
+
+# Metrics compared with the baseline, the other values identify a result
+LOWER_IS_BETTER = {
+    "seconds",
+    "cpu_seconds_per_image",
+    "p50_ms",
+    "p95_ms",
+    "peak_rss_mb",
+}
+HIGHER_IS_BETTER = {"images_per_second", "rows_per_second", "mb_per_second"}
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Args:
+        values: Measured values
+        q: Percentile between 0 and 100
+
+    Returns: float, nearest rank percentile, 0 if there are no values
+
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def latency_result(stage: str, timings: List[float]) -> dict:
+    """
+    Args:
+        stage: Benchmark stage name
+        timings: Request durations in seconds
+
+    Returns: dict, latency percentiles of the stage
+
+    """
+    return {
+        "stage": stage,
+        "requests": len(timings),
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+    }
+
+
+def timed(call) -> float:
+    start = time.perf_counter()
+    response = call()
+    # Streamed responses are read, the transfer is part of the latency
+    if getattr(response, "streaming", False):
+        for _ in response.streaming_content:
+            pass
+    if response.status_code >= 400:
+        raise RuntimeError(f"Request failed with {response.status_code}")
+    return time.perf_counter() - start
+
+
+def run_pipeline(
+    pages: int = 2,
+    images: int = 20,
+    sizes: Iterable[Tuple[int, int]] = ((1920, 1080), (640, 480)),
+    formats: Iterable[str] = ("jpeg", "png", "webp"),
+    latency: float = 0.0,
+    renditions: int = 20,
+    page_size: int = 10,
+) -> List[dict]:
+    """
+    Scrapes a local origin then measures the image view and the list
+    endpoint on the stored images. Writes to the database and the media
+    storage, the caller runs it in a rolled back transaction
+    with a temporary `MEDIA_ROOT`
+    Args:
+        pages: Number of scrapped pages
+        images: Number of images per page
+        sizes: Image sizes of the origin, (width, height) in px
+        formats: Image formats of the origin
+        latency: Injected delay of every origin response in seconds
+        renditions: Number of images requested from the image view
+        page_size: Page size of the list endpoint
+
+    Returns: List of dictionary, one result per stage
+
+    """
+    results = []
+    with OriginServer(images, sizes, formats, latency) as origin:
+        # Scrape throughput and ingest CPU
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        for page in range(pages):
+            Address.save_url_with_images(origin.page_url(page))
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        stored = Image.objects.filter(
+            parent_url__url__startswith=origin.base_url
+        ).count()
+        results.append(
+            {
+                "stage": "scrape",
+                "pages": pages,
+                "images": stored,
+                "latency": latency,
+                "seconds": wall,
+                "images_per_second": stored / wall if wall else 0.0,
+                "cpu_seconds_per_image": cpu / stored if stored else 0.0,
+            }
+        )
+        page_urls = [origin.page_url(page) for page in range(pages)]
+    image_ids = list(
+        Image.objects.filter(parent_url__url__in=page_urls)
+        .order_by("id")
+        .values_list("id", flat=True)[:renditions]
+    )
+    factory = RequestFactory()
+    view = ImageView.as_view()
+
+    def get_image(pk: int, **params):
+        return timed(lambda: view(factory.get(f"/image/{pk}", params), pk=pk))
+
+    # Starts the transcoding processes before measuring
+    if image_ids:
+        get_image(image_ids[0], width=8, format="png")
+    get_rendition_cache().clear()
+    for stage, params in (
+        ("original", {}),
+        ("rendition_cold", {"width": "small", "format": "webp"}),
+        ("rendition_warm", {"width": "small", "format": "webp"}),
+    ):
+        results.append(
+            latency_result(
+                stage, [get_image(pk, **params) for pk in image_ids]
+            )
+        )
+    # List endpoint, every page of every scrapped url
+    api_factory = APIRequestFactory()
+    list_view = ImageListAPI.as_view()
+    timings = []
+    for page_url in page_urls:
+        cursor: Optional[str] = ""
+        while cursor is not None:
+            query = f"?page_size={page_size}&cursor={cursor}"
+            request = api_factory.post(
+                f"/api/images/list/{query}", {"url": page_url}, format="json"
+            )
+            start = time.perf_counter()
+            response = list_view(request)
+            response.render()
+            timings.append(time.perf_counter() - start)
+            cursor = response.data["cursor"]
+    results.append(latency_result("list", timings))
+    return results
+
+
+def result_key(result: dict) -> tuple:
+    """
+    Args:
+        result: Benchmark result
+
+    Returns: tuple, values identifying the result, without the metrics
+
+    """
+    return tuple(
+        (name, value)
+        for name, value in sorted(result.items())
+        if name not in LOWER_IS_BETTER
+        and name not in HIGHER_IS_BETTER
+        and not isinstance(value, float)
+    )
+
+
+def compare(
+    results: List[dict], baseline: List[dict], tolerance: float = 0.2
+) -> List[str]:
+    """
+    Compares benchmark results with a baseline, results are matched on
+    their identifying values, e.g. stage, engine or fixture
+    Args:
+        results: Current results
+        baseline: Stored results of the same suite
+        tolerance: Allowed relative slowdown, 0.2 allows 20%
+
+    Returns: List[str], description of every regression
+
+    """
+    baseline_by_key = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline_by_key.get(result_key(result))
+        if reference is None:
+            continue
+        label = ", ".join(
+            f"{name}={value}" for name, value in result_key(result)
+        )
+        for metric, value in result.items():
+            base = reference.get(metric)
+            if not isinstance(base, (int, float)) or not base or value is None:
+                continue
+            if metric in LOWER_IS_BETTER and value > base * (1 + tolerance):
+                regressions.append(
+                    f"{label}: {metric} {value:.4f} > baseline {base:.4f}"
+                )
+            elif metric in HIGHER_IS_BETTER and value < base * (1 - tolerance):
+                regressions.append(
+                    f"{label}: {metric} {value:.4f} < baseline {base:.4f}"
+                )
+    return regressions
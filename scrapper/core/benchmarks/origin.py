@@ -0,0 +1,274 @@
+"""
+Local HTTP origin serving generated gallery pages, used by the offline
+benchmarks and tests instead of remote websites
+"""
+
+import gzip
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Iterable, List, Optional, Tuple
+
+from PIL import Image as PilImage
+
+PAGE_RE = re.compile(r"^/gallery/(\d+)$")
+IMAGE_RE = re.compile(r"^/images/(\d+)\.(\w+)$")
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+@lru_cache(maxsize=64)
+def generate_image(size: Tuple[int, int], img_format: str) -> bytes:
+    """
+    Encodes a gradient image, cached as every image of the same
+    size and format has the same content
+    Args:
+        size: (width, height) in px
+        img_format: Pillow format name, Example: 'JPEG', 'WEBP'
+
+    Returns: bytes, encoded image
+
+    """
+    gradient = PilImage.linear_gradient("L").resize(size)
+    pil_image = PilImage.merge(
+        "RGB",
+        (
+            gradient,
+            gradient.transpose(PilImage.Transpose.ROTATE_180),
+            gradient,
+        ),
+    )
+    file_bytes = BytesIO()
+    pil_image.save(file_bytes, img_format)
+    return file_bytes.getvalue()
+
+
+class OriginServer:
+    """
+    Serves `/gallery/<page>` documents of `images` image tags each,
+    the images cycle through the given sizes and formats.
+    Every response is delayed by `latency` seconds to simulate
+    a remote website, connections are kept alive.
+    `/sitemap.xml` is a sitemap index of the gzipped sitemap of the pages
+
+    Attributes:
+        `images`: Number of images per page
+        `sizes`: Image sizes, (width, height) in px
+        `formats`: Image formats, Example: 'jpeg', 'png', 'webp'
+        `latency`: Injected delay of every response in seconds
+        `robots`: robots.txt content, 404 when empty
+        `throttle`: Number of requests answered with
+                    `429 Too Many Requests` before serving normally
+        `pages`: Number of linked pages, every page links to the next one,
+                 to the first one and to an external website
+
+    """
+
+    def __init__(
+        self,
+        images: int = 20,
+        sizes: Iterable[Tuple[int, int]] = ((640, 480),),
+        formats: Iterable[str] = ("jpeg",),
+        latency: float = 0.0,
+        robots: str = "",
+        throttle: int = 0,
+        pages: int = 1,
+    ):
+        self.images = images
+        self.sizes: List[Tuple[int, int]] = list(sizes)
+        self.formats: List[str] = [
+            img_format.lower() for img_format in formats
+        ]
+        self.latency = latency
+        self.robots = robots
+        self.throttle = throttle
+        self.pages = pages
+        self.requests = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def page_url(self, page: int = 0) -> str:
+        """
+        Args:
+            page: Page number
+
+        Returns: str, absolute url of the page
+
+        """
+        return f"{self.base_url}/gallery/{page}"
+
+    def sitemap_url(self) -> str:
+        """
+
+        Returns: str, absolute url of the sitemap index
+
+        """
+        return f"{self.base_url}/sitemap.xml"
+
+    def render_sitemap(self, index: bool) -> bytes:
+        """
+        Args:
+            index: Renders the sitemap index instead of the page sitemap
+
+        Returns: bytes, sitemap index or gzipped sitemap, both list
+                 an url of an external website
+
+        """
+        if index:
+            entries = (
+                f"<sitemap><loc>{self.base_url}/sitemap-pages.xml.gz</loc>"
+                "</sitemap><sitemap>"
+                "<loc>https://external.example.com/sitemap.xml</loc>"
+                "</sitemap>"
+            )
+            return (
+                f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<sitemapindex xmlns="{SITEMAP_NS}">{entries}</sitemapindex>'
+            ).encode()
+        entries = "".join(
+            f"<url><loc>{self.page_url(page)}</loc></url>"
+            for page in range(self.pages)
+        )
+        return gzip.compress(
+            (
+                f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<urlset xmlns="{SITEMAP_NS}">{entries}'
+                "<url><loc>https://external.example.com/</loc></url>"
+                "</urlset>"
+            ).encode()
+        )
+
+    def image_url(self, index: int) -> str:
+        """
+        Args:
+            index: Image number
+
+        Returns: str, absolute url of the image
+
+        """
+        img_format = self.formats[index % len(self.formats)]
+        return f"{self.base_url}/images/{index}.{img_format}"
+
+    def image_size(self, index: int) -> Tuple[int, int]:
+        return self.sizes[(index // len(self.formats)) % len(self.sizes)]
+
+    def render_page(self, page: int) -> bytes:
+        """
+        Args:
+            page: Page number
+
+        Returns: bytes, HTML document of the page
+
+        """
+        first = page * self.images
+        tags = "".join(
+            f'<div class="card"><img alt="image {index}" '
+            f'src="{self.image_url(index)}"/></div>'
+            for index in range(first, first + self.images)
+        )
+        if page + 1 < self.pages:
+            tags += (
+                f'<a href="/gallery/{page + 1}">Next</a>'
+                f'<a href="/gallery/0#top">First</a>'
+                f'<a href="https://external.example.com/">Partner</a>'
+            )
+        return (
+            f"<!DOCTYPE html><html><head><title>Gallery {page}</title>"
+            f"</head><body>{tags}</body></html>"
+        ).encode()
+
+    def render_image(self, index: int, img_format: str) -> bytes:
+        """
+        Args:
+            index: Image number
+            img_format: Image format, the url extension
+
+        Returns: bytes, encoded image
+
+        """
+        return generate_image(self.image_size(index), img_format.upper())
+
+    def handle(self, path: str) -> Tuple[int, str, bytes]:
+        """
+        Args:
+            path: Request path
+
+        Returns: (status, content type, body)
+
+        """
+        path = path.split("?", 1)[0]
+        if path == "/robots.txt":
+            if self.robots:
+                return 200, "text/plain", self.robots.encode()
+            return 404, "text/plain", b"Not Found"
+        if self.throttle > 0:
+            self.throttle -= 1
+            return 429, "text/plain", b"Too Many Requests"
+        if path == "/sitemap.xml":
+            return 200, "application/xml", self.render_sitemap(index=True)
+        if path == "/sitemap-pages.xml.gz":
+            return 200, "application/gzip", self.render_sitemap(index=False)
+        page = PAGE_RE.match(path)
+        if page:
+            return 200, "text/html", self.render_page(int(page.group(1)))
+        image = IMAGE_RE.match(path)
+        if image and image.group(2) in self.formats:
+            return (
+                200,
+                f"image/{image.group(2)}",
+                self.render_image(int(image.group(1)), image.group(2)),
+            )
+        return 404, "text/plain", b"Not Found"
+
+    def start(self) -> "OriginServer":
+        """
+        Starts serving on a free local port in a background thread
+        """
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                origin.requests += 1
+                if origin.latency:
+                    time.sleep(origin.latency)
+                status, content_type, body = origin.handle(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "OriginServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
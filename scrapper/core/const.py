@@ -1 +1,4 @@
 SUPPORTED_FORMATS = ["gif", "png", "jpeg", "jpg", "bmp", "webp"]
+
+# Image view size presets, refers to the image width
+RENDITION_PRESETS = {"small": 256, "medium": 1024, "large": 2048}
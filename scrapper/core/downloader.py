@@ -0,0 +1,78 @@
+"""
+Bounded concurrency download stage used by the scrapping pipeline
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, TypeVar
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+T = TypeVar("T")
+
+
+class ImageDownloader:
+    """
+    Runs a fetch function over a list of URLs using a thread pool.
+    The number of requests in flight is bounded globally by the pool size
+    and per origin host by a semaphore, so a single CDN host is not flooded.
+    Results are yielded in the same order as the given URLs, so the caller
+    can persist them in its own thread while the rest are still downloading
+
+    Attributes:
+        `max_workers`: Global limit of concurrent downloads
+        `per_host`: Limit of concurrent downloads against a single host
+
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        per_host: Optional[int] = None,
+    ):
+        self.max_workers = max_workers or settings.SCRAPPER_DOWNLOAD_WORKERS
+        self.per_host = per_host or settings.SCRAPPER_DOWNLOAD_PER_HOST
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def host_limit(self, url: str) -> threading.BoundedSemaphore:
+        """
+        Returns the semaphore guarding the host of the given url
+        Args:
+            url: URL String
+
+        Returns: threading.BoundedSemaphore
+
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(
+                    self.per_host
+                )
+            return self._host_limits[host]
+
+    def _run(self, fetch: Callable[[str], T], url: str) -> T:
+        with self.host_limit(url):
+            return fetch(url)
+
+    def download(
+        self, urls: Iterable[str], fetch: Callable[[str], T]
+    ) -> Iterator[T]:
+        """
+        Calls `fetch` for every url concurrently
+        Args:
+            urls: List of URL to download
+            fetch: Callable that downloads and decodes a single url,
+                   must not touch the database
+
+        Returns: Iterator of `fetch` results, ordered as `urls`
+
+        """
+        urls = list(urls)
+        if not urls:
+            return
+        workers = min(self.max_workers, len(urls))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(lambda u: self._run(fetch, u), urls)
@@ -0,0 +1,151 @@
+"""
+Pooled keep-alive HTTP client shared by the scrapping code
+"""
+
+import threading
+from typing import Dict, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from scrapper.core.politeness import get_scheduler, parse_retry_after
+
+# Responses asking the client to slow down
+THROTTLE_STATUS = (429, 503)
+
+
+class ScrapperHTTPClient:
+    """
+    Wraps a `requests.Session` mounted with a pooling adapter.
+    Connections are kept alive and reused per host, every request
+    has a connect and read timeout, responses are compressed when
+    the origin supports it.
+
+    Attributes:
+        `session`: Shared requests session
+        `timeout`: (connect timeout, read timeout) in seconds
+
+    """
+
+    def __init__(
+        self,
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        user_agent: Optional[str] = None,
+    ):
+        self.timeout = (
+            connect_timeout or settings.SCRAPPER_HTTP_CONNECT_TIMEOUT,
+            read_timeout or settings.SCRAPPER_HTTP_READ_TIMEOUT,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=(
+                pool_connections or settings.SCRAPPER_HTTP_POOL_CONNECTIONS
+            ),
+            pool_maxsize=pool_maxsize or settings.SCRAPPER_HTTP_POOL_MAXSIZE,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.session.headers.update(
+            {
+                "User-Agent": user_agent or settings.SCRAPPER_USER_AGENT,
+                "Accept-Encoding": "gzip, deflate",
+                "Connection": "keep-alive",
+            }
+        )
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a GET request through the pooled session, when
+        `SCRAPPER_POLITENESS` is enabled the request waits for the
+        per host limits of the PolitenessScheduler. A 429 response, or a
+        503 with Retry-After, backs off the host and the request is sent
+        again up to `SCRAPPER_THROTTLE_RETRIES` times
+        Args:
+            url: URL String
+            **kwargs: Extra arguments passed to `requests.Session.get`
+
+        Returns: requests.Response
+
+        Raises:
+            HostThrottled if the host can not be requested in time
+            RobotsDisallowed if robots.txt disallows the url
+
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        if not settings.SCRAPPER_POLITENESS:
+            return self.session.get(url, **kwargs)
+        scheduler = get_scheduler()
+        robots_get = lambda robots_url: self.session.get(  # noqa: E731
+            robots_url, timeout=self.timeout
+        )
+        for attempt in range(settings.SCRAPPER_THROTTLE_RETRIES + 1):
+            with scheduler.request(url, robots_get):
+                response = self.session.get(url, **kwargs)
+            retry_after = response.headers.get("Retry-After")
+            if response.status_code not in THROTTLE_STATUS or (
+                response.status_code == 503 and not retry_after
+            ):
+                break
+            delay = parse_retry_after(
+                retry_after, settings.SCRAPPER_THROTTLE_BACKOFF
+            )
+            scheduler.backoff(url, delay)
+            if delay > scheduler.max_wait:
+                break
+        return response
+
+    def pool_stats(self) -> Dict[str, dict]:
+        """
+        Connection reuse statistics of the live host pools
+        Returns: Dictionary keyed by host containing number of requests,
+                 number of opened connections and the pool hit rate
+
+        """
+        stats = {}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_sent = pool.num_requests
+            hit_rate = (
+                1 - pool.num_connections / requests_sent
+                if requests_sent
+                else 0.0
+            )
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "requests": requests_sent,
+                "connections": pool.num_connections,
+                "hit_rate": round(max(hit_rate, 0.0), 4),
+            }
+        return stats
+
+    def close(self):
+        """
+        Closes every pooled connection
+        """
+        self.session.close()
+
+
+_client: Optional[ScrapperHTTPClient] = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> ScrapperHTTPClient:
+    """
+    Returns the process wide HTTP client, creates it on first use
+    so every forked worker gets its own connection pools
+
+    Returns: ScrapperHTTPClient
+
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ScrapperHTTPClient()
+    return _client
@@ -0,0 +1,229 @@
+"""
+Benchmark command
+"""
+
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from scrapper.core import benchmarks, parsers, resize, serializers
+from scrapper.core.models import Address, Image
+
+
+class Command(BaseCommand):
+    """
+    Runs a benchmark suite and prints the results,
+    Example: `python manage.py benchmark parsers --fixtures page.html`
+    """
+
+    help = "Runs a benchmark suite of the scrapping pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "suite",
+            choices=["parsers", "serializers", "resize", "pipeline"],
+        )
+        parser.add_argument(
+            "--fixtures",
+            nargs="*",
+            default=[],
+            help="Saved files to benchmark on, generated when omitted",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=2000,
+            help="Number of temporary image rows of the serializers suite",
+        )
+        parser.add_argument(
+            "--widths",
+            nargs="*",
+            type=int,
+            default=[256, 1024, 2048],
+            help="Output widths of the resize suite",
+        )
+        parser.add_argument(
+            "--presets",
+            nargs="*",
+            choices=list(resize.PRESETS),
+            help="Presets of the resize suite, all when omitted",
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=2,
+            help="Number of origin pages scrapped by the pipeline suite",
+        )
+        parser.add_argument(
+            "--images",
+            type=int,
+            default=20,
+            help="Number of images per origin page of the pipeline suite",
+        )
+        parser.add_argument(
+            "--sizes",
+            nargs="*",
+            default=["1920x1080", "640x480"],
+            help="Origin image sizes of the pipeline suite, WIDTHxHEIGHT",
+        )
+        parser.add_argument(
+            "--formats",
+            nargs="*",
+            default=["jpeg", "png", "webp"],
+            help="Origin image formats of the pipeline suite",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="Delay of every origin response in seconds",
+        )
+        parser.add_argument(
+            "--host-rate",
+            type=float,
+            default=0.0,
+            help="Per host request rate of the pipeline suite, 0 for none",
+        )
+        parser.add_argument(
+            "--output", help="Writes the results as JSON to this file"
+        )
+        parser.add_argument(
+            "--baseline",
+            help="JSON results of a previous run, fails on regressions",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed relative slowdown against the baseline",
+        )
+
+    def handle(self, *args, **options):
+        results = getattr(self, f"run_{options['suite']}")(options)
+        for result in results:
+            self.stdout.write(
+                "  ".join(
+                    f"{key}={self.format(v)}" for key, v in result.items()
+                )
+            )
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2))
+        if options["baseline"]:
+            baseline = json.loads(Path(options["baseline"]).read_text())
+            regressions = benchmarks.compare(
+                results, baseline, options["tolerance"]
+            )
+            if regressions:
+                raise CommandError(
+                    "Regressions against the baseline:\n"
+                    + "\n".join(regressions)
+                )
+            self.stdout.write("No regression against the baseline")
+
+    @staticmethod
+    def format(value) -> str:
+        return f"{value:.4f}" if isinstance(value, float) else str(value)
+
+    @staticmethod
+    def run_parsers(options) -> list:
+        """
+        Compares the HTML image extraction engines
+        """
+        documents = [
+            Path(path).read_text(errors="ignore")
+            for path in options["fixtures"]
+        ] or [
+            parsers.generate_document(images=500),
+            parsers.generate_document(images=5000),
+        ]
+        return parsers.benchmark(documents, repeat=options["repeat"])
+
+    @staticmethod
+    def run_serializers(options) -> list:
+        """
+        Compares the image serializers of the list endpoints,
+        the rows are created in a transaction that is rolled back
+        """
+        request = Request(APIRequestFactory().get("/api/images/list/"))
+        with transaction.atomic():
+            address = Address.objects.create(
+                url="https://benchmark.example.com/gallery"
+            )
+            Image.objects.bulk_create(
+                Image(
+                    parent_url=address,
+                    original_url=f"{address.url}/{i}.jpg",
+                    image=f"benchmark.example.com/{i}.jpg",
+                    image_name=f"{i}.jpg",
+                    height=768,
+                    width=1024,
+                    mode="RGB",
+                    format="JPEG",
+                )
+                for i in range(options["rows"])
+            )
+            results = serializers.benchmark(
+                Image.get_queryset_by_url(address),
+                request,
+                repeat=options["repeat"],
+            )
+            transaction.set_rollback(True)
+        return results
+
+    @staticmethod
+    def run_resize(options) -> list:
+        """
+        Compares the resize engine presets, every rendition is measured
+        in a fresh process to report its own peak memory
+        """
+        fixtures = {
+            Path(path).name: Path(path).read_bytes()
+            for path in options["fixtures"]
+        } or resize.generate_fixtures()
+        return resize.benchmark(
+            fixtures,
+            widths=options["widths"],
+            presets=options["presets"],
+            repeat=options["repeat"],
+        )
+
+    @staticmethod
+    def run_pipeline(options) -> list:
+        """
+        Scrapes a local origin and measures the image and list endpoints,
+        the rows are rolled back and the files are written to
+        a temporary media root
+        """
+        try:
+            sizes = [
+                tuple(int(side) for side in size.lower().split("x", 1))
+                for size in options["sizes"]
+            ]
+        except ValueError:
+            raise CommandError("Sizes must be given as WIDTHxHEIGHT")
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                SCRAPPER_PRECOMPUTE_RENDITIONS=False,
+                SCRAPPER_HOST_RATE=options["host_rate"],
+            ), transaction.atomic():
+                results = benchmarks.run_pipeline(
+                    pages=options["pages"],
+                    images=options["images"],
+                    sizes=sizes,
+                    formats=options["formats"],
+                    latency=options["latency"],
+                )
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        return results
@@ -0,0 +1,105 @@
+"""
+Explain Queries command
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from scrapper.core.models import Address, Image
+from scrapper.core.utils import hash_url
+
+
+class Command(BaseCommand):
+    """
+    Prints the database plan of the main queries of the project,
+    the sample values are read from the stored rows,
+    Example: `python manage.py explain_queries --analyze`
+    """
+
+    help = "Runs EXPLAIN on the main queries of the project"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "queries",
+            nargs="*",
+            help="Names of the queries to explain, all when omitted",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Executes the queries and reports the actual timings, "
+            "PostgreSQL only",
+        )
+
+    def handle(self, *args, **options):
+        queries = self.get_queries()
+        names = options["queries"] or list(queries)
+        unknown = set(names) - set(queries)
+        if unknown:
+            raise CommandError(
+                f"Unknown queries: {', '.join(sorted(unknown))}, "
+                f"choices are: {', '.join(queries)}"
+            )
+        explain_options = {}
+        if options["analyze"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("--analyze requires PostgreSQL")
+            explain_options = {"analyze": True, "buffers": True}
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queries[name].explain(**explain_options))
+            self.stdout.write("")
+
+    @staticmethod
+    def get_queries() -> dict:
+        """
+        Builds the main queries of the API, the scrapper and the sync
+
+        Returns: dict, queryset by query name
+
+        """
+        image = Image.objects.order_by("-id").first()
+        address = Address.objects.order_by("-id").first()
+        original_url = (
+            image.original_url if image else "https://example.com/a.png"
+        )
+        address_id = address.id if address else 0
+        page_size = settings.SCRAPPER_PAGE_SIZE
+        queries = {
+            "image_list": Image.objects.order_by("-created", "-id")[
+                :page_size
+            ],
+            "images_by_parent_url": Image.objects.filter(
+                parent_url_id=address_id
+            ).order_by("-created", "-id")[:page_size],
+            "image_by_original_url": Image.objects.filter(
+                original_url_hash=hash_url(original_url),
+                original_url=original_url,
+            ),
+            "known_image_urls": Image.objects.filter(
+                parent_url_id=address_id, original_url__in=[original_url]
+            ).values_list("original_url", flat=True),
+            "images_by_format": Image.objects.filter(
+                format=image.format if image else "JPEG"
+            ).order_by("-created", "-id")[:page_size],
+            "images_by_dimensions": Image.objects.filter(
+                width__gte=1024, width__lte=4096, height__gte=768
+            )[:page_size],
+            "images_by_domain": Image.objects.filter(
+                parent_url__domain=address.domain if address else "example.com"
+            ).order_by("-created", "-id")[:page_size],
+            "images_created_last_day": Image.objects.filter(
+                created__gte=timezone.now() - timedelta(days=1)
+            ).order_by("-created", "-id")[:page_size],
+            "address_by_url": Address.objects.filter(
+                url=address.url if address else "https://example.com"
+            ),
+            "sync_chunk": Address.objects.filter(pk__gt=0)
+            .order_by("pk")
+            .values_list("pk", flat=True)[: settings.SCRAPPER_SYNC_CHUNK_SIZE],
+        }
+        return queries
@@ -0,0 +1,58 @@
+"""
+Ingest Sitemap command
+"""
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from scrapper.core.sitemaps import ingest_sitemap
+
+
+class Command(BaseCommand):
+    """
+    Stores every page of a sitemap as an Address and enqueues their scrapes,
+    the sitemap is read in this process and the scrapes run in the workers,
+    Example: `python manage.py ingest_sitemap https://example.com/sitemap.xml`
+    """
+
+    help = "Stores the pages of a sitemap and enqueues their scrapes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "url", help="Sitemap, sitemap index or gzipped sitemap url"
+        )
+        parser.add_argument(
+            "--no-scrape",
+            action="store_true",
+            help="Only stores the addresses, no ScrapeJob is enqueued",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Maximum number of pages, SCRAPPER_SITEMAP_MAX_URLS by default",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Pages inserted and enqueued at a time, "
+            "SCRAPPER_SITEMAP_BATCH_SIZE by default",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            stats = ingest_sitemap(
+                options["url"],
+                scrape=not options["no_scrape"],
+                batch_size=options["batch_size"],
+                limit=options["limit"],
+            )
+        except ValidationError as e:
+            raise CommandError(" ".join(e.messages))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{stats['urls']} pages from {stats['sitemaps']} sitemaps "
+                f"({stats['errors']} unreadable), "
+                f"{stats['created']} new addresses, "
+                f"{stats['jobs']} scrapes enqueued"
+            )
+        )
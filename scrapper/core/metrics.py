@@ -0,0 +1,594 @@
+"""
+Counters and histograms of the scrapping pipeline and the image view,
+shared by the web and Celery processes through the Django cache and
+exported in the Prometheus text format
+"""
+
+import logging
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from celery.signals import task_postrun, worker_process_shutdown
+from django.conf import settings
+from django.core.cache import caches
+
+from scrapper.core.utils import get_domain
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "scrapper:metrics"
+
+# Prometheus client default buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+LabelValues = Tuple[str, ...]
+
+
+def enabled() -> bool:
+    """
+    Returns: bool, True if `SCRAPPER_METRICS` is enabled
+
+    """
+    return settings.SCRAPPER_METRICS
+
+
+def get_host(url: str) -> str:
+    """
+    Args:
+        url: Fetched url, may be malformed
+
+    Returns: str, host label of the url, empty if it can not be parsed
+
+    """
+    try:
+        return get_domain(url)
+    except (ValueError, IndexError):
+        return ""
+
+
+def escape_label(value) -> str:
+    return (
+        str(value)
+        .replace("\\", r"\\")
+        .replace('"', r"\"")
+        .replace("\n", r"\n")
+    )
+
+
+def format_labels(names: Tuple[str, ...], values: LabelValues, **extra) -> str:
+    """
+    Args:
+        names: Label names
+        values: Label values, same order as the names
+        **extra: Additional labels, Example: le="0.5"
+
+    Returns: str, Prometheus label set, empty if there are no labels
+
+    """
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs)
+        + "}"
+    )
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base class of the metrics, values are kept per label values
+
+    Attributes:
+        `name`: Metric name
+        `documentation`: HELP text
+        `labels`: Label names
+        `registry`: Registry notified of the updates
+
+    """
+
+    type = ""
+
+    def __init__(
+        self, name: str, documentation: str, labels: Tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.registry: Optional["Registry"] = None
+        self._lock = threading.Lock()
+
+    def label_values(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def changed(self):
+        if self.registry is not None:
+            self.registry.changed()
+
+    def snapshot(self) -> Dict[LabelValues, object]:
+        """
+        Returns: Dictionary, copy of the values of this process
+                 by label values
+
+        """
+        raise NotImplementedError
+
+    def merge(self, total: Dict[LabelValues, object], values: dict):
+        """
+        Adds the snapshot of a process to the total of every process
+        Args:
+            total: Merged values, updated in place
+            values: `snapshot()` of a process
+
+        """
+        raise NotImplementedError
+
+    def samples(self, values: dict) -> Iterator[Tuple[str, str, float]]:
+        """
+        Args:
+            values: Merged snapshots
+
+        Returns: Generator of (sample name, label set, value)
+
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def expose(self, values: Optional[dict] = None) -> List[str]:
+        """
+        Args:
+            values: Merged snapshots, defaults to the values of this process
+
+        Returns: List[str], lines of the metric in the text format
+
+        """
+        values = self.snapshot() if values is None else values
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines += [
+            f"{name}{labels} {format_value(value)}"
+            for name, labels, value in self.samples(values)
+        ]
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonic counter
+    """
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        """
+        Args:
+            amount: Increment
+            **labels: Label values
+
+        """
+        if not enabled():
+            return
+        key = self.label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.changed()
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self.label_values(labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, total, values):
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in values.items():
+            yield f"{self.name}_total", format_labels(self.labels, key), value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class CallbackCounter(Counter):
+    """
+    Counter maintained elsewhere in the process, read from a callback
+    when the values are shared
+
+    Attributes:
+        `collect`: Callable returning the value by label values
+
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...],
+        collect: Callable[[], Dict[LabelValues, float]],
+    ):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def snapshot(self):
+        return self.collect() if enabled() else {}
+
+    def reset(self):
+        pass
+
+
+class Histogram(Metric):
+    """
+    Cumulative histogram with fixed buckets
+
+    Attributes:
+        `buckets`: Upper bounds of the buckets, sorted
+
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Label values -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        """
+        Args:
+            value: Observed value, seconds for durations
+            **labels: Label values
+
+        """
+        if not enabled():
+            return
+        key = self.label_values(labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[i] += 1
+                    break
+            values[-2] += value
+            values[-1] += 1
+        self.changed()
+
+    def time(self, **labels: str):
+        """
+        Context manager observing the duration of its block,
+        does nothing when the metrics are disabled
+        Args:
+            **labels: Label values
+
+        Returns: Context manager
+
+        """
+        if not enabled():
+            return nullcontext()
+        return self._timer(labels)
+
+    @contextmanager
+    def _timer(self, labels: Dict[str, str]):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        values = self._values.get(self.label_values(labels))
+        return values[-1] if values else 0
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(value) for key, value in self._values.items()}
+
+    def merge(self, total, values):
+        for key, value in values.items():
+            merged = total.setdefault(key, [0] * len(value))
+            for i, count in enumerate(value):
+                merged[i] += count
+
+    def samples(self, values):
+        for key, value in values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, value):
+                cumulative += bucket
+                yield (
+                    f"{self.name}_bucket",
+                    format_labels(self.labels, key, le=format_value(bound)),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", format_labels(self.labels, key), value[
+                -2
+            ]
+            yield f"{self.name}_count", format_labels(self.labels, key), value[
+                -1
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsStore:
+    """
+    Shares the metrics of every web and Celery process through the
+    `SCRAPPER_METRICS_CACHE` cache. Every process saves a snapshot of its
+    cumulative values at most every `SCRAPPER_METRICS_FLUSH_INTERVAL`
+    seconds, after every Celery task and before exposing the metrics,
+    the exposition sums the snapshots of every process. A snapshot not
+    updated for `SCRAPPER_METRICS_TTL` seconds expires
+
+    Attributes:
+        `registry`: Registry of the shared metrics
+
+    """
+
+    def __init__(self, registry: "Registry"):
+        self.registry = registry
+        self.process_id: Optional[str] = None
+        self._flushed = 0.0
+
+    @property
+    def cache(self):
+        return caches[settings.SCRAPPER_METRICS_CACHE]
+
+    def forked(self):
+        """
+        A forked worker (gunicorn --preload, Celery prefork) starts with
+        its own empty snapshot
+        """
+        self.process_id = None
+        self._flushed = 0.0
+
+    def get_process_id(self) -> str:
+        if self.process_id is None:
+            self.process_id = (
+                f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            )
+        return self.process_id
+
+    processes_key = f"{KEY_PREFIX}:processes"
+
+    @staticmethod
+    def snapshot_key(process_id: str) -> str:
+        return f"{KEY_PREFIX}:process:{process_id}"
+
+    def save(self, process_id: str, snapshot: Dict[str, dict]):
+        """
+        Stores the snapshot of a process and adds the process to the index
+        Args:
+            process_id: Process ID
+            snapshot: `Registry.snapshot()` of the process
+
+        """
+        self.cache.set(
+            self.snapshot_key(process_id),
+            snapshot,
+            timeout=settings.SCRAPPER_METRICS_TTL,
+        )
+        processes = self.get_processes()
+        if process_id not in processes:
+            # Concurrent updates may drop an ID, it is added back
+            # by the next flush of the process
+            self.cache.set(self.processes_key, processes | {process_id}, None)
+
+    def get_processes(self) -> Set[str]:
+        return self.cache.get(self.processes_key) or set()
+
+    def flush(self):
+        """
+        Saves the snapshot of this process, a cache failure is logged,
+        the metrics never break a scrape or a request
+        """
+        self._flushed = time.monotonic()
+        try:
+            self.save(self.get_process_id(), self.registry.snapshot())
+        except Exception:
+            logger.warning("Metrics could not be saved", exc_info=True)
+
+    def maybe_flush(self):
+        interval = settings.SCRAPPER_METRICS_FLUSH_INTERVAL
+        if time.monotonic() - self._flushed >= interval:
+            self.flush()
+
+    def collect(self) -> Dict[str, dict]:
+        """
+        Returns: Dictionary, merged values of every process by metric name
+
+        """
+        self.flush()
+        processes = self.get_processes()
+        keys = {self.snapshot_key(process): process for process in processes}
+        snapshots = self.cache.get_many(list(keys))
+        expired = processes - {keys[key] for key in snapshots}
+        if expired:
+            self.cache.set(self.processes_key, processes - expired, None)
+        merged: Dict[str, dict] = {}
+        for snapshot in snapshots.values():
+            for name, values in snapshot.items():
+                metric = self.registry.metrics.get(name)
+                if metric is not None:
+                    metric.merge(merged.setdefault(name, {}), values)
+        return merged
+
+
+class Registry:
+    """
+    Ordered collection of the metrics, the values of every process are
+    shared through a MetricsStore
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.store = MetricsStore(self)
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        metric.registry = self
+        return metric
+
+    def changed(self):
+        self.store.maybe_flush()
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        Returns: Dictionary, values of this process by metric name
+
+        """
+        return {
+            name: metric.snapshot() for name, metric in self.metrics.items()
+        }
+
+    def expose(self) -> str:
+        """
+        Returns: str, every metric of every process in the
+                 Prometheus text format
+
+        """
+        merged = self.store.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines += metric.expose(merged.get(name, {}))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Clears the values of this process
+        """
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+def collect_pool_stats(field: str) -> Callable[[], Dict[LabelValues, float]]:
+    """
+    Args:
+        field: Key of `ScrapperHTTPClient.pool_stats()` per host
+
+    Returns: Callable reading the field for every live host pool
+
+    """
+
+    def collect() -> Dict[LabelValues, float]:
+        from scrapper.core.http_client import get_http_client
+
+        return {
+            (host,): stats[field]
+            for host, stats in get_http_client().pool_stats().items()
+        }
+
+    return collect
+
+
+REGISTRY = Registry()
+
+SCRAPE_STAGE_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "scrapper_scrape_stage_seconds",
+        "Duration of the scrapping pipeline stages",
+        ("stage",),
+    )
+)
+FETCHED_BYTES: Counter = REGISTRY.register(
+    Counter(
+        "scrapper_fetched_bytes",
+        "Bytes downloaded from the origins",
+        ("kind",),
+    )
+)
+FETCH_ERRORS: Counter = REGISTRY.register(
+    Counter(
+        "scrapper_fetch_errors",
+        "Failed page and image downloads",
+        ("host", "kind"),
+    )
+)
+IMAGE_VIEW_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "scrapper_image_view_seconds",
+        "Duration of the image view by response source",
+        ("source",),
+    )
+)
+RENDITION_CACHE: Counter = REGISTRY.register(
+    Counter(
+        "scrapper_rendition_cache",
+        "Rendition cache lookups, hit ratio is hit / (hit + miss)",
+        ("result",),
+    )
+)
+TRANSCODE_SECONDS: Histogram = REGISTRY.register(
+    Histogram(
+        "scrapper_transcode_seconds",
+        "Duration of the rendition transcodes",
+        ("format",),
+    )
+)
+HTTP_POOL_REQUESTS: CallbackCounter = REGISTRY.register(
+    CallbackCounter(
+        "scrapper_http_pool_requests",
+        "Requests sent through the pooled connections of a host",
+        ("host",),
+        collect_pool_stats("requests"),
+    )
+)
+HTTP_POOL_CONNECTIONS: CallbackCounter = REGISTRY.register(
+    CallbackCounter(
+        "scrapper_http_pool_connections",
+        "Connections opened to a host",
+        ("host",),
+        collect_pool_stats("connections"),
+    )
+)
+
+
+def reset_after_fork():
+    REGISTRY.reset()
+    REGISTRY.store.forked()
+
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+
+@task_postrun.connect
+@worker_process_shutdown.connect
+def flush_after_task(**kwargs):
+    """
+    Saves the metrics of a Celery worker after every task, a worker
+    may stay idle for long after its last task
+    """
+    if enabled():
+        REGISTRY.store.flush()
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:02
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import scrapper.core.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="address",
+            name="url",
+            field=models.URLField(
+                db_index=True,
+                unique=True,
+                validators=[scrapper.core.utils.validate_url],
+            ),
+        ),
+        migrations.CreateModel(
+            name="ScrapeJob",
+            fields=[
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("RUNNING", "Running"),
+                            ("SUCCESS", "Success"),
+                            ("FAILURE", "Failure"),
+                        ],
+                        default="PENDING",
+                        max_length=20,
+                    ),
+                ),
+                ("pages_fetched", models.PositiveIntegerField(default=0)),
+                ("images_saved", models.PositiveIntegerField(default=0)),
+                ("failures", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                (
+                    "address",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="core.address",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_scrapejob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("RUNNING", "Running"),
+                            ("SUCCESS", "Success"),
+                        ],
+                        default="RUNNING",
+                        max_length=20,
+                    ),
+                ),
+                ("last_address_id", models.BigIntegerField(default=0)),
+                ("chunk", models.PositiveIntegerField(default=0)),
+                ("chunk_last_address_id", models.BigIntegerField(default=0)),
+                ("pending", models.PositiveIntegerField(default=0)),
+                ("addresses_done", models.PositiveIntegerField(default=0)),
+                ("new_images", models.PositiveIntegerField(default=0)),
+                ("failures", models.PositiveIntegerField(default=0)),
+                ("address_seconds", models.FloatField(default=0)),
+                ("max_address_seconds", models.FloatField(default=0)),
+                ("finished", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:07
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models, transaction
+from django.db.models import Count, Min
+
+
+def remove_duplicate_images(apps, schema_editor):
+    """
+    Keeps the first stored image of every (parent_url, original_url) pair,
+    the files of the removed images are deleted once the migration commits
+    """
+    Image = apps.get_model("core", "Image")
+    duplicates = (
+        Image.objects.values("parent_url", "original_url")
+        .annotate(first_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    file_names = set()
+    for duplicate in duplicates.iterator():
+        removed = Image.objects.filter(
+            parent_url=duplicate["parent_url"],
+            original_url=duplicate["original_url"],
+        ).exclude(id=duplicate["first_id"])
+        file_names.update(removed.values_list("image", flat=True))
+        removed.delete()
+    # A file still referenced by a remaining image stays in the storage
+    file_names -= set(
+        Image.objects.filter(image__in=file_names).values_list(
+            "image", flat=True
+        )
+    )
+    file_names = [name for name in file_names if name]
+
+    def delete_files():
+        for name in file_names:
+            try:
+                default_storage.delete(name)
+            except FileNotFoundError:
+                pass
+
+    transaction.on_commit(delete_files, using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_syncrun"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_images, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name="image",
+            constraint=models.UniqueConstraint(
+                fields=("parent_url", "original_url"),
+                name="unique_image_per_parent_url",
+            ),
+        ),
+    ]
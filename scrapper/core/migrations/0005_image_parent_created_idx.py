@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_unique_image_per_parent_url"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["parent_url", "-created", "-id"],
+                name="image_parent_created_idx",
+            ),
+        ),
+    ]
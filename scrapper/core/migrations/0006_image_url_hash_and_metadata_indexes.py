@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:19
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_original_url_hash(apps, schema_editor):
+    """
+    Computes the url digest of the already stored images in batches
+    """
+    Image = apps.get_model("core", "Image")
+    batch = []
+    for image in (
+        Image.objects.filter(original_url_hash="")
+        .only("id", "original_url")
+        .iterator(chunk_size=2000)
+    ):
+        image.original_url_hash = hashlib.sha1(
+            image.original_url.encode()
+        ).hexdigest()
+        batch.append(image)
+        if len(batch) == 2000:
+            Image.objects.bulk_update(batch, ["original_url_hash"])
+            batch = []
+    Image.objects.bulk_update(batch, ["original_url_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_image_parent_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="original_url_hash",
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=40
+            ),
+        ),
+        migrations.RunPython(
+            fill_original_url_hash, migrations.RunPython.noop
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="original_url",
+            field=models.URLField(blank=True, max_length=2048),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["format", "-created", "-id"], name="image_format_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["width", "height"], name="image_dimensions_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["-created", "-id"], name="image_created_idx"
+            ),
+        ),
+    ]
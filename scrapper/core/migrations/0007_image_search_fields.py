@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:21
+
+from urllib.parse import urlparse
+
+from django.db import migrations, models
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+BATCH_SIZE = 2000
+
+
+def fill_search_fields(apps, schema_editor):
+    """
+    Computes the address domains, the image aspect ratios
+    and the stored file sizes of the existing rows
+    """
+    Address = apps.get_model("core", "Address")
+    Image = apps.get_model("core", "Image")
+    batch = []
+    for address in Address.objects.only("id", "url").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        address.domain = urlparse(address.url).hostname or ""
+        batch.append(address)
+        if len(batch) == BATCH_SIZE:
+            Address.objects.bulk_update(batch, ["domain"])
+            batch = []
+    Address.objects.bulk_update(batch, ["domain"])
+    Image.objects.filter(height__gt=0).update(
+        aspect_ratio=Cast(F("width"), FloatField())
+        / Cast(F("height"), FloatField())
+    )
+    batch = []
+    for image in Image.objects.only("id", "image").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        try:
+            image.file_size = image.image.size if image.image else 0
+        except OSError:
+            continue
+        batch.append(image)
+        if len(batch) == BATCH_SIZE:
+            Image.objects.bulk_update(batch, ["file_size"])
+            batch = []
+    Image.objects.bulk_update(batch, ["file_size"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_image_url_hash_and_metadata_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="domain",
+            field=models.CharField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="aspect_ratio",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="file_size",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="height",
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="width",
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.RunPython(fill_search_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(fields=["height"], name="image_height_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["aspect_ratio"], name="image_aspect_ratio_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(
+                fields=["file_size"], name="image_file_size_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(fields=["mode"], name="image_mode_idx"),
+        ),
+    ]
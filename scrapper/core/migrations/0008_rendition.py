@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import scrapper.core.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_image_search_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Rendition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                ("width", models.PositiveIntegerField()),
+                ("height", models.PositiveIntegerField()),
+                ("format", models.CharField(max_length=10)),
+                ("quality", models.PositiveSmallIntegerField(default=100)),
+                (
+                    "file",
+                    models.FileField(
+                        max_length=500,
+                        upload_to=scrapper.core.models.rendition_directory,
+                    ),
+                ),
+                ("file_size", models.PositiveIntegerField(default=0)),
+                (
+                    "image",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="renditions",
+                        to="core.image",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "image",
+                            "width",
+                            "height",
+                            "format",
+                            "quality",
+                        ),
+                        name="unique_rendition",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_rendition"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scrapejob",
+            name="max_depth",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="scrapejob",
+            name="max_pages",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="scrapejob",
+            name="same_domain",
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -1,23 +1,53 @@
+import logging
 import math
+import time
+import uuid
 from io import BytesIO
-from typing import Any, List, Optional
+from typing import Any, List, NamedTuple, Optional, Set, Tuple
 from urllib.parse import urlparse
 
 import PIL
 import requests
 import urllib3
-from bs4 import BeautifulSoup
-from django.core.cache import cache
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files import File
-from django.db import models
-from django.db.models import QuerySet
-from django.db.models.signals import post_delete, post_save
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 from PIL import Image as PilImage
 
-from scrapper.core.utils import check_if_valid_url, normalize_url, validate_url
+from scrapper.core.const import RENDITION_PRESETS
+from scrapper.core.downloader import ImageDownloader
+from scrapper.core.http_client import get_http_client
+from scrapper.core.metrics import (
+    FETCH_ERRORS,
+    FETCHED_BYTES,
+    SCRAPE_STAGE_SECONDS,
+    get_host,
+)
+from scrapper.core.parsers import ExtractedPage, extract_page
+from scrapper.core.politeness import HostThrottled, RobotsDisallowed
+from scrapper.core.renditions import (
+    RenditionKey,
+    get_rendition_cache,
+    get_rendition_pool,
+    render_renditions,
+)
+from scrapper.core.resize import resize
+from scrapper.core.utils import (
+    check_if_valid_url,
+    get_domain,
+    hash_url,
+    normalize_url,
+    validate_url,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class AbstractModel(models.Model):
@@ -56,6 +86,7 @@ class Address(AbstractModel):
 
     Attributes:
         `name`: The queried URL
+        `domain`: Host name of the url, indexed for the image search
 
     """
 
@@ -66,6 +97,7 @@ class Address(AbstractModel):
             validate_url,
         ],
     )
+    domain = models.CharField(max_length=255, blank=True, db_index=True)
     http_response = None
 
     @property
@@ -87,12 +119,15 @@ class Address(AbstractModel):
         return self.url
 
     @classmethod
-    def save_url_with_images(cls, url: str) -> QuerySet:
+    def save_url_with_images(
+        cls, url: str, job: Optional["ScrapeJob"] = None
+    ) -> QuerySet:
         """
         Given a URL, it saves the URL as Address Object
         and scrapes the url to store the images
         Args:
             url: URL to scrap the images from
+            job: Optional ScrapeJob to report the progress to
 
         Returns: QuerySet<Image>, scrapped and saved images
 
@@ -101,18 +136,61 @@ class Address(AbstractModel):
         # Otherwise create the url record
         url_object, created = cls.objects.get_or_create(url=url)
         # Image Saving Procedure
-        return Image.save_multiple_images(url_object)
+        return Image.save_multiple_images(url_object, job=job)
 
     @classmethod
-    def sync_url_images(cls):
+    def sync_address(cls, address_id: int) -> dict:
         """
-        Future Celery Background Task
-        It will sync images, check if there are new images
-        in the url, save them
+        Re-scrapes a single stored address and saves the new images
+        Args:
+            address_id: Address ID
+
+        Returns: Dictionary with the number of new images, the time spent
+                 and the error message if the address could not be scrapped
+
+        """
+        start = time.monotonic()
+        result = {"address": address_id, "new_images": 0, "error": ""}
+        address = cls.objects.filter(pk=address_id).first()
+        if address is None:
+            result["error"] = "Address does not exist"
+        else:
+            before = Image.get_queryset_by_url(address).count()
+            try:
+                images = Image.save_multiple_images(address)
+                result["new_images"] = images.count() - before
+            except ValidationError:
+                result["error"] = "URL Does not exist"
+            except Exception as e:
+                # Any failure is reported, a raised error would leave
+                # the chunk of the SyncRun pending forever
+                logger.exception("Sync of address %s failed", address_id)
+                result["error"] = str(e) or e.__class__.__name__
+        result["seconds"] = time.monotonic() - start
+        return result
+
+    @classmethod
+    def sync_url_images(cls) -> dict:
         """
-        addresses = cls.objects.all()
-        for address in addresses:
-            cls.save_url_with_images(address.url)
+        Syncs every stored address in the current process,
+        check if there are new images in the url, save them
+        Addresses are read chunk by chunk and the progress is checkpointed
+        in a SyncRun, the `sync_images` Celery task runs the same
+        procedure in parallel workers
+
+        Returns: Dictionary, SyncRun summary
+
+        """
+        run = SyncRun.objects.create()
+        while True:
+            address_ids = run.next_chunk()
+            if not address_ids:
+                break
+            chunk = run.start_chunk(address_ids)
+            for address_id in address_ids:
+                run.complete_address(chunk, cls.sync_address(address_id))
+        run.finish()
+        return run.summary()
 
     @classmethod
     def restore_or_create(cls, url) -> QuerySet:
@@ -149,6 +227,45 @@ def normalize_url_before_save(
     instance.url = normalize_url(instance.url)
 
 
+@receiver(pre_save, sender=Address)
+def set_address_domain(sender: Address, instance: Address, *args, **kwargs):
+    """
+    Stores the host name of the url, bulk inserts must set it themselves
+    Args:
+        sender: Address Model
+        instance: Address Model Instance
+        *args:
+        **kwargs:
+
+    """
+    instance.domain = get_domain(instance.url)
+
+
+class FetchedImage(NamedTuple):
+    """
+
+    Downloaded image waiting to be saved
+
+    Attributes:
+        `original_url`: Absolute url the image was downloaded from
+        `file_name`: Generated file name for the storage
+        `content`: Encoded image bytes
+        `height`: Image Height in px
+        `width`: Image width in px
+        `mode`: Image mode Metadata
+        `format`: Image file format
+
+    """
+
+    original_url: str
+    file_name: str
+    content: bytes
+    height: int
+    width: int
+    mode: str
+    format: str
+
+
 def image_directory(instance, filename) -> str:
     """
     Gets image directory name
@@ -170,10 +287,14 @@ class Image(AbstractModel):
 
     Attributes:
         `url`: Parent URL, Refers to Address Model
+        `original_url`: Absolute url the image was downloaded from
+        `original_url_hash`: SHA-1 digest of `original_url`, indexed
         `image`: Image instance scrapped from the url
         `image_name`: Image filename
         `height`: Image Height in px
         `width`: Image width in px
+        `aspect_ratio`: Width divided by height
+        `file_size`: Size of the stored file in bytes
         `mode`: Image mode Metadata, Example: 'RGB', 'CMYK'
         `format`: Image file format, Example: 'JPEG', 'GIF'
 
@@ -182,14 +303,57 @@ class Image(AbstractModel):
     parent_url = models.ForeignKey(
         to=Address, on_delete=models.SET_NULL, null=True
     )
-    original_url = models.URLField(blank=True)
+    original_url = models.URLField(max_length=2048, blank=True)
+    original_url_hash = models.CharField(
+        max_length=40, blank=True, editable=False, db_index=True
+    )
     image = models.ImageField(upload_to=image_directory, null=True, blank=True)
     image_name = models.CharField(max_length=500)
-    height = models.FloatField()
-    width = models.FloatField()
+    height = models.PositiveIntegerField()
+    width = models.PositiveIntegerField()
+    aspect_ratio = models.FloatField(default=0)
+    file_size = models.PositiveIntegerField(default=0)
     mode = models.CharField(max_length=100)
     format = models.CharField(max_length=100)
 
+    class Meta:
+        """
+
+        Meta class that contains meta data for this model
+        Attributes:
+            constraints: An image url is stored once per parent url,
+                         also indexes the known image lookup
+            indexes: Keyset pagination of the images of a parent url,
+                     and the metadata filters
+
+        """
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["parent_url", "original_url"],
+                name="unique_image_per_parent_url",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["parent_url", "-created", "-id"],
+                name="image_parent_created_idx",
+            ),
+            models.Index(
+                fields=["format", "-created", "-id"], name="image_format_idx"
+            ),
+            models.Index(
+                fields=["width", "height"], name="image_dimensions_idx"
+            ),
+            models.Index(fields=["height"], name="image_height_idx"),
+            models.Index(
+                fields=["aspect_ratio"], name="image_aspect_ratio_idx"
+            ),
+            models.Index(fields=["file_size"], name="image_file_size_idx"),
+            models.Index(fields=["mode"], name="image_mode_idx"),
+            models.Index(fields=["-created", "-id"], name="image_created_idx"),
+        ]
+
     @property
     def format_lower(self) -> str:
         """
@@ -207,42 +371,78 @@ class Image(AbstractModel):
         """
         return f"{self.image_name}"
 
-    def get_image_with_size(
+    def save(self, *args, **kwargs):
+        self.original_url_hash = hash_url(self.original_url)
+        self.aspect_ratio = self.get_aspect_ratio(self.width, self.height)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_aspect_ratio(width: int, height: int) -> float:
+        """
+        Args:
+            width: Image width in px
+            height: Image height in px
+
+        Returns: float, width divided by height, 0 for an empty image
+
+        """
+        return width / height if height else 0
+
+    def get_rendition_size(
         self,
         width: Optional[float] = None,
         height: Optional[float] = None,
-    ) -> Any:
+    ) -> Tuple[int, int]:
         """
-        Returns image with custom width or height
+        Returns the output size for a custom width or height
         If given both height or width then only width will work,
-        maintaining ratio
+        maintaining ratio, the image is never upscaled
 
         Args:
             height: Height of the image
             width: Width of the image
 
-        Returns:
+        Returns: (width, height) in px, at least 1px each
 
         """
-        pil_image = PilImage.open(self.image)
         size = (self.width, self.height)
         if width and width < self.width:
             _height = (width / self.width) * self.height
-            size = tuple(map(math.floor, [width, _height]))
+            size = (width, _height)
 
         elif height and height < self.height:
             _width = (height / self.height) * self.width
-            size = tuple(map(math.floor, [_width, height]))
+            size = (_width, height)
 
-        pil_image.thumbnail(size)
+        return tuple(max(math.floor(side), 1) for side in size)
 
-        return pil_image
+    def get_image_with_size(
+        self,
+        width: Optional[float] = None,
+        height: Optional[float] = None,
+    ) -> Any:
+        """
+        Returns image with custom width or height
+        If given both height or width then only width will work,
+        maintaining ratio
+
+        Args:
+            height: Height of the image
+            width: Width of the image
+
+        Returns:
+
+        """
+        return resize(
+            PilImage.open(self.image), self.get_rendition_size(width, height)
+        )
 
     @staticmethod
     def get_images_from_url_response(url: str) -> List[str]:
         """
         Given a URL, this method scraps through the document
-        using BS4 Module. Finds all <img/> tag and gets the source from it
+        using the configured extraction engine (`SCRAPPER_HTML_PARSER`).
+        Finds all <img/> tag and gets the source from it
         then returns the list of image source found from <img/> tag located in
         the document
         Args:
@@ -250,77 +450,318 @@ class Image(AbstractModel):
 
         Returns: List[str], Returns List of image url
 
+        """
+        return Image.fetch_page(url).images
+
+    @staticmethod
+    def fetch_page(url: str) -> ExtractedPage:
+        """
+        Fetches a document and extracts the sources of its <img/> tags
+        and the links of its <a/> tags
+        Args:
+            url: str
+
+        Returns: ExtractedPage
+
+        Raises:
+            ValidationError if the document can not be fetched
+
         """
         try:
-            resp = requests.get(url).text
-        except requests.exceptions.ConnectionError:
+            with SCRAPE_STAGE_SECONDS.time(stage="fetch_page"):
+                response = get_http_client().get(url)
+                resp = response.text
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ):
+            FETCH_ERRORS.inc(host=get_host(url), kind="page")
             raise ValidationError("Invalid URL")
-        # Parse HTML
-        soup = BeautifulSoup(resp, "html.parser")
-        # Find images from the HTML Doc
-        images = soup.find_all("img")
-        # Get Image source/url
-        img_list = [img["src"] for img in images]
-        return img_list
+        except HostThrottled as exc:
+            FETCH_ERRORS.inc(host=get_host(url), kind="page")
+            raise ValidationError(
+                f"The website is rate limiting us, retry in "
+                f"{math.ceil(exc.retry_after)} seconds"
+            )
+        except RobotsDisallowed:
+            FETCH_ERRORS.inc(host=get_host(url), kind="page")
+            raise ValidationError("The website disallows scrapping this URL")
+        FETCHED_BYTES.inc(len(response.content), kind="page")
+        # Parse HTML and get Image source/url
+        with SCRAPE_STAGE_SECONDS.time(stage="parse"):
+            return extract_page(resp)._replace(url=response.url)
 
-    @classmethod
-    def save_image(cls, image_url: str, url: Address):
+    @staticmethod
+    def resolve_image_url(image_url: str, url: Address) -> str:
         """
-        Saves Images from a given URL along with Metadata
+        Resolves the image source found in the document against the parent url
         Args:
-            image_url: Image Link
+            image_url: Image source, absolute or relative
             url: Parent Url Address
 
-        Returns:
+        Returns: str, absolute image url
 
         """
         if image_url.startswith("/"):
             image_url = image_url[1:]
-        img_url = (
+        return (
             image_url
             if check_if_valid_url(image_url)
             else f"{url.url}/{image_url}"
         )
+
+    @staticmethod
+    def fetch_image(img_url: str) -> Optional["FetchedImage"]:
+        """
+        Downloads an image and reads its metadata, does not access the
+        database so it is safe to run from the download worker threads
+        Only the image header is parsed, the downloaded bytes are stored
+        as they are unless `SCRAPPER_REENCODE_ON_INGEST` is enabled
+        Args:
+            img_url: Absolute image url
+
+        Returns: FetchedImage | None, None if the image could not be read
+
+        """
         try:
-            response = requests.get(img_url)
-            pillow_image = PilImage.open(BytesIO(response.content))
-            file_bytes = BytesIO()
-            file_name = (
-                f"{get_random_string(length=32)}."
-                f"{pillow_image.get_format_mimetype().split('/')[-1]}"
-            )
-            img_object = cls.objects.create(
-                parent_url=url,
-                image_name=file_name,
-                original_url=img_url,
-                height=pillow_image.height,
-                width=pillow_image.width,
-                mode=pillow_image.mode,
-                format=pillow_image.format,
-            )
-            pillow_image.save(file_bytes, pillow_image.format)
-            img_object.image.save(
-                file_name,
-                File(file_bytes),
-            )
-            img_object.save()
+            with SCRAPE_STAGE_SECONDS.time(stage="download"):
+                response = get_http_client().get(img_url)
+                content = response.content
+            FETCHED_BYTES.inc(len(content), kind="image")
+            with SCRAPE_STAGE_SECONDS.time(stage="decode"):
+                # Lazy open, reads the header without decoding the pixels
+                pillow_image = PilImage.open(BytesIO(content))
+                file_name = (
+                    f"{get_random_string(length=32)}."
+                    f"{pillow_image.get_format_mimetype().split('/')[-1]}"
+                )
+                if settings.SCRAPPER_REENCODE_ON_INGEST:
+                    file_bytes = BytesIO()
+                    pillow_image.save(file_bytes, pillow_image.format)
+                    content = file_bytes.getvalue()
         except (
             PIL.UnidentifiedImageError,
             urllib3.exceptions.LocationParseError,
+            requests.exceptions.RequestException,
+            # Truncated or corrupted image data found while re-encoding
+            OSError,
         ):
-            pass
+            FETCH_ERRORS.inc(host=get_host(img_url), kind="image")
+            return None
+        return FetchedImage(
+            original_url=img_url,
+            file_name=file_name,
+            content=content,
+            height=pillow_image.height,
+            width=pillow_image.width,
+            mode=pillow_image.mode,
+            format=pillow_image.format,
+        )
+
+    @classmethod
+    def build_image(cls, fetched: "FetchedImage", url: Address) -> "Image":
+        """
+        Writes a downloaded image to the storage and returns the unsaved
+        model instance with its file name already assigned, so the row
+        can be inserted in a single query
+        Args:
+            fetched: Downloaded image
+            url: Parent Url Address
+
+        Returns: Image, unsaved instance
+
+        """
+        img_object = cls(
+            parent_url=url,
+            image_name=fetched.file_name,
+            original_url=fetched.original_url,
+            original_url_hash=hash_url(fetched.original_url),
+            height=fetched.height,
+            width=fetched.width,
+            aspect_ratio=cls.get_aspect_ratio(fetched.width, fetched.height),
+            file_size=len(fetched.content),
+            mode=fetched.mode,
+            format=fetched.format,
+        )
+        field = img_object.image.field
+        with SCRAPE_STAGE_SECONDS.time(stage="store"):
+            img_object.image.name = field.storage.save(
+                field.generate_filename(img_object, fetched.file_name),
+                ContentFile(fetched.content),
+                max_length=field.max_length,
+            )
+        return img_object
+
+    @classmethod
+    def store_image(cls, fetched: "FetchedImage", url: Address) -> "Image":
+        """
+        Saves a downloaded image along with Metadata
+        Args:
+            fetched: Downloaded image
+            url: Parent Url Address
+
+        Returns: Image, saved instance
+
+        """
+        img_object = cls.build_image(fetched, url)
+        with SCRAPE_STAGE_SECONDS.time(stage="db"):
+            img_object.save()
+        cls.schedule_renditions([img_object])
+        return img_object
+
+    @classmethod
+    def bulk_store_images(cls, images: List["Image"]) -> List["Image"]:
+        """
+        Inserts built images in a single query, rows of images already
+        stored for the same parent url (e.g. by a concurrent scrape) are
+        skipped, the files of the skipped rows or of a failed insert are
+        removed from the storage
+        Args:
+            images: Unsaved instances returned by `build_image`
+                    of a single parent url
+
+        Returns: List[Image], inserted instances with their ID assigned
+
+        """
+        with SCRAPE_STAGE_SECONDS.time(stage="db"):
+            try:
+                cls.objects.bulk_create(images, ignore_conflicts=True)
+            except Exception:
+                for img_object in images:
+                    img_object.image.delete(save=False)
+                raise
+            inserted = dict(
+                cls.objects.filter(
+                    parent_url=images[0].parent_url,
+                    original_url__in=[img.original_url for img in images],
+                ).values_list("image", "id")
+            )
+        stored = []
+        for img_object in images:
+            if img_object.image.name in inserted:
+                img_object.pk = inserted[img_object.image.name]
+                stored.append(img_object)
+            else:
+                img_object.image.delete(save=False)
+        return stored
+
+    @staticmethod
+    def schedule_renditions(images: List["Image"]):
+        """
+        Sends the stored images to the `precompute_renditions` task once
+        the transaction is committed, if `SCRAPPER_PRECOMPUTE_RENDITIONS`
+        is enabled
+        Args:
+            images: Saved Image instances
+
+        """
+        if not settings.SCRAPPER_PRECOMPUTE_RENDITIONS or not images:
+            return
+        from scrapper.core.tasks import precompute_renditions
+
+        image_ids = [img_object.pk for img_object in images]
+        transaction.on_commit(lambda: precompute_renditions.delay(image_ids))
 
     @classmethod
-    def __save_multi_from_url(cls, images: List[str], url: Address):
-        for image in images:
-            cls.save_image(image, url)
+    def save_image(cls, image_url: str, url: Address):
+        """
+        Saves Images from a given URL along with Metadata
+        Args:
+            image_url: Image Link
+            url: Parent Url Address
+
+        Returns:
+
+        """
+        fetched = cls.fetch_image(cls.resolve_image_url(image_url, url))
+        if fetched is not None:
+            cls.store_image(fetched, url)
+
+    @classmethod
+    def resolve_image_urls(cls, images: List[str], url: Address) -> List[str]:
+        """
+        Resolves the image sources of a page, removes duplicates
+        Args:
+            images: List of image sources
+            url: Parent Url Address
+
+        Returns: List[str], absolute image urls in document order
+
+        """
+        return list(
+            dict.fromkeys(
+                cls.resolve_image_url(image, url) for image in images
+            )
+        )
+
+    @classmethod
+    def known_image_urls(cls, url: Address, image_urls: List[str]) -> Set[str]:
+        """
+        Finds which image urls are already stored for the parent url,
+        through the (parent_url, original_url) unique index
+        Args:
+            url: Parent Url Address
+            image_urls: Absolute image urls
+
+        Returns: Set[str], stored image urls
+
+        """
+        known = set()
+        size = settings.SCRAPPER_INGEST_BATCH_SIZE
+        with SCRAPE_STAGE_SECONDS.time(stage="db"):
+            for i in range(0, len(image_urls), size):
+                known.update(
+                    cls.get_queryset_by_url(url)
+                    .filter(original_url__in=image_urls[i : i + size])
+                    .values_list("original_url", flat=True)
+                )
+        return known
+
+    @classmethod
+    def __save_multi_from_url(
+        cls,
+        image_urls: List[str],
+        url: Address,
+        job: Optional["ScrapeJob"] = None,
+    ):
+        """
+        Downloads images concurrently through `ImageDownloader`,
+        the calling thread writes the files to the storage and inserts
+        the rows in batches of `SCRAPPER_INGEST_BATCH_SIZE`
+        Args:
+            image_urls: List of absolute image urls
+            url: Parent Url Address
+            job: Optional ScrapeJob to report the progress to
+
+        """
+        batch, failures = [], 0
+        for fetched in ImageDownloader().download(image_urls, cls.fetch_image):
+            if fetched is None:
+                failures += 1
+            else:
+                batch.append(cls.build_image(fetched, url))
+            if len(batch) >= settings.SCRAPPER_INGEST_BATCH_SIZE:
+                stored = cls.bulk_store_images(batch)
+                cls.schedule_renditions(stored)
+                if job:
+                    job.record(images_saved=len(stored), failures=failures)
+                batch, failures = [], 0
+        stored = cls.bulk_store_images(batch) if batch else []
+        cls.schedule_renditions(stored)
+        if job and (stored or failures):
+            job.record(images_saved=len(stored), failures=failures)
 
     @classmethod
     def get_queryset_by_url(cls, parent_url: Address):
         return cls.objects.filter(parent_url=parent_url)
 
     @classmethod
-    def save_multiple_images(cls, url: Address) -> QuerySet:
+    def save_multiple_images(
+        cls,
+        url: Address,
+        job: Optional["ScrapeJob"] = None,
+        page: Optional[ExtractedPage] = None,
+    ) -> QuerySet:
         """
         Given URL Address, it saves all images scrapped from the url in the database and media
         directory,
@@ -328,62 +769,646 @@ class Image(AbstractModel):
             1. Scrape image from the URL and get list of those images
                by calling `get_images_from_url_response`
 
-            2. Find cached image of the URL, if the api runs for the first time for a URL 'X'
-               the link of the images scrapped from 'X' will be cached.
+            2. Find which of these image links are already stored for the URL,
+               a single indexed query on (parent_url, original_url)
 
-            3. Compare cached links and scraped links, if they are the same,
+            3. Download the new images only, if there are none,
                return filtered queryset
 
-            4. Loops through all images create image model instance
+            4. Insert the new image model instances in batches
         Args:
             url: Address Instance
+            job: Optional ScrapeJob to report the progress to
+            page: Document of the url already fetched, e.g. by the crawler
 
         Returns: QuerySet<Image> Returns all images scrapped from the url
 
         """
         # Scraps image through the given URL
-        images = cls.get_images_from_url_response(url.url)
-        # Get cached Image Link
-        cached_image = cache.get(url.url, [])
-        # Remove common links
-        all_images = list(
-            set(images) - set(cached_image)
-        )  # Removes Duplicates
-        # Set new cache
-        cache.set(url.url, list(all_images) + list(cached_image), None)
+        images = (
+            page.images
+            if page is not None
+            else cls.get_images_from_url_response(url.url)
+        )
+        if job:
+            job.record(pages_fetched=1)
+        # Resolve image links and remove duplicates
+        image_urls = cls.resolve_image_urls(images, url)
+        # Remove already stored links
+        known_urls = cls.known_image_urls(url, image_urls)
+        new_urls = [u for u in image_urls if u not in known_urls]
         # Save Multiple Images
-        cls.__save_multi_from_url(all_images, url=url)
+        cls.__save_multi_from_url(new_urls, url=url, job=job)
         # Return Queryset
         return cls.get_queryset_by_url(parent_url=url)
 
     @classmethod
     def remove_all_and_restore(cls, url: Address) -> QuerySet:
         """
-        Removes all available images and re-scrape images
-        Removes from file storage as well
+        Re-scrapes the images of an url and replaces its stored images,
+        the images of the other urls are not touched
+        Steps:
+            1. Scrape the URL and download its images, the files are
+               stored under new names, a page that can not be fetched
+               keeps the stored images
+
+            2. In one transaction, delete the previous rows of the URL
+               in batches and insert the new ones, readers see the
+               previous images until the new set is committed
+
+            3. Remove the previous files and renditions in the
+               background `delete_files` task, in batches
         Args:
-            url: URL String
+            url: Parent Url Address
 
-        Returns:
+        Returns: QuerySet<Image>, scrapped and saved images
 
         """
-        # Delete all available images
-        cls.objects.all().delete()
-        # Restore images
-        images = list(
-            set(cls.get_images_from_url_response(url.url))
+        image_urls = cls.resolve_image_urls(
+            cls.get_images_from_url_response(url.url), url
         )  # Remove duplicates
-        cls.__save_multi_from_url(images, url=url)
-        # Set Cache
-        cache.set(url.url, images, None)
-        # Return Queryset
+        images = [
+            cls.build_image(fetched, url)
+            for fetched in ImageDownloader().download(
+                image_urls, cls.fetch_image
+            )
+            if fetched is not None
+        ]
+        size = settings.SCRAPPER_INGEST_BATCH_SIZE
+        try:
+            with transaction.atomic():
+                file_names = cls.delete_in_batches(
+                    cls.get_queryset_by_url(url)
+                )
+                stored = []
+                for i in range(0, len(images), size):
+                    stored.extend(cls.bulk_store_images(images[i : i + size]))
+        except Exception:
+            for img_object in images:
+                img_object.image.delete(save=False)
+            raise
+        cls.schedule_renditions(stored)
+        cls.schedule_file_cleanup(file_names)
         return cls.get_queryset_by_url(parent_url=url)
 
+    @classmethod
+    def delete_in_batches(cls, queryset: QuerySet) -> List[str]:
+        """
+        Deletes images and their renditions `SCRAPPER_DELETE_BATCH_SIZE`
+        rows per query, without the per row `post_delete` file cleanup.
+        The cached renditions are invalidated once the transaction is
+        committed, a rollback keeps them along with the rows
+        Args:
+            queryset: Images to delete
+
+        Returns: List[str], storage names of the deleted image and
+                 rendition files, removed by `schedule_file_cleanup`
+
+        """
+        file_names, deleted_ids = [], []
+        size = settings.SCRAPPER_DELETE_BATCH_SIZE
+        while True:
+            rows = list(
+                queryset.order_by("pk").values_list("pk", "image")[:size]
+            )
+            if not rows:
+                transaction.on_commit(
+                    lambda: cls.invalidate_renditions(deleted_ids)
+                )
+                return file_names
+            image_ids = [pk for pk, name in rows]
+            renditions = Rendition.objects.filter(image_id__in=image_ids)
+            file_names.extend(renditions.values_list("file", flat=True))
+            renditions._raw_delete(renditions.db)
+            images = cls.objects.filter(pk__in=image_ids)
+            images._raw_delete(images.db)
+            file_names.extend(name for pk, name in rows if name)
+            deleted_ids.extend(image_ids)
+
+    @staticmethod
+    def invalidate_renditions(image_ids: List[int]):
+        """
+        Removes the cached renditions of deleted images
+        Args:
+            image_ids: Image primary keys
+
+        """
+        cache = get_rendition_cache()
+        for pk in image_ids:
+            cache.invalidate(pk)
+
+    @staticmethod
+    def schedule_file_cleanup(file_names: List[str]):
+        """
+        Sends the files of deleted rows to the `delete_files` task in
+        batches of `SCRAPPER_DELETE_BATCH_SIZE`, once the transaction
+        is committed
+        Args:
+            file_names: Storage names
+
+        """
+        from scrapper.core.tasks import delete_files
+
+        size = settings.SCRAPPER_DELETE_BATCH_SIZE
+        for i in range(0, len(file_names), size):
+            batch = file_names[i : i + size]
+            transaction.on_commit(
+                lambda batch=batch: delete_files.delay(batch)
+            )
+
+    @staticmethod
+    def delete_files(file_names: List[str]) -> int:
+        """
+        Removes image and rendition files from the storage
+        Args:
+            file_names: Storage names
+
+        Returns: int, number of removed files
+
+        """
+        deleted = 0
+        for name in file_names:
+            try:
+                default_storage.delete(name)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
+
+
+class ScrapeJob(AbstractModel):
+    """
+
+    Background scrapping job of an url, the scrapping runs in a
+    Celery worker and the progress is stored in this model
+
+    Attributes:
+        `id`: Job ID
+        `address`: Scrapped URL, Refers to Address Model
+        `status`: Current state of the job
+        `pages_fetched`: Number of pages fetched
+        `images_saved`: Number of images saved
+        `failures`: Number of images that could not be saved
+        `error`: Error message if the job has failed
+        `max_depth`: Number of links followed from the url, 0 scrapes
+                     the url only
+        `max_pages`: Maximum number of pages fetched by a crawl
+        `same_domain`: The crawl only follows links to the url host
+
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "PENDING"
+        RUNNING = "RUNNING"
+        SUCCESS = "SUCCESS"
+        FAILURE = "FAILURE"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    address = models.ForeignKey(to=Address, on_delete=models.CASCADE)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    pages_fetched = models.PositiveIntegerField(default=0)
+    images_saved = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    max_depth = models.PositiveSmallIntegerField(default=0)
+    max_pages = models.PositiveIntegerField(default=1)
+    same_domain = models.BooleanField(default=True)
+
+    def __str__(self) -> str:
+        """
+
+        Returns: Model String Representation
+
+        """
+        return f"{self.address} [{self.status}]"
+
+    @property
+    def is_crawl(self) -> bool:
+        return self.max_depth > 0 and self.max_pages > 1
+
+    def record(self, **counters: int):
+        """
+        Atomically increments the progress counters of the job
+        Args:
+            **counters: Counter name and the increment,
+                        Example: `images_saved=1`
+
+        """
+        ScrapeJob.objects.filter(pk=self.pk).update(
+            updated=timezone.now(),
+            **{name: F(name) + value for name, value in counters.items()},
+        )
+
+    def set_status(self, status: str, error: str = ""):
+        """
+        Updates the job status
+        Args:
+            status: ScrapeJob.Status
+            error: Error message
+
+        """
+        self.status = status
+        self.error = error
+        self.save(update_fields=["status", "error", "updated"])
+
+    def run(self) -> QuerySet:
+        """
+        Scrapes the job url and saves the images, reporting the progress,
+        crawls the site from the url when `max_depth` is set
+
+        Returns: QuerySet<Image>, scrapped and saved images
+
+        """
+        self.set_status(self.Status.RUNNING)
+        try:
+            if self.is_crawl:
+                from scrapper.core.crawl import Crawler
+
+                Crawler(
+                    self.max_depth, self.max_pages, self.same_domain, job=self
+                ).crawl(self.address)
+                images = Image.get_queryset_by_url(self.address)
+            else:
+                images = Address.save_url_with_images(
+                    self.address.url, job=self
+                )
+        except ValidationError:
+            self.set_status(self.Status.FAILURE, "URL Does not exist")
+            raise
+        except Exception as e:
+            self.set_status(self.Status.FAILURE, str(e))
+            raise
+        self.set_status(self.Status.SUCCESS)
+        return images
+
+
+class SyncRun(AbstractModel):
+    """
+
+    Checkpoint and summary of a sync of every stored address.
+    Addresses are synced in chunks ordered by ID, `last_address_id` is
+    only moved forward once a whole chunk has been synced, so an
+    interrupted run can be resumed from the last completed chunk
+
+    Attributes:
+        `status`: Current state of the run
+        `last_address_id`: Last address ID of the last completed chunk
+        `chunk`: Sequence number of the chunk being synced
+        `chunk_last_address_id`: Last address ID of the chunk being synced
+        `pending`: Number of addresses of the chunk not synced yet
+        `addresses_done`: Number of synced addresses
+        `new_images`: Number of new images saved
+        `failures`: Number of addresses that could not be scrapped
+        `address_seconds`: Total time spent scrapping addresses
+        `max_address_seconds`: Time spent on the slowest address
+        `finished`: Timestamp the run has finished
+
+    """
+
+    class Status(models.TextChoices):
+        RUNNING = "RUNNING"
+        SUCCESS = "SUCCESS"
+
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.RUNNING
+    )
+    last_address_id = models.BigIntegerField(default=0)
+    chunk = models.PositiveIntegerField(default=0)
+    chunk_last_address_id = models.BigIntegerField(default=0)
+    pending = models.PositiveIntegerField(default=0)
+    addresses_done = models.PositiveIntegerField(default=0)
+    new_images = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    address_seconds = models.FloatField(default=0)
+    max_address_seconds = models.FloatField(default=0)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        """
+
+        Returns: Model String Representation
+
+        """
+        return f"Sync #{self.pk} [{self.status}]"
+
+    def next_chunk(self) -> List[int]:
+        """
+        Reads the next chunk of address IDs after the checkpoint
+
+        Returns: List of address ID, empty if every address is synced
+
+        """
+        return list(
+            Address.objects.filter(pk__gt=self.last_address_id)
+            .order_by("pk")
+            .values_list("pk", flat=True)[: settings.SCRAPPER_SYNC_CHUNK_SIZE]
+        )
+
+    def start_chunk(self, address_ids: List[int]) -> int:
+        """
+        Marks a chunk of addresses as being synced
+        Args:
+            address_ids: Ordered address IDs of the chunk
+
+        Returns: int, sequence number of the chunk
+
+        """
+        self.chunk += 1
+        self.pending = len(address_ids)
+        self.chunk_last_address_id = address_ids[-1]
+        self.save(
+            update_fields=[
+                "chunk",
+                "pending",
+                "chunk_last_address_id",
+                "updated",
+            ]
+        )
+        return self.chunk
+
+    def complete_address(self, chunk: int, result: dict) -> bool:
+        """
+        Adds a synced address to the summary, moves the checkpoint
+        forward when it was the last pending address of the chunk
+        Args:
+            chunk: Sequence number of the chunk the address belongs to
+            result: `Address.sync_address` result
+
+        Returns: bool, True if the chunk is completed
+
+        """
+        with transaction.atomic():
+            run = SyncRun.objects.select_for_update().get(pk=self.pk)
+            # Result of a chunk that has been restarted by a resume
+            if run.chunk != chunk or not run.pending:
+                return False
+            run.addresses_done += 1
+            run.new_images += max(result["new_images"], 0)
+            run.failures += int(bool(result["error"]))
+            run.address_seconds += result["seconds"]
+            run.max_address_seconds = max(
+                run.max_address_seconds, result["seconds"]
+            )
+            run.pending -= 1
+            if not run.pending:
+                run.last_address_id = run.chunk_last_address_id
+            run.save()
+        self.refresh_from_db()
+        return not run.pending
+
+    def finish(self):
+        """
+        Marks the run as successfully finished
+        """
+        self.status = self.Status.SUCCESS
+        self.finished = timezone.now()
+        self.save(update_fields=["status", "finished", "updated"])
+
+    def summary(self) -> dict:
+        """
+
+        Returns: Dictionary, summary of the run
+
+        """
+        return {
+            "run": self.pk,
+            "status": self.status,
+            "addresses_done": self.addresses_done,
+            "new_images": self.new_images,
+            "failures": self.failures,
+            "seconds_per_address": (
+                self.address_seconds / self.addresses_done
+                if self.addresses_done
+                else 0.0
+            ),
+            "max_address_seconds": self.max_address_seconds,
+        }
+
+
+def rendition_directory(instance, filename) -> str:
+    """
+    Gets precomputed rendition directory name
+    Args:
+        filename: Name of the rendition file
+        instance: Rendition Model Instance
+
+    Returns: directory name
+
+    """
+    return f"precomputed/{instance.image_id}/{filename}"
+
+
+class Rendition(AbstractModel):
+    """
+    Preset rendition of an image encoded in the background after the
+    ingest, served by the image view without resizing
+
+    Attributes:
+        `image`: Original image
+        `width`: Rendition width in px
+        `height`: Rendition height in px
+        `format`: Rendition format, Example: 'jpeg', 'webp'
+        `quality`: Encoder quality
+        `file`: Encoded rendition
+        `file_size`: Size of the file in bytes
+
+    """
+
+    # Quality of the precomputed renditions, default of the image view
+    QUALITY = 100
+
+    image = models.ForeignKey(
+        to=Image, on_delete=models.CASCADE, related_name="renditions"
+    )
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    quality = models.PositiveSmallIntegerField(default=QUALITY)
+    file = models.FileField(upload_to=rendition_directory, max_length=500)
+    file_size = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """
+
+        Meta class that contains meta data for this model
+        Attributes:
+            constraints: A rendition is stored once, also indexes the
+                         lookup of the image view
+
+        """
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["image", "width", "height", "format", "quality"],
+                name="unique_rendition",
+            )
+        ]
+
+    def __str__(self) -> str:
+        return self.file.name
+
+    @property
+    def key(self) -> RenditionKey:
+        return RenditionKey(
+            self.image_id, self.width, self.height, self.format, self.quality
+        )
+
+    @classmethod
+    def find(cls, key: RenditionKey) -> Optional["Rendition"]:
+        """
+        Args:
+            key: RenditionKey requested by the image view
+
+        Returns: Rendition | None, None if the rendition is not precomputed
+
+        """
+        return cls.objects.filter(
+            image_id=key.pk,
+            width=key.width,
+            height=key.height,
+            format=key.format,
+            quality=key.quality,
+        ).first()
+
+    @classmethod
+    def get_preset_keys(cls, image: Image) -> List[RenditionKey]:
+        """
+        Lists the renditions to precompute for an image, every size preset
+        in the original format and the `SCRAPPER_PRECOMPUTE_FORMATS`,
+        presets larger than the image share the original size
+        Args:
+            image: Image instance
+
+        Returns: List[RenditionKey], without duplicates
+
+        """
+        formats = dict.fromkeys(
+            [image.format_lower, *settings.SCRAPPER_PRECOMPUTE_FORMATS]
+        )
+        return list(
+            dict.fromkeys(
+                RenditionKey(
+                    image.pk,
+                    *image.get_rendition_size(width=width),
+                    img_format,
+                    cls.QUALITY,
+                )
+                for width in RENDITION_PRESETS.values()
+                for img_format in formats
+            )
+        )
+
+    @classmethod
+    def build(cls, key: RenditionKey, content: bytes) -> "Rendition":
+        """
+        Writes an encoded rendition to the storage
+        Args:
+            key: RenditionKey
+            content: Encoded rendition
+
+        Returns: Rendition, unsaved instance
+
+        """
+        rendition = cls(
+            image_id=key.pk,
+            width=key.width,
+            height=key.height,
+            format=key.format,
+            quality=key.quality,
+            file_size=len(content),
+        )
+        field = rendition.file.field
+        rendition.file.name = field.storage.save(
+            field.generate_filename(rendition, key.file_name),
+            ContentFile(content),
+            max_length=field.max_length,
+        )
+        return rendition
+
+    @classmethod
+    def precompute(cls, image_ids: List[int]) -> int:
+        """
+        Encodes the missing preset renditions of the images in the
+        rendition process pool, one pool task per image, and inserts the
+        rows in a single query. A failing rendition is logged and skipped,
+        the other renditions of the image are stored
+        Args:
+            image_ids: Image IDs
+
+        Returns: int, number of stored renditions
+
+        """
+        existing = {
+            tuple(values)
+            for values in cls.objects.filter(
+                image_id__in=image_ids
+            ).values_list("image_id", "width", "height", "format", "quality")
+        }
+        pool = get_rendition_pool()
+        pending = []
+        for image in Image.objects.filter(pk__in=image_ids).exclude(image=""):
+            keys = [
+                key
+                for key in cls.get_preset_keys(image)
+                if tuple(key) not in existing
+            ]
+            if not keys:
+                continue
+            try:
+                with image.image.open("rb") as image_file:
+                    content = image_file.read()
+            except OSError:
+                logger.warning("Image %s file is missing", image.pk)
+                continue
+            pending.append(
+                (keys, pool.submit(render_renditions, content, keys))
+            )
+        renditions = []
+        for keys, future in pending:
+            try:
+                results = future.result()
+            except Exception:
+                logger.exception("Renditions of image %s failed", keys[0].pk)
+                continue
+            for key, (content, error) in zip(keys, results):
+                if content is None:
+                    logger.warning("Rendition %s failed: %s", key, error)
+                else:
+                    renditions.append(cls.build(key, content))
+        if not renditions:
+            return 0
+        cls.objects.bulk_create(renditions, ignore_conflicts=True)
+        # Files of the rows inserted meanwhile by a concurrent task
+        inserted = set(
+            cls.objects.filter(image_id__in=image_ids).values_list(
+                "file", flat=True
+            )
+        )
+        stored = 0
+        for rendition in renditions:
+            if rendition.file.name in inserted:
+                stored += 1
+            else:
+                rendition.file.delete(save=False)
+        return stored
+
+
+@receiver(post_delete, sender=Rendition)
+def post_delete_rendition(sender, instance, *args, **kwargs):
+    """Clean the precomputed rendition file"""
+    try:
+        instance.file.delete(save=False)
+    except FileNotFoundError:
+        pass
+
 
 @receiver(post_delete, sender=Image)
 def post_save_image(sender, instance, *args, **kwargs):
-    """Clean Old Image file"""
+    """Clean Old Image file and its cached renditions"""
     try:
         instance.image.delete(save=False)
     except FileNotFoundError:
         pass
+    get_rendition_cache().invalidate(instance.pk)
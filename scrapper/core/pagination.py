@@ -0,0 +1,171 @@
+"""
+Keyset (cursor) pagination for the list endpoints
+"""
+
+import base64
+import json
+from typing import List, Optional, Sequence
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates a queryset on a unique ordering, e.g. (-created, -id).
+    The cursor holds the ordering values of the last row of the page,
+    the next page is a range query starting after those values, so every
+    page costs the same whatever its position
+
+    Attributes:
+        `ordering`: Ordering fields, the last one must be unique
+        `cursor_query_param`: Query parameter holding the cursor
+        `page_size_query_param`: Query parameter overriding the page size
+        `next_url`: Url the next page link points to, defaults to the
+                    requested url
+
+    """
+
+    ordering: Sequence[str] = ("-created", "-id")
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def __init__(self, ordering: Optional[Sequence[str]] = None):
+        if ordering is not None:
+            self.ordering = ordering
+        self.next_cursor: Optional[str] = None
+        self.next_url: Optional[str] = None
+        self.request = None
+
+    def get_page_size(self, request) -> int:
+        """
+        Args:
+            request: HttpRequest
+
+        Returns: int, requested page size bounded by `SCRAPPER_MAX_PAGE_SIZE`
+
+        """
+        page_size = request.query_params.get(self.page_size_query_param, "")
+        if page_size.isdigit() and int(page_size) > 0:
+            return min(int(page_size), settings.SCRAPPER_MAX_PAGE_SIZE)
+        return settings.SCRAPPER_PAGE_SIZE
+
+    def encode_cursor(self, row) -> str:
+        """
+        Args:
+            row: Last model instance or `values()` dictionary of the page
+
+        Returns: str, opaque cursor
+
+        """
+        names = [name.lstrip("-") for name in self.ordering]
+        if isinstance(row, dict):
+            values = [row[name] for name in names]
+        else:
+            values = [getattr(row, name) for name in names]
+        data = json.dumps(
+            [
+                value.isoformat() if hasattr(value, "isoformat") else value
+                for value in values
+            ]
+        )
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, queryset: QuerySet, cursor: str) -> List:
+        """
+        Args:
+            queryset: Paginated queryset
+            cursor: Cursor sent by the client
+
+        Returns: List, ordering values of the cursor
+
+        Raises:
+            NotFound if the cursor is invalid
+
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(name.lstrip("-")).to_python(
+                    value
+                )
+                for name, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound("Invalid cursor")
+
+    def keyset_filter(self, values: List) -> Q:
+        """
+        Builds the condition selecting the rows after the cursor, for
+        (-created, -id): created < c OR (created = c AND id < i)
+        Args:
+            values: Ordering values of the cursor
+
+        Returns: Q
+
+        """
+        condition = Q()
+        for index, name in enumerate(self.ordering):
+            field = name.lstrip("-")
+            lookup = "lt" if name.startswith("-") else "gt"
+            equal = {
+                previous.lstrip("-"): values[i]
+                for i, previous in enumerate(self.ordering[:index])
+            }
+            condition |= Q(**equal, **{f"{field}__{lookup}": values[index]})
+        return condition
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(
+                self.keyset_filter(self.decode_cursor(queryset, cursor))
+            )
+        rows = list(queryset[: page_size + 1])
+        page = rows[:page_size]
+        self.next_cursor = (
+            self.encode_cursor(page[-1]) if len(rows) > page_size else None
+        )
+        return page
+
+    def get_next_link(self) -> Optional[str]:
+        """
+
+        Returns: str | None, url of the next page
+
+        """
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.next_url or self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor,
+        )
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "cursor": self.next_cursor,
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "cursor": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
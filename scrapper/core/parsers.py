@@ -0,0 +1,307 @@
+"""
+Image and link reference extraction engines for scrapped HTML documents
+"""
+
+import logging
+import time
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, NamedTuple, Optional, Type
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+
+try:
+    from lxml import etree
+except ImportError:  # lxml is optional, falls back to the other engines
+    etree = None
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractedPage(NamedTuple):
+    """
+    References found in a document, in document order
+
+    Attributes:
+        `images`: `src` of every `<img/>` tag
+        `links`: `href` of every `<a/>` tag, followed by the crawler
+        `url`: Final url of the document after the redirects, the links
+               are relative to it, None if the document was not fetched
+
+    """
+
+    images: List[str]
+    links: List[str]
+    url: Optional[str] = None
+
+
+class ImageExtractor:
+    """
+    Base extraction engine, returns the `src` of every `<img/>` tag
+    and the `href` of every `<a/>` tag of a document in document order
+
+    Attributes:
+        `name`: Engine name used by `SCRAPPER_HTML_PARSER`
+
+    """
+
+    name = ""
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """
+
+        Returns: bool, True if the engine dependencies are installed
+
+        """
+        return True
+
+    def extract(self, html: str) -> List[str]:
+        """
+        Args:
+            html: HTML Document
+
+        Returns: List[str], image sources
+
+        """
+        return self.extract_page(html).images
+
+    def extract_page(self, html: str) -> ExtractedPage:
+        """
+        Args:
+            html: HTML Document
+
+        Returns: ExtractedPage, image sources and links
+
+        """
+        raise NotImplementedError
+
+
+class SoupImageExtractor(ImageExtractor):
+    """
+    Builds the full BeautifulSoup tree with the pure python `html.parser`,
+    the slowest engine, kept as the fallback of the other engines
+    """
+
+    name = "bs4"
+
+    def extract_page(self, html: str) -> ExtractedPage:
+        soup = BeautifulSoup(html, "html.parser")
+        return ExtractedPage(
+            [img["src"] for img in soup.find_all("img") if img.get("src")],
+            [a["href"] for a in soup.find_all("a") if a.get("href")],
+        )
+
+
+class _ImageTagCollector(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.images: List[str] = []
+        self.links: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "img":
+            src = dict(attrs).get("src")
+            if src:
+                self.images.append(src)
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+    handle_startendtag = handle_starttag
+
+
+class StreamImageExtractor(ImageExtractor):
+    """
+    Streams the document through the standard library tokenizer and only
+    keeps the image sources and links, no tree is built
+    """
+
+    name = "stream"
+
+    def extract_page(self, html: str) -> ExtractedPage:
+        collector = _ImageTagCollector()
+        collector.feed(html)
+        collector.close()
+        return ExtractedPage(collector.images, collector.links)
+
+
+class _LxmlImageTarget:
+    """
+    lxml parser target, receives the parser events instead of a tree
+    """
+
+    def __init__(self):
+        self.images: List[str] = []
+        self.links: List[str] = []
+
+    def start(self, tag, attrib):
+        if tag == "img":
+            src = attrib.get("src")
+            if src:
+                self.images.append(src)
+        elif tag == "a":
+            href = attrib.get("href")
+            if href:
+                self.links.append(href)
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def close(self) -> ExtractedPage:
+        return ExtractedPage(self.images, self.links)
+
+
+class LxmlImageExtractor(ImageExtractor):
+    """
+    Feeds the document to the libxml2 HTML parser with a target that
+    only collects the image sources and links, no tree is built
+    """
+
+    name = "lxml"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return etree is not None
+
+    def extract_page(self, html: str) -> ExtractedPage:
+        parser = etree.HTMLParser(target=_LxmlImageTarget())
+        parser.feed(html)
+        return parser.close()
+
+
+EXTRACTORS: Dict[str, Type[ImageExtractor]] = {
+    extractor.name: extractor
+    for extractor in (
+        LxmlImageExtractor,
+        StreamImageExtractor,
+        SoupImageExtractor,
+    )
+}
+
+
+def get_extractor(name: Optional[str] = None) -> ImageExtractor:
+    """
+    Returns the configured extraction engine, `auto` picks the fastest
+    available engine
+    Args:
+        name: Engine name, defaults to `SCRAPPER_HTML_PARSER`
+
+    Returns: ImageExtractor
+
+    """
+    name = name or settings.SCRAPPER_HTML_PARSER
+    if name == "auto":
+        name = (
+            LxmlImageExtractor.name
+            if LxmlImageExtractor.is_available()
+            else StreamImageExtractor.name
+        )
+    extractor = EXTRACTORS[name]
+    if not extractor.is_available():
+        return SoupImageExtractor()
+    return extractor()
+
+
+def extract_page(html: str, name: Optional[str] = None) -> ExtractedPage:
+    """
+    Extracts the image sources and the links of a document, falls back to
+    BeautifulSoup if the configured engine fails on the document
+    Args:
+        html: HTML Document
+        name: Engine name, defaults to `SCRAPPER_HTML_PARSER`
+
+    Returns: ExtractedPage
+
+    """
+    extractor = get_extractor(name)
+    try:
+        return extractor.extract_page(html)
+    except Exception:
+        if isinstance(extractor, SoupImageExtractor):
+            raise
+        logger.warning("%s engine failed, falling back to bs4", extractor.name)
+        return SoupImageExtractor().extract_page(html)
+
+
+def extract_images(html: str, name: Optional[str] = None) -> List[str]:
+    """
+    Extracts the image sources of a document
+    Args:
+        html: HTML Document
+        name: Engine name, defaults to `SCRAPPER_HTML_PARSER`
+
+    Returns: List[str], image sources
+
+    """
+    return extract_page(html, name).images
+
+
+def generate_document(images: int = 5000, padding: int = 400) -> str:
+    """
+    Generates a large gallery like document for benchmarks
+    Args:
+        images: Number of `<img/>` tags
+        padding: Size of the text content around every image
+
+    Returns: str, HTML Document
+
+    """
+    text = "lorem ipsum " * (padding // 12)
+    items = "".join(
+        f'<div class="card"><a href="/photo/{i}"><img alt="photo {i}" '
+        f'src="https://cdn.example.com/photos/{i}.jpg" loading="lazy"/>'
+        f"</a><p>{text}</p></div>"
+        for i in range(images)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Gallery</title></head>"
+        f"<body>{items}</body></html>"
+    )
+
+
+def benchmark(
+    documents: Iterable[str],
+    names: Optional[Iterable[str]] = None,
+    repeat: int = 5,
+) -> List[dict]:
+    """
+    Compares the extraction engines on the given documents
+    Args:
+        documents: HTML Documents, saved pages or `generate_document` output
+        names: Engine names, defaults to every available engine
+        repeat: Number of runs per document, the best run is kept
+
+    Returns: List of dictionary, one result per engine and document
+
+    """
+    documents = list(documents)
+    names = list(names or EXTRACTORS)
+    results = []
+    for index, html in enumerate(documents):
+        for name in names:
+            extractor_class = EXTRACTORS[name]
+            if not extractor_class.is_available():
+                continue
+            extractor = extractor_class()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                images = extractor.extract(html)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            results.append(
+                {
+                    "engine": name,
+                    "document": index,
+                    "bytes": len(html.encode()),
+                    "images": len(images),
+                    "seconds": best,
+                    "mb_per_second": len(html.encode()) / best / 1e6,
+                }
+            )
+    return results
@@ -0,0 +1,349 @@
+"""
+Per host politeness of the scrapping HTTP client, request rate and
+concurrency limits shared by every process through the Django cache
+"""
+
+import time
+import uuid
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+KEY_PREFIX = "scrapper:politeness"
+POLL_INTERVAL = 0.01
+# Seconds a bucket lock is held at most, the bucket update takes a few ms
+LOCK_TIMEOUT = 5
+
+
+class HostThrottled(requests.exceptions.RequestException):
+    """
+    The host can not be requested within `SCRAPPER_POLITENESS_MAX_WAIT`,
+    it answered 429 / Retry-After or its limits are saturated
+    """
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host} is throttled for {retry_after:.1f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class RobotsDisallowed(requests.exceptions.RequestException):
+    """
+    The url is disallowed for our user agent by the robots.txt of the host
+    """
+
+
+def get_host(url: str) -> Tuple[str, str]:
+    """
+    Args:
+        url: Absolute url
+
+    Returns: (scheme, lower case host with port)
+
+    """
+    parsed = urlparse(url)
+    return parsed.scheme or "http", parsed.netloc.lower()
+
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    """
+    Args:
+        value: Retry-After header, seconds or HTTP date
+        default: Delay used when the header is missing or malformed
+
+    Returns: float, seconds to wait
+
+    """
+    if not value:
+        return default
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError, OverflowError):
+        return default
+
+
+class RobotsCache:
+    """
+    Downloads the robots.txt of every host once per `ttl` seconds,
+    the file is shared through the cache and parsed once per process.
+    A missing robots.txt (4xx) allows everything, a server error
+    disallows everything until the entry expires
+
+    Attributes:
+        `ttl`: Seconds a robots.txt is cached
+
+    """
+
+    def __init__(self, cache: BaseCache, ttl: Optional[int] = None):
+        self.cache = cache
+        self.ttl = settings.SCRAPPER_ROBOTS_TTL if ttl is None else ttl
+        self._parsers: Dict[str, Tuple[str, RobotFileParser]] = {}
+
+    @staticmethod
+    def fetch(robots_url: str, get: Callable) -> str:
+        """
+        Args:
+            robots_url: Absolute robots.txt url
+            get: Callable sending a GET request
+
+        Returns: str, robots.txt rules to apply
+
+        Raises:
+            requests.RequestException if the host is unreachable
+
+        """
+        response = get(robots_url)
+        if response.status_code >= 500:
+            return "User-agent: *\nDisallow: /"
+        if response.status_code >= 400:
+            return ""
+        return response.text
+
+    def get_parser(self, url: str, get: Callable) -> RobotFileParser:
+        """
+        Args:
+            url: Requested url
+            get: Callable sending a GET request, bypassing the scheduler
+
+        Returns: RobotFileParser of the url host
+
+        """
+        scheme, host = get_host(url)
+        robots_url = f"{scheme}://{host}/robots.txt"
+        key = f"{KEY_PREFIX}:robots:{robots_url}"
+        text = self.cache.get(key)
+        if text is None:
+            text = self.fetch(robots_url, get)
+            self.cache.set(key, text, self.ttl)
+        cached = self._parsers.get(robots_url)
+        if cached is None or cached[0] != text:
+            parser = RobotFileParser(robots_url)
+            parser.parse(text.splitlines())
+            self._parsers[robots_url] = cached = (text, parser)
+        return cached[1]
+
+
+class PolitenessScheduler:
+    """
+    Enforces per host limits before every request:
+
+    1. robots.txt rules of the host for `SCRAPPER_USER_AGENT`
+    2. Back off of the host after a 429 or Retry-After response
+    3. Token bucket of `rate` requests per second with `burst` tokens,
+       lowered by the Crawl-delay of robots.txt
+    4. At most `concurrency` requests in flight against the host
+
+    The state lives in the `SCRAPPER_POLITENESS_CACHE` cache, it is shared
+    by every web and Celery process when the cache is (Redis, Memcached,
+    database). Waiting longer than `max_wait` raises HostThrottled
+
+    Attributes:
+        `rate`: Requests per second per host, 0 disables the rate limit
+        `burst`: Bucket size, requests sent at once after an idle period
+        `concurrency`: Requests in flight per host
+        `max_wait`: Maximum seconds a request waits for the host
+
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        cache_alias: Optional[str] = None,
+    ):
+        self.rate = settings.SCRAPPER_HOST_RATE if rate is None else rate
+        self.burst = settings.SCRAPPER_HOST_BURST if burst is None else burst
+        self.concurrency = (
+            settings.SCRAPPER_HOST_CONCURRENCY
+            if concurrency is None
+            else concurrency
+        )
+        self.max_wait = (
+            settings.SCRAPPER_POLITENESS_MAX_WAIT
+            if max_wait is None
+            else max_wait
+        )
+        self.cache = caches[cache_alias or settings.SCRAPPER_POLITENESS_CACHE]
+        self.robots = RobotsCache(self.cache)
+
+    @contextmanager
+    def _locked(self, host: str):
+        """
+        Short cross process lock of the bucket of a host, a crashed holder
+        releases it when the cache entry expires. The lock holds a unique
+        token, only the owner deletes it
+
+        Raises:
+            HostThrottled if the lock is not acquired within 1 second
+
+        """
+        key = f"{KEY_PREFIX}:lock:{host}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + 1
+        while not self.cache.add(key, token, timeout=LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise HostThrottled(host, 1)
+            time.sleep(POLL_INTERVAL / 10)
+        try:
+            yield
+        finally:
+            # The entry may have expired and been taken by another process
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def reserve_token(self, host: str, rate: float, burst: float) -> float:
+        """
+        Takes a token from the bucket of the host, the bucket can go
+        negative, the caller then waits for its reserved token
+        Args:
+            host: Host with port
+            rate: Tokens added per second
+            burst: Bucket size
+
+        Returns: float, seconds to wait before sending the request
+
+        Raises:
+            HostThrottled if the wait would exceed `max_wait`
+
+        """
+        key = f"{KEY_PREFIX}:bucket:{host}"
+        with self._locked(host):
+            now = time.time()
+            tokens, updated = self.cache.get(key) or (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate) - 1
+            wait = -tokens / rate if tokens < 0 else 0.0
+            if wait > self.max_wait:
+                raise HostThrottled(host, wait)
+            timeout = int(burst / rate + self.max_wait) + 60
+            self.cache.set(key, (tokens, now), timeout=timeout)
+        return wait
+
+    def backoff(self, url: str, seconds: float):
+        """
+        Stops requesting the host of the url for `seconds`
+        Args:
+            url: Throttled url
+            seconds: Back off delay, Retry-After value
+
+        """
+        _, host = get_host(url)
+        until = time.time() + seconds
+        key = f"{KEY_PREFIX}:backoff:{host}"
+        if until > (self.cache.get(key) or 0):
+            self.cache.set(key, until, timeout=int(seconds) + 1)
+
+    def backoff_remaining(self, host: str) -> float:
+        """
+        Args:
+            host: Host with port
+
+        Returns: float, seconds left before the host can be requested
+
+        """
+        until = self.cache.get(f"{KEY_PREFIX}:backoff:{host}") or 0
+        return max(until - time.time(), 0.0)
+
+    def acquire_slot(self, host: str, deadline: float) -> str:
+        """
+        Takes one of the `concurrency` slots of the host, slots expire
+        after the request timeout in case the holder crashed
+        Args:
+            host: Host with port
+            deadline: `time.monotonic()` value to give up at
+
+        Returns: str, cache key of the slot
+
+        Raises:
+            HostThrottled if no slot was freed before the deadline
+
+        """
+        timeout = (
+            int(
+                settings.SCRAPPER_HTTP_CONNECT_TIMEOUT
+                + settings.SCRAPPER_HTTP_READ_TIMEOUT
+            )
+            + 5
+        )
+        while True:
+            for i in range(self.concurrency):
+                key = f"{KEY_PREFIX}:slot:{host}:{i}"
+                if self.cache.add(key, uuid.uuid4().hex, timeout=timeout):
+                    return key
+            if time.monotonic() > deadline:
+                raise HostThrottled(host, self.max_wait)
+            time.sleep(POLL_INTERVAL)
+
+    @contextmanager
+    def request(self, url: str, get: Callable) -> Iterator[None]:
+        """
+        Waits until the url can be requested and holds a host slot
+        while the request runs
+        Args:
+            url: Requested url
+            get: Callable sending a GET request, used for robots.txt
+
+        Raises:
+            RobotsDisallowed if robots.txt disallows the url
+            HostThrottled if the host can not be requested in time
+
+        """
+        _, host = get_host(url)
+        deadline = time.monotonic() + self.max_wait
+        rate, burst = self.rate, self.burst
+        if settings.SCRAPPER_ROBOTS_TXT:
+            parser = self.robots.get_parser(url, get)
+            if not parser.can_fetch(settings.SCRAPPER_USER_AGENT, url):
+                raise RobotsDisallowed(f"{url} is disallowed by robots.txt")
+            delay = parser.crawl_delay(settings.SCRAPPER_USER_AGENT)
+            if delay:
+                delay_rate = 1 / float(delay)
+                rate = min(rate, delay_rate) if rate > 0 else delay_rate
+                burst = 1
+        remaining = self.backoff_remaining(host)
+        if remaining > self.max_wait:
+            raise HostThrottled(host, remaining)
+        time.sleep(remaining)
+        if rate > 0:
+            time.sleep(self.reserve_token(host, rate, burst))
+        slot = self.acquire_slot(host, deadline)
+        try:
+            yield
+        finally:
+            self.cache.delete(slot)
+
+
+_scheduler: Optional[PolitenessScheduler] = None
+
+
+def get_scheduler() -> PolitenessScheduler:
+    """
+    Returns: Process wide PolitenessScheduler
+
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PolitenessScheduler()
+    return _scheduler
+
+
+@receiver(setting_changed)
+def reset_scheduler(setting: str, **kwargs):
+    """
+    Rebuilds the scheduler when its settings are overridden, in tests
+    """
+    global _scheduler
+    if setting.startswith(("SCRAPPER_HOST_", "SCRAPPER_POLITENESS")):
+        _scheduler = None
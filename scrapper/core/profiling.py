@@ -0,0 +1,223 @@
+"""
+On demand request profiling for staff users, profiles are kept in a
+bounded on disk ring buffer
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import re
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_PARAM = "profile"
+PROFILE_ID_RE = re.compile(r"^[0-9]+-[0-9a-f]{8}$")
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries and their duration
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class ProfileStore:
+    """
+    Saves `pstats` dumps and their metadata (`<id>.prof`, `<id>.json`)
+    in `SCRAPPER_PROFILE_DIR`, the oldest profiles are removed once
+    `SCRAPPER_PROFILE_LIMIT` is exceeded
+    """
+
+    def __init__(
+        self, directory: Optional[str] = None, limit: Optional[int] = None
+    ):
+        self.directory = Path(directory or settings.SCRAPPER_PROFILE_DIR)
+        self.limit = (
+            settings.SCRAPPER_PROFILE_LIMIT if limit is None else limit
+        )
+
+    def ids(self) -> List[str]:
+        """
+        Returns: List[str], stored profile IDs, newest first
+
+        """
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (path.stem for path in self.directory.glob("*.json")),
+            reverse=True,
+        )
+
+    def path(self, profile_id: str) -> Optional[Path]:
+        """
+        Args:
+            profile_id: Profile ID
+
+        Returns: Path | None, path of the `pstats` dump, None if the ID
+                 is malformed or the profile was removed
+
+        """
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}.prof"
+        return path if path.is_file() else None
+
+    def save(self, profiler: cProfile.Profile, meta: dict) -> str:
+        """
+        Args:
+            profiler: Finished profiler
+            meta: Request metadata
+
+        Returns: str, profile ID
+
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = (
+            f"{time.time_ns()}-{threading.get_ident() & 0xFFFFFFFF:08x}"
+        )
+        profiler.dump_stats(self.directory / f"{profile_id}.prof")
+        # The metadata is written last, listed profiles are complete
+        (self.directory / f"{profile_id}.json").write_text(
+            json.dumps({"id": profile_id, **meta})
+        )
+        self.trim()
+        return profile_id
+
+    def trim(self):
+        """
+        Removes the profiles exceeding the limit, oldest first
+        """
+        for profile_id in self.ids()[self.limit :]:
+            for suffix in (".json", ".prof"):
+                (self.directory / f"{profile_id}{suffix}").unlink(
+                    missing_ok=True
+                )
+
+    def list(self) -> List[dict]:
+        """
+        Returns: List of dictionary, metadata of the stored profiles,
+                 newest first
+
+        """
+        profiles = []
+        for profile_id in self.ids():
+            try:
+                profiles.append(
+                    json.loads(
+                        (self.directory / f"{profile_id}.json").read_text()
+                    )
+                )
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def summary(self, profile_id: str, limit: int = 40) -> Optional[str]:
+        """
+        Args:
+            profile_id: Profile ID
+            limit: Number of functions listed
+
+        Returns: str | None, functions with the highest cumulative time
+
+        """
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(str(path), stream=out).sort_stats(
+            pstats.SortKey.CUMULATIVE
+        ).print_stats(limit)
+        return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request with `cProfile` when a staff user sends the
+    `X-Profile` header or the `?profile` query parameter. The profile is
+    saved along with the SQL query count and time, and a `Server-Timing`
+    header reports the timings and the profile ID.
+    Only one request is profiled at a time per process, concurrent flagged
+    requests are served with the `Server-Timing` header only
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def is_requested(request: HttpRequest) -> bool:
+        """
+        Args:
+            request: HttpRequest, authenticated by the session
+
+        Returns: bool, True if a staff user asked for a profile
+
+        """
+        if PROFILE_HEADER not in request.headers and (
+            PROFILE_PARAM not in request.GET
+        ):
+            return False
+        user = getattr(request, "user", None)
+        return bool(user and user.is_active and user.is_staff)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if not self.is_requested(request):
+            return self.get_response(request)
+        queries = QueryCounter()
+        profiler = cProfile.Profile() if self._lock.acquire(False) else None
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                if profiler is None:
+                    response = self.get_response(request)
+                else:
+                    response = profiler.runcall(self.get_response, request)
+        finally:
+            if profiler is not None:
+                self._lock.release()
+        duration = time.perf_counter() - start
+        timings = [
+            f"total;dur={duration * 1000:.1f}",
+            f'sql;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"',
+        ]
+        if profiler is not None:
+            profile_id = ProfileStore().save(
+                profiler,
+                {
+                    "method": request.method,
+                    "path": request.get_full_path(),
+                    "status": response.status_code,
+                    "user": request.user.get_username(),
+                    "duration_ms": round(duration * 1000, 1),
+                    "sql_count": queries.count,
+                    "sql_ms": round(queries.seconds * 1000, 1),
+                    "created": timezone.now().isoformat(),
+                },
+            )
+            timings.append(f'profile;desc="{profile_id}"')
+        response["Server-Timing"] = ", ".join(timings)
+        return response
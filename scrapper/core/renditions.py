@@ -0,0 +1,394 @@
+"""
+Encoding and persistent on disk cache of image renditions
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from django.conf import settings
+from PIL import Image as PilImage
+
+from scrapper.core.metrics import RENDITION_CACHE
+from scrapper.core.resize import resize
+
+try:
+    import fcntl
+except ImportError:  # Windows, single flight is per process only
+    fcntl = None
+
+
+class RenditionKey(NamedTuple):
+    """
+
+    Identifies an encoded rendition of a stored image
+
+    Attributes:
+        `pk`: Image ID
+        `width`: Output width in px
+        `height`: Output height in px
+        `format`: Output format, Example: 'jpeg', 'webp'
+        `quality`: Output encoder quality
+
+    """
+
+    pk: int
+    width: int
+    height: int
+    format: str
+    quality: int
+
+    @property
+    def file_name(self) -> str:
+        """
+
+        Returns: Cache file name of the rendition
+
+        """
+        return f"{self.width}x{self.height}-q{self.quality}.{self.format}"
+
+
+class RenditionCache:
+    """
+    Stores encoded renditions on disk, grouped by image ID so every
+    rendition of an image can be dropped at once.
+    The cache is bounded by a size budget, the least recently used
+    renditions (oldest modification time, refreshed on every hit) are
+    evicted once the budget is exceeded.
+    Concurrent requests for the same missing rendition are coalesced,
+    only one of them renders it while the others wait for the file
+
+    Attributes:
+        `directory`: Cache directory
+        `max_bytes`: Size budget of the cache in bytes
+
+    """
+
+    # Eviction frees the cache down to this ratio of the budget
+    low_watermark = 0.9
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+        # Lock of every rendered key and the number of threads using it
+        self._key_locks: Dict[RenditionKey, List] = {}
+
+    @property
+    def directory(self) -> Path:
+        if self._directory is not None:
+            return Path(self._directory)
+        if settings.SCRAPPER_RENDITION_CACHE_DIR:
+            return Path(settings.SCRAPPER_RENDITION_CACHE_DIR)
+        return Path(settings.MEDIA_ROOT) / "renditions"
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.SCRAPPER_RENDITION_CACHE_MAX_BYTES
+
+    def path(self, key: RenditionKey) -> Path:
+        """
+        Args:
+            key: RenditionKey
+
+        Returns: Path of the cached rendition file
+
+        """
+        return self.directory / str(key.pk) / key.file_name
+
+    def get(self, key: RenditionKey) -> Optional[bytes]:
+        """
+        Reads a cached rendition and marks it as recently used
+        Args:
+            key: RenditionKey
+
+        Returns: bytes | None, None if the rendition is not cached
+
+        """
+        path = self.path(key)
+        try:
+            content = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return content
+
+    def get_or_create(
+        self, key: RenditionKey, render: Callable[[], bytes]
+    ) -> bytes:
+        """
+        Returns the cached rendition, renders and stores it
+        if it is not cached yet
+        Args:
+            key: RenditionKey
+            render: Callable returning the encoded rendition
+
+        Returns: bytes, encoded rendition
+
+        """
+        content = self.get(key)
+        if content is not None:
+            RENDITION_CACHE.inc(result="hit")
+            return content
+        with self._single_flight(key):
+            # Rendered by another request while waiting for the lock
+            content = self.get(key)
+            if content is not None:
+                RENDITION_CACHE.inc(result="hit")
+                return content
+            RENDITION_CACHE.inc(result="miss")
+            content = render()
+            self._write(key, content)
+        return content
+
+    def invalidate(self, pk: int):
+        """
+        Removes every cached rendition of an image
+        Args:
+            pk: Image ID
+
+        """
+        shutil.rmtree(self.directory / str(pk), ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+    def clear(self):
+        """
+        Removes every cached rendition
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        with self._lock:
+            self._size = None
+
+    @contextmanager
+    def _single_flight(self, key: RenditionKey):
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+                path = self.path(key)
+                with self._lock_file(path.with_name(f"{path.name}.lock")):
+                    yield
+        finally:
+            with self._lock:
+                # Dropped once no other thread waits on it
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    @staticmethod
+    @contextmanager
+    def _lock_file(lock_path: Path):
+        """
+        Exclusive lock shared by every process using the directory.
+        The file is removed by its holder, a process locking a removed
+        file (unlinked by the previous holder or by `invalidate`)
+        opens the new file and locks it again
+        Args:
+            lock_path: Path of the lock file
+
+        """
+        while True:
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            lock_file = open(lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(lock_path).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current == os.fstat(lock_file.fileno()).st_ino:
+                    try:
+                        yield
+                    finally:
+                        lock_path.unlink(missing_ok=True)
+                    return
+            finally:
+                # Closing the file releases the lock
+                lock_file.close()
+
+    def _write(self, key: RenditionKey, content: bytes):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and moved, readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(content)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is not None:
+                self._size += len(content)
+            over_budget = self._size is None or self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """
+        Scans the cache directory and removes the least recently used
+        renditions until the cache fits in the size budget
+        """
+        files = []
+        for path in self.directory.glob("*/*"):
+            if path.suffix in (".lock", ".tmp"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        size = sum(file_size for _, file_size, _ in files)
+        if size > self.max_bytes:
+            target = self.max_bytes * self.low_watermark
+            for _, file_size, path in sorted(files, key=lambda f: f[0]):
+                if size <= target:
+                    break
+                path.unlink(missing_ok=True)
+                size -= file_size
+        with self._lock:
+            self._size = size
+
+
+_cache = RenditionCache()
+
+
+def get_rendition_cache() -> RenditionCache:
+    """
+    Returns: Process wide RenditionCache
+
+    """
+    return _cache
+
+
+def encode_rendition(
+    source: Union[bytes, str, BinaryIO],
+    size: Tuple[int, int],
+    img_format: str,
+    quality: int = 100,
+) -> bytes:
+    """
+    Resizes and encodes an image, the image is never upscaled
+    Args:
+        source: Encoded original image, bytes, file path or file object
+        size: Output (width, height) in px
+        img_format: Output format, Example: 'jpeg', 'webp'
+        quality: Output encoder quality
+
+    Returns: bytes, encoded rendition
+
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    if img_format == "jpg":
+        img_format = "jpeg"
+    pil_image = resize(PilImage.open(source), size)
+    if img_format == "jpeg" and pil_image.mode not in ("RGB", "L", "CMYK"):
+        # JPEG has no alpha channel nor palette
+        pil_image = pil_image.convert("RGB")
+    file_bytes = BytesIO()
+    pil_image.save(file_bytes, img_format.upper(), quality=quality)
+    return file_bytes.getvalue()
+
+
+def render_renditions(
+    content: bytes, keys: List[RenditionKey]
+) -> List[Tuple[Optional[bytes], str]]:
+    """
+    Encodes several renditions of an image, runs in the rendition
+    process pool so the original is sent once per image. A failing
+    rendition (e.g. a format without encoder) does not stop the others
+    Args:
+        content: Encoded original image
+        keys: Renditions to encode
+
+    Returns: List of (encoded rendition, "") or (None, error message),
+             in the order of `keys`
+
+    """
+    results = []
+    for key in keys:
+        try:
+            results.append(
+                (
+                    encode_rendition(
+                        content,
+                        (key.width, key.height),
+                        key.format,
+                        key.quality,
+                    ),
+                    "",
+                )
+            )
+        except Exception as e:
+            results.append((None, f"{e.__class__.__name__}: {e}"))
+    return results
+
+
+class InlineExecutor(Executor):
+    """
+    Runs the submitted calls in the calling process
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+_pool: Optional[Executor] = None
+_pool_lock = threading.Lock()
+
+
+def get_rendition_pool() -> Executor:
+    """
+    Returns the process wide pool encoding the precomputed renditions,
+    `SCRAPPER_RENDITION_WORKERS` processes started with `spawn`.
+    Daemonic processes, e.g. the default Celery prefork workers, can not
+    start child processes, the renditions are then encoded inline
+
+    Returns: Executor
+
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if (
+                settings.SCRAPPER_RENDITION_WORKERS < 1
+                or multiprocessing.current_process().daemon
+            ):
+                _pool = InlineExecutor()
+            else:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.SCRAPPER_RENDITION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return _pool
@@ -0,0 +1,279 @@
+"""
+Image resize engine, large downscales are reduced at decode time
+"""
+
+import multiprocessing
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from PIL import Image as PilImage
+
+
+class ResizePreset(NamedTuple):
+    """
+
+    Speed / quality trade off of the resize engine
+
+    Attributes:
+        `name`: Preset name used by `SCRAPPER_RESIZE_PRESET`
+        `resample`: Resampling filter of the final resize
+        `reducing_gap`: The image is first reduced by an integer factor,
+                        at decode time for JPEG (draft mode) and with
+                        `reduce()` otherwise, down to `reducing_gap` times
+                        the output size. None decodes and resamples the
+                        full resolution image
+
+    """
+
+    name: str
+    resample: int
+    reducing_gap: Optional[float]
+
+
+PRESETS: Dict[str, ResizePreset] = {
+    preset.name: preset
+    for preset in (
+        ResizePreset("fast", PilImage.Resampling.BILINEAR, 1.5),
+        ResizePreset("balanced", PilImage.Resampling.BICUBIC, 2.0),
+        ResizePreset("quality", PilImage.Resampling.LANCZOS, 3.0),
+        ResizePreset("exact", PilImage.Resampling.LANCZOS, None),
+    )
+}
+
+
+def get_preset(name: Optional[str] = None) -> ResizePreset:
+    """
+    Args:
+        name: Preset name, defaults to `SCRAPPER_RESIZE_PRESET`
+
+    Returns: ResizePreset
+
+    """
+    return PRESETS[name or settings.SCRAPPER_RESIZE_PRESET]
+
+
+# Modes `Image.reduce()` supports, the other modes are converted first
+REDUCE_MODES = (
+    "L",
+    "LA",
+    "La",
+    "PA",
+    "RGB",
+    "RGBA",
+    "RGBa",
+    "RGBX",
+    "CMYK",
+    "YCbCr",
+    "LAB",
+    "HSV",
+    "I",
+    "F",
+)
+
+
+def reducible(pil_image: PilImage.Image) -> PilImage.Image:
+    """
+    Converts an image to a mode supported by `Image.reduce()`, palette
+    images (GIF, most PNG) keep their transparency
+    Args:
+        pil_image: Loaded image
+
+    Returns: Image, the image itself if its mode is supported
+
+    """
+    if pil_image.mode in REDUCE_MODES:
+        return pil_image
+    if pil_image.mode == "P":
+        has_alpha = "transparency" in pil_image.info
+        return pil_image.convert("RGBA" if has_alpha else "RGB")
+    if pil_image.mode == "1":
+        return pil_image.convert("L")
+    if pil_image.mode.startswith("I;16"):
+        return pil_image.convert("I")
+    return pil_image.convert("RGBA")
+
+
+def resize(
+    pil_image: PilImage.Image,
+    size: Tuple[int, int],
+    preset: Optional[ResizePreset] = None,
+) -> PilImage.Image:
+    """
+    Resizes a lazily opened image, the image is never upscaled.
+    For JPEG the decoder is switched to draft mode first, the DCT scaling
+    decodes 1/2, 1/4 or 1/8 of the pixels, so a 256px thumbnail of a
+    6000px photo decodes a 750px image. Other formats are decoded in full
+    and reduced by an integer factor before the final resampling
+    Args:
+        pil_image: Image returned by `PIL.Image.open`, not loaded yet
+        size: Output (width, height) in px
+        preset: ResizePreset, defaults to `SCRAPPER_RESIZE_PRESET`
+
+    Returns: Image, resized image
+
+    """
+    preset = preset or get_preset()
+    # Extreme aspect ratios round a side down to 0, keep at least 1px
+    size = width, height = max(int(size[0]), 1), max(int(size[1]), 1)
+    if width >= pil_image.width and height >= pil_image.height:
+        return pil_image
+    gap = preset.reducing_gap
+    if gap is not None:
+        reduced = (max(int(width * gap), 1), max(int(height * gap), 1))
+        pil_image.draft(None, reduced)
+    pil_image.load()
+    if gap is not None:
+        factor = min(
+            pil_image.width // reduced[0],
+            pil_image.height // reduced[1],
+        )
+        if factor > 1:
+            pil_image = reducible(pil_image).reduce(factor)
+    return pil_image.resize(size, preset.resample)
+
+
+def generate_fixtures(
+    width: int = 6000,
+    height: int = 4000,
+    formats: Iterable[str] = ("JPEG", "PNG", "WEBP"),
+) -> Dict[str, bytes]:
+    """
+    Generates large photo like images for benchmarks
+    Args:
+        width: Image width in px
+        height: Image height in px
+        formats: Encoded formats
+
+    Returns: Dictionary, encoded image by format
+
+    """
+    gradient = PilImage.radial_gradient("L").resize((width, height))
+    pil_image = PilImage.merge(
+        "RGB",
+        (
+            gradient,
+            gradient.transpose(PilImage.Transpose.FLIP_LEFT_RIGHT),
+            gradient,
+        ),
+    )
+    fixtures = {}
+    for img_format in formats:
+        file_bytes = BytesIO()
+        pil_image.save(file_bytes, img_format)
+        fixtures[img_format.lower()] = file_bytes.getvalue()
+    return fixtures
+
+
+def get_peak_rss(reset: bool = False) -> Optional[int]:
+    """
+    Reads the peak resident memory of the process from procfs, the
+    rusage counter can not be used as it is inherited from the parent
+    Args:
+        reset: Resets the peak to the current resident memory first
+
+    Returns: int | None, peak resident memory in KB, None if unknown
+             (not Linux)
+
+    """
+    try:
+        if reset:
+            with open("/proc/self/clear_refs", "w") as clear_refs:
+                clear_refs.write("5")
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def measure(content: bytes, width: int, preset_name: str, repeat: int) -> dict:
+    """
+    Measures one rendition, runs in a fresh process so the peak resident
+    memory belongs to this rendition only. Pillow allocates the pixels
+    outside of the Python allocator, tracemalloc only reports the Python
+    objects
+    Args:
+        content: Encoded original image
+        width: Output width in px
+        preset_name: ResizePreset name
+        repeat: Number of runs, the best run is kept
+
+    Returns: Dictionary, latency and memory of the rendition
+
+    """
+    preset = PRESETS[preset_name]
+    rss_before = get_peak_rss(reset=True)
+    timings = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pil_image = PilImage.open(BytesIO(content))
+        original_size = pil_image.size
+        output_size = (
+            width,
+            max(round(original_size[1] * width / original_size[0]), 1),
+        )
+        resized = resize(pil_image, output_size, preset)
+        resized.save(BytesIO(), "JPEG", quality=85)
+        timings.append(time.perf_counter() - start)
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = get_peak_rss()
+    return {
+        "seconds": min(timings),
+        "decoded_pixels": pil_image.width * pil_image.height,
+        "original_pixels": original_size[0] * original_size[1],
+        "peak_rss_mb": (
+            (rss_after - rss_before) / 1024
+            if rss_before is not None and rss_after is not None
+            else None
+        ),
+        "python_peak_mb": python_peak / 1e6,
+    }
+
+
+def benchmark(
+    fixtures: Dict[str, bytes],
+    widths: Iterable[int] = (256, 1024, 2048),
+    presets: Optional[Iterable[str]] = None,
+    repeat: int = 3,
+) -> List[dict]:
+    """
+    Compares the resize presets on every fixture and output width
+    Args:
+        fixtures: Encoded images by name, `generate_fixtures` output
+        widths: Output widths in px
+        presets: Preset names, defaults to every preset
+        repeat: Number of runs per rendition, the best run is kept
+
+    Returns: List of dictionary, one result per fixture, width and preset
+
+    """
+    presets = list(presets or PRESETS)
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name, content in fixtures.items():
+        for width in widths:
+            for preset_name in presets:
+                with ProcessPoolExecutor(
+                    max_workers=1, mp_context=context
+                ) as pool:
+                    result = pool.submit(
+                        measure, content, width, preset_name, repeat
+                    ).result()
+                results.append(
+                    {
+                        "fixture": name,
+                        "bytes": len(content),
+                        "width": width,
+                        "preset": preset_name,
+                        **result,
+                    }
+                )
+    return results
@@ -1,10 +1,16 @@
+import time
+from typing import List, Optional, Tuple
+
+from django.conf import settings
 from django.core.exceptions import ValidationError as DjangoValidationError
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
+from django.urls import reverse
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from scrapper.core.models import Address, Image
-from scrapper.core.utils import validate_url
+from scrapper.core.models import Address, Image, ScrapeJob
+from scrapper.core.pagination import KeysetPagination
+from scrapper.core.utils import hash_url, normalize_url, validate_url
 
 
 class URLBaseSerializer(serializers.Serializer):
@@ -42,8 +48,62 @@ class URLBaseSerializer(serializers.Serializer):
 class URLCreateSerializer(URLBaseSerializer):
     """
     This serializer performs `Address.save_url_with_images`
+    When `mode` is `job` the view enqueues a ScrapeJob instead
     """
 
+    MODE_SYNC = "sync"
+    MODE_JOB = "job"
+
+    mode = serializers.ChoiceField(
+        choices=[MODE_SYNC, MODE_JOB], default=MODE_SYNC, required=False
+    )
+    # Crawl limits, a crawl runs as a job
+    max_depth = serializers.IntegerField(min_value=0, default=0)
+    max_pages = serializers.IntegerField(min_value=1, default=100)
+    same_domain = serializers.BooleanField(default=True)
+
+    @staticmethod
+    def validate_max_depth(value: int) -> int:
+        if value > settings.SCRAPPER_CRAWL_MAX_DEPTH:
+            raise ValidationError(
+                f"Must be at most {settings.SCRAPPER_CRAWL_MAX_DEPTH}"
+            )
+        return value
+
+    @staticmethod
+    def validate_max_pages(value: int) -> int:
+        if value > settings.SCRAPPER_CRAWL_MAX_PAGES:
+            raise ValidationError(
+                f"Must be at most {settings.SCRAPPER_CRAWL_MAX_PAGES}"
+            )
+        return value
+
+    def validate(self, attrs: dict) -> dict:
+        if attrs.get("max_depth") and attrs.get("mode") != self.MODE_JOB:
+            raise ValidationError(
+                {"mode": "A crawl (max_depth > 0) runs as a job"}
+            )
+        return attrs
+
+    def create_job(self) -> ScrapeJob:
+        """
+        Creates a pending ScrapeJob for the validated url
+
+        Returns: ScrapeJob
+
+        """
+        # The Address post_save normalizer only updates the instance,
+        # the job must refer to the row of the normalized url
+        address, created = Address.objects.get_or_create(
+            url=normalize_url(self.validated_data.get("url"))
+        )
+        return ScrapeJob.objects.create(
+            address=address,
+            max_depth=self.validated_data["max_depth"],
+            max_pages=self.validated_data["max_pages"],
+            same_domain=self.validated_data["same_domain"],
+        )
+
     def create(self, validated_data) -> QuerySet[Image]:
         """
 
@@ -94,7 +154,147 @@ class ImageOriginalURLQuerySerializer(URLBaseSerializer):
     """
 
     def create(self, validated_data):
-        return Image.objects.filter(original_url=validated_data.get("url"))
+        url = validated_data.get("url")
+        # The digest index narrows the lookup, the url check guards
+        # against digest collisions
+        return Image.objects.filter(
+            original_url_hash=hash_url(url), original_url=url
+        )
+
+
+class SitemapIngestSerializer(URLBaseSerializer):
+    """
+    Validates a sitemap ingest request, the sitemap is read
+    in a Celery worker
+    """
+
+    scrape = serializers.BooleanField(default=True)
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+    @staticmethod
+    def validate_limit(value: int) -> int:
+        if value > settings.SCRAPPER_SITEMAP_MAX_URLS:
+            raise ValidationError(
+                f"Must be at most {settings.SCRAPPER_SITEMAP_MAX_URLS}"
+            )
+        return value
+
+
+class ImageSearchSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the image search,
+    every filter is optional and the filters are combined.
+    `image_format` and `mode` accept comma separated values, the format
+    filter is not named `format` which selects the DRF response renderer
+
+    Attributes:
+        `SORT_FIELDS`: Columns the results can be sorted on
+
+    """
+
+    SORT_FIELDS = ["created", "width", "height", "aspect_ratio", "file_size"]
+    # Column lookup of every range filter, the bounds are inclusive
+    RANGE_FILTERS = {
+        "min_width": "width__gte",
+        "max_width": "width__lte",
+        "min_height": "height__gte",
+        "max_height": "height__lte",
+        "min_aspect_ratio": "aspect_ratio__gte",
+        "max_aspect_ratio": "aspect_ratio__lte",
+        "min_size": "file_size__gte",
+        "max_size": "file_size__lte",
+        "created_after": "created__gte",
+        "created_before": "created__lte",
+    }
+
+    min_width = serializers.IntegerField(min_value=0, required=False)
+    max_width = serializers.IntegerField(min_value=0, required=False)
+    min_height = serializers.IntegerField(min_value=0, required=False)
+    max_height = serializers.IntegerField(min_value=0, required=False)
+    min_aspect_ratio = serializers.FloatField(min_value=0, required=False)
+    max_aspect_ratio = serializers.FloatField(min_value=0, required=False)
+    min_size = serializers.IntegerField(
+        min_value=0, required=False, help_text="File size in bytes"
+    )
+    max_size = serializers.IntegerField(
+        min_value=0, required=False, help_text="File size in bytes"
+    )
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    image_format = serializers.CharField(
+        required=False, help_text="Example: `JPEG,PNG`"
+    )
+    mode = serializers.CharField(required=False, help_text="Example: `RGB`")
+    domain = serializers.CharField(
+        required=False, help_text="Host name of the parent url"
+    )
+    sort = serializers.ChoiceField(
+        choices=SORT_FIELDS + [f"-{name}" for name in SORT_FIELDS],
+        default="-created",
+    )
+
+    def validate(self, attrs: dict) -> dict:
+        """
+        Checks every lower bound is below its upper bound
+        Args:
+            attrs: Validated query parameters
+
+        Returns: dict, validated query parameters
+
+        """
+        for lower, upper in (
+            ("min_width", "max_width"),
+            ("min_height", "max_height"),
+            ("min_aspect_ratio", "max_aspect_ratio"),
+            ("min_size", "max_size"),
+            ("created_after", "created_before"),
+        ):
+            if (
+                attrs.get(lower) is not None
+                and attrs.get(upper) is not None
+                and attrs[lower] > attrs[upper]
+            ):
+                raise ValidationError({lower: f"Must not exceed {upper}"})
+        return attrs
+
+    @staticmethod
+    def split(value: str) -> List[str]:
+        return [item.strip() for item in value.split(",") if item.strip()]
+
+    def get_ordering(self) -> Tuple[str, str]:
+        """
+
+        Returns: Keyset ordering, the sort column and the ID as tie breaker
+
+        """
+        sort = self.validated_data["sort"]
+        return sort, "-id" if sort.startswith("-") else "id"
+
+    def search(self) -> QuerySet:
+        """
+
+        Returns: Image Queryset matching every given filter
+
+        """
+        data = self.validated_data
+        condition = Q(
+            **{
+                lookup: data[name]
+                for name, lookup in self.RANGE_FILTERS.items()
+                if data.get(name) is not None
+            }
+        )
+        if data.get("image_format"):
+            condition &= Q(
+                format__in=[
+                    item.upper() for item in self.split(data["image_format"])
+                ]
+            )
+        if data.get("mode"):
+            condition &= Q(mode__in=self.split(data["mode"]))
+        if data.get("domain"):
+            condition &= Q(parent_url__domain=data["domain"].strip().lower())
+        return Image.objects.filter(condition)
 
 
 class AddressSerializer(serializers.ModelSerializer):
@@ -117,7 +317,27 @@ class AddressSerializer(serializers.ModelSerializer):
         fields = ["id", "url"]
 
 
-class ImageSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Serializes only the fields listed in the `fields` query parameter,
+    Example: `?fields=id,image_url`
+    """
+
+    fields_query_param = "fields"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None:
+            return
+        requested = request.GET.get(self.fields_query_param, "")
+        requested = {name.strip() for name in requested.split(",")} - {""}
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+class ImageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Attributes:
         image_url: Sends the image viewing URL
@@ -144,8 +364,248 @@ class ImageSerializer(serializers.ModelSerializer):
             "original_url",
             "height",
             "width",
+            "aspect_ratio",
+            "file_size",
             "mode",
             "format",
             "created",
             "updated",
         ]
+
+
+class ImagePageSerializer(serializers.Serializer):
+    """
+    Documents a page of the keyset paginated image lists,
+    the rows have the `ImageSerializer` fields
+    """
+
+    next = serializers.URLField(allow_null=True)
+    cursor = serializers.CharField(allow_null=True)
+    results = ImageSerializer(many=True)
+
+
+class ScrapeJobSerializer(serializers.ModelSerializer):
+    """
+    Attributes:
+        url: Scrapped URL
+        status_url: Job status link
+        images: First page of the saved images, available when the job
+                has succeeded
+        images_next: Job status link of the next page of images
+
+    """
+
+    url = serializers.CharField(source="address.url", read_only=True)
+    status_url = serializers.HyperlinkedIdentityField(
+        view_name="job-detail-view", lookup_field="pk"
+    )
+    images = serializers.SerializerMethodField()
+    images_next = serializers.SerializerMethodField()
+
+    class Meta:
+        """
+        Serializer Meta Class
+        """
+
+        model = ScrapeJob
+        fields = [
+            "id",
+            "url",
+            "status",
+            "status_url",
+            "pages_fetched",
+            "images_saved",
+            "failures",
+            "error",
+            "max_depth",
+            "max_pages",
+            "same_domain",
+            "images",
+            "images_next",
+            "created",
+            "updated",
+        ]
+
+    def get_image_page(self, job: ScrapeJob) -> Tuple[list, Optional[str]]:
+        """
+        Reads one page of the images of the address once the job has
+        succeeded, the `cursor` query parameter of the job status link
+        selects the page
+        Args:
+            job: ScrapeJob instance
+
+        Returns: (serialized images, next page link or None)
+
+        """
+        if job.status != ScrapeJob.Status.SUCCESS:
+            return [], None
+        if getattr(self, "_image_page", (None,))[0] != job.pk:
+            request = self.context["request"]
+            paginator = KeysetPagination()
+            rows = paginator.paginate_queryset(
+                ImageRowSerializer.values(
+                    Image.get_queryset_by_url(job.address)
+                ),
+                request,
+            )
+            paginator.next_url = request.build_absolute_uri(
+                reverse("job-detail-view", kwargs={"pk": job.pk})
+            )
+            next_link = paginator.get_next_link()
+            images = ImageRowSerializer(request).serialize(rows)
+            self._image_page = (job.pk, images, next_link)
+        return self._image_page[1], self._image_page[2]
+
+    def get_images(self, job: ScrapeJob) -> list:
+        return self.get_image_page(job)[0]
+
+    def get_images_next(self, job: ScrapeJob) -> Optional[str]:
+        return self.get_image_page(job)[1]
+
+
+class ImageRowSerializer:
+    """
+    Read only fast path of `ImageSerializer` for list responses.
+    Rows are read with `values()` and turned into dictionaries directly,
+    the image url is built from a template computed once per request
+    instead of calling `reverse()` for every row. The output is the same
+    as `ImageSerializer`, including the `fields` query parameter
+
+    Attributes:
+        `columns`: Columns read from the database, parent url joined
+
+    """
+
+    columns = [
+        "id",
+        "image_name",
+        "parent_url_id",
+        "parent_url__url",
+        "original_url",
+        "height",
+        "width",
+        "aspect_ratio",
+        "file_size",
+        "mode",
+        "format",
+        "created",
+        "updated",
+    ]
+    # Placeholder primary key used to build the image url template
+    url_placeholder = 987654321
+
+    def __init__(self, request):
+        self.request = request
+        url = request.build_absolute_uri(
+            reverse("image-view", kwargs={"pk": self.url_placeholder})
+        )
+        self.url_prefix, self.url_suffix = url.split(
+            str(self.url_placeholder), 1
+        )
+        self.datetime_field = serializers.DateTimeField()
+        fields = ImageSerializer.Meta.fields
+        requested = request.GET.get(SparseFieldsetMixin.fields_query_param, "")
+        requested = {name.strip() for name in requested.split(",")} - {""}
+        self.fields = [
+            name for name in fields if not requested or name in requested
+        ]
+
+    @classmethod
+    def values(cls, queryset: QuerySet) -> QuerySet:
+        """
+        Args:
+            queryset: Image Queryset
+
+        Returns: QuerySet of dictionaries with the serialized columns
+
+        """
+        return queryset.values(*cls.columns)
+
+    def to_representation(self, row: dict) -> dict:
+        """
+        Args:
+            row: Dictionary returned by `values()`
+
+        Returns: dict, same as `ImageSerializer.data`
+
+        """
+        to_datetime = self.datetime_field.to_representation
+        data = {
+            "id": row["id"],
+            "image_url": f"{self.url_prefix}{row['id']}{self.url_suffix}",
+            "image_name": row["image_name"],
+            "parent_url": (
+                {"id": row["parent_url_id"], "url": row["parent_url__url"]}
+                if row["parent_url_id"] is not None
+                else None
+            ),
+            "original_url": row["original_url"],
+            "height": row["height"],
+            "width": row["width"],
+            "aspect_ratio": row["aspect_ratio"],
+            "file_size": row["file_size"],
+            "mode": row["mode"],
+            "format": row["format"],
+            "created": to_datetime(row["created"]),
+            "updated": to_datetime(row["updated"]),
+        }
+        if len(self.fields) == len(data):
+            return data
+        return {name: data[name] for name in self.fields}
+
+    def serialize(self, rows) -> List[dict]:
+        """
+        Args:
+            rows: Dictionaries returned by `values()`
+
+        Returns: List of serialized images
+
+        """
+        return [self.to_representation(row) for row in rows]
+
+
+def benchmark(queryset: QuerySet, request, repeat: int = 3) -> List[dict]:
+    """
+    Compares `ImageSerializer` and `ImageRowSerializer` on a queryset
+    Args:
+        queryset: Image Queryset
+        request: Request used to build the image urls
+        repeat: Number of runs, the best run is kept
+
+    Returns: List of dictionary, rows per second of every serializer
+
+    """
+    queryset = queryset.order_by("-created", "-id")
+
+    def model_serializer() -> list:
+        return ImageSerializer(
+            queryset.select_related("parent_url"),
+            many=True,
+            context={"request": request},
+        ).data
+
+    def row_serializer() -> list:
+        return ImageRowSerializer(request).serialize(
+            ImageRowSerializer.values(queryset)
+        )
+
+    results = []
+    for name, serialize in (
+        ("ImageSerializer", model_serializer),
+        ("ImageRowSerializer", row_serializer),
+    ):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = len(serialize())
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append(
+            {
+                "serializer": name,
+                "rows": rows,
+                "seconds": best,
+                "rows_per_second": rows / best if best else 0.0,
+            }
+        )
+    return results
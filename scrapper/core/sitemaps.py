@@ -0,0 +1,229 @@
+"""
+Sitemap ingest, discovers the pages of a site from its sitemap.xml,
+sitemap indexes and gzipped sitemaps are parsed incrementally
+"""
+
+import gzip
+import io
+import logging
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+from celery import group
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from scrapper.core.crawl import VisitedSet
+from scrapper.core.http_client import get_http_client
+from scrapper.core.models import Address, ScrapeJob
+from scrapper.core.utils import check_if_valid_url, get_domain, normalize_url
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+SITEMAP_INDEX = "sitemapindex"
+URL_SET = "urlset"
+
+
+def local_name(tag: str) -> str:
+    """
+    Args:
+        tag: ElementTree tag, `{namespace}name` or `name`
+
+    Returns: str, tag name without the namespace
+
+    """
+    return tag.rpartition("}")[2]
+
+
+def open_sitemap(response: requests.Response) -> io.BufferedIOBase:
+    """
+    Wraps the body of a streamed response, gzipped sitemaps (`.xml.gz`
+    served without `Content-Encoding`) are decompressed on the fly
+    Args:
+        response: Response of a `stream=True` request
+
+    Returns: Binary file object of the XML document
+
+    """
+    response.raw.decode_content = True
+    # The buffered reader reads until EOF, the raw stream must stay open
+    response.raw.auto_close = False
+    stream = io.BufferedReader(response.raw)
+    if stream.peek(len(GZIP_MAGIC))[: len(GZIP_MAGIC)] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def parse_sitemap(stream) -> Iterator[tuple]:
+    """
+    Parses a sitemap or a sitemap index without building the tree,
+    every entry is dropped once its `<loc>` has been read
+    Args:
+        stream: Binary file object of the XML document
+
+    Returns: Iterator of (`urlset` or `sitemapindex`, location)
+
+    Raises:
+        ElementTree.ParseError if the document is not a valid sitemap
+
+    """
+    kind, root = None, None
+    for event, element in ElementTree.iterparse(stream, ("start", "end")):
+        name = local_name(element.tag)
+        if event == "start":
+            if root is None:
+                if name not in (URL_SET, SITEMAP_INDEX):
+                    raise ElementTree.ParseError(f"<{name}> is not a sitemap")
+                kind, root = name, element
+            continue
+        if name == "loc" and element.text:
+            yield kind, element.text.strip()
+        elif name in ("url", "sitemap"):
+            root.clear()
+
+
+def iter_sitemap_urls(
+    sitemap_url: str,
+    get: Optional[Callable] = None,
+    max_files: Optional[int] = None,
+    stats: Optional[Dict[str, int]] = None,
+) -> Iterator[str]:
+    """
+    Yields the page urls of a sitemap, the sitemaps listed by sitemap
+    indexes are read one after the other. Only the urls of the sitemap
+    host are kept, as required by the sitemap protocol
+    Args:
+        sitemap_url: Absolute url of the sitemap or sitemap index
+        get: Callable sending a GET request, the HTTP client by default
+        max_files: Maximum number of sitemaps read,
+                   defaults to `SCRAPPER_SITEMAP_MAX_FILES`
+        stats: Optional dictionary, the number of read and failed
+               sitemaps are added to `sitemaps` and `errors`
+
+    Returns: Iterator of page urls, in sitemap order
+
+    Raises:
+        ValidationError if the first sitemap can not be read
+
+    """
+    get = get or get_http_client().get
+    max_files = max_files or settings.SCRAPPER_SITEMAP_MAX_FILES
+    stats = stats if stats is not None else {}
+    stats.setdefault("sitemaps", 0)
+    stats.setdefault("errors", 0)
+    domain = get_domain(sitemap_url)
+    queue = deque([sitemap_url])
+    seen = {sitemap_url}
+    while queue and stats["sitemaps"] < max_files:
+        url = queue.popleft()
+        stats["sitemaps"] += 1
+        try:
+            with get(url, stream=True) as response:
+                response.raise_for_status()
+                for kind, location in parse_sitemap(open_sitemap(response)):
+                    if get_domain(location) != domain:
+                        continue
+                    if kind == URL_SET:
+                        yield location
+                    elif kind == SITEMAP_INDEX and location not in seen:
+                        seen.add(location)
+                        queue.append(location)
+        except (
+            requests.RequestException,
+            ElementTree.ParseError,
+            OSError,
+            EOFError,
+        ) as e:
+            if url == sitemap_url:
+                raise ValidationError(f"Sitemap can not be read: {e}")
+            stats["errors"] += 1
+            logger.info("Skipping unreadable sitemap %s: %s", url, e)
+
+
+def ingest_sitemap(
+    sitemap_url: str,
+    scrape: bool = True,
+    batch_size: Optional[int] = None,
+    limit: Optional[int] = None,
+    get: Optional[Callable] = None,
+) -> Dict[str, int]:
+    """
+    Stores every page of a sitemap as an Address, the addresses are
+    inserted `batch_size` at a time and every batch is enqueued as
+    one group of `scrape_url` ScrapeJobs
+    Args:
+        sitemap_url: Absolute url of the sitemap or sitemap index
+        scrape: Enqueues a ScrapeJob per page
+        batch_size: Urls per batch, defaults to `SCRAPPER_SITEMAP_BATCH_SIZE`
+        limit: Maximum number of pages, defaults to
+               `SCRAPPER_SITEMAP_MAX_URLS`
+        get: Callable sending a GET request, the HTTP client by default
+
+    Returns: Dictionary with the number of read sitemaps, unreadable
+             sitemaps, pages, new addresses and enqueued jobs
+
+    Raises:
+        ValidationError if the sitemap can not be read
+
+    """
+    batch_size = batch_size or settings.SCRAPPER_SITEMAP_BATCH_SIZE
+    limit = limit or settings.SCRAPPER_SITEMAP_MAX_URLS
+    max_length = Address._meta.get_field("url").max_length
+    stats = {"sitemaps": 0, "errors": 0, "urls": 0, "created": 0, "jobs": 0}
+    visited = VisitedSet()
+    batch: List[str] = []
+    for location in iter_sitemap_urls(sitemap_url, get=get, stats=stats):
+        url = normalize_url(location)
+        if (
+            len(url) > max_length
+            or not check_if_valid_url(url)
+            or not visited.add(url)
+        ):
+            continue
+        batch.append(url)
+        stats["urls"] += 1
+        if len(batch) >= batch_size:
+            save_batch(batch, scrape, stats)
+            batch = []
+        if stats["urls"] >= limit:
+            break
+    if batch:
+        save_batch(batch, scrape, stats)
+    return stats
+
+
+def save_batch(urls: List[str], scrape: bool, stats: Dict[str, int]):
+    """
+    Bulk inserts the new addresses of a batch and enqueues their scrapes,
+    the `pre_save` signals do not run so the domain is set here
+    Args:
+        urls: Normalized page urls
+        scrape: Enqueues a ScrapeJob per page
+        stats: `ingest_sitemap` counters
+
+    """
+    from scrapper.core.tasks import scrape_url
+
+    existing = set(
+        Address.objects.filter(url__in=urls).values_list("url", flat=True)
+    )
+    new = [
+        Address(url=url, domain=get_domain(url))
+        for url in urls
+        if url not in existing
+    ]
+    Address.objects.bulk_create(new, ignore_conflicts=True)
+    stats["created"] += len(new)
+    if not scrape:
+        return
+    address_ids = Address.objects.filter(url__in=urls).values_list(
+        "pk", flat=True
+    )
+    jobs = ScrapeJob.objects.bulk_create(
+        ScrapeJob(address_id=address_id) for address_id in address_ids
+    )
+    group(scrape_url.s(str(job.pk)) for job in jobs).apply_async()
+    stats["jobs"] += len(jobs)
@@ -0,0 +1,196 @@
+"""
+Streaming of stored files with byte range and sendfile support
+"""
+
+import re
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.files import File
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.utils.http import parse_http_date_safe
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """
+    The requested byte range is outside the file
+    """
+
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a `Range` header, only single ranges are supported, a multi
+    range or malformed header is ignored and the full file is sent
+    Args:
+        header: Range header value, Example: 'bytes=0-1023', 'bytes=-500'
+        size: File size in bytes
+
+    Returns: (start, end) | None, inclusive byte positions,
+             None to send the full file
+
+    Raises:
+        RangeNotSatisfiable if the range starts after the end of the file
+
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range, the last `end` bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable
+    if end < start:
+        return None
+    return start, end
+
+
+def is_range_valid(
+    request: HttpRequest, etag: str, last_modified: int
+) -> bool:
+    """
+    Evaluates `If-Range`, a range is only served if the client copy
+    matches the current file, otherwise the full file is sent
+    Args:
+        request: HttpRequest
+        etag: Quoted strong ETag of the file
+        last_modified: Last modification timestamp of the file
+
+    Returns: bool, True if the `Range` header must be honored
+
+    """
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def iter_file_range(file: File, start: int, length: int):
+    """
+    Reads a byte range of a file in blocks and closes the file
+    Args:
+        file: Opened file
+        start: First byte position
+        length: Number of bytes
+
+    Returns: Generator of bytes
+
+    """
+    try:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+def get_sendfile_response(
+    name: str, path: Optional[str]
+) -> Optional[HttpResponse]:
+    """
+    Delegates the file transfer to the web server when
+    `SCRAPPER_SENDFILE` is set, the web server then handles the
+    byte ranges itself
+    Args:
+        name: Storage name of the file
+        path: Absolute path of the file, None for remote storages
+
+    Returns: HttpResponse | None, None if sendfile is not configured
+
+    """
+    backend = settings.SCRAPPER_SENDFILE
+    if backend == "x-accel-redirect":
+        response = HttpResponse()
+        response["X-Accel-Redirect"] = (
+            f"{settings.SCRAPPER_SENDFILE_PREFIX.rstrip('/')}/{name}"
+        )
+        return response
+    if backend == "x-sendfile" and path is not None:
+        response = HttpResponse()
+        response["X-Sendfile"] = path
+        return response
+    return None
+
+
+def serve_file(
+    request: HttpRequest,
+    field_file,
+    content_type: str,
+    etag: str,
+    last_modified: int,
+) -> HttpResponse:
+    """
+    Sends a stored file without loading it in memory, answers `Range`
+    requests with `206 Partial Content` or `416 Range Not Satisfiable`.
+    Full files are sent through the WSGI file wrapper, which gunicorn
+    turns into a `sendfile()` call
+    Args:
+        request: HttpRequest
+        field_file: FieldFile of the stored file
+        content_type: Response Content-Type
+        etag: Quoted strong ETag of the file
+        last_modified: Last modification timestamp of the file
+
+    Returns: HttpResponse
+
+    """
+    try:
+        path = field_file.path
+    except NotImplementedError:
+        path = None
+    response = get_sendfile_response(field_file.name, path)
+    if response is not None:
+        response["Content-Type"] = content_type
+        return response
+    size = field_file.size
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if (
+        range_header
+        and request.method == "GET"
+        and is_range_valid(request, etag, last_modified)
+    ):
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+    if byte_range is None:
+        response = FileResponse(
+            field_file.open("rb"), content_type=content_type
+        )
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            iter_file_range(field_file.open("rb"), start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -3,11 +3,146 @@ Note:
     The bottom usage/features is just implemented but due to complexity to setup
     To check the usage of celery, must install Redis
 """
-from celery import shared_task
+import logging
+from typing import List, Optional
 
-from scrapper.core.models import Address
+from celery import group, shared_task
+from django.core.exceptions import ValidationError
+
+from scrapper.core.models import Address, Image, Rendition, ScrapeJob, SyncRun
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_sync_chunk(run: SyncRun):
+    """
+    Sends the next chunk of addresses of a SyncRun to the workers
+    as a group of `sync_address` subtasks, finishes the run when
+    every address has been synced
+    Args:
+        run: SyncRun instance
+
+    """
+    address_ids = run.next_chunk()
+    if not address_ids:
+        run.finish()
+        logger.info("Image sync finished: %s", run.summary())
+        return
+    chunk = run.start_chunk(address_ids)
+    group(
+        sync_address.s(run.pk, chunk, address_id) for address_id in address_ids
+    ).apply_async()
+
+
+@shared_task()
+def sync_images(run_id: Optional[int] = None) -> int:
+    """
+    Starts a new SyncRun, or resumes an interrupted one
+    from its last completed chunk
+    Args:
+        run_id: SyncRun ID to resume
+
+    Returns: int, SyncRun ID
+
+    """
+    if run_id is None:
+        run = SyncRun.objects.create()
+    else:
+        run = SyncRun.objects.get(pk=run_id)
+    dispatch_sync_chunk(run)
+    return run.pk
+
+
+@shared_task()
+def sync_address(run_id: int, chunk: int, address_id: int) -> dict:
+    """
+    Syncs a single address of a SyncRun, the last address
+    of a chunk dispatches the next chunk
+    Args:
+        run_id: SyncRun ID
+        chunk: Sequence number of the chunk
+        address_id: Address ID
+
+    Returns: Dictionary, `Address.sync_address` result
+
+    """
+    result = {
+        "address": address_id,
+        "new_images": 0,
+        "error": "Sync failed",
+        "seconds": 0.0,
+    }
+    try:
+        result = Address.sync_address(address_id)
+    finally:
+        # The address is always completed, so the next chunk is dispatched
+        run = SyncRun.objects.get(pk=run_id)
+        if run.complete_address(chunk, result):
+            dispatch_sync_chunk(run)
+    return result
+
+
+@shared_task()
+def scrape_url(job_id: str):
+    """
+    Runs a ScrapeJob, the progress and the failure are stored in the job
+    Args:
+        job_id: ScrapeJob ID
+
+    """
+    job = ScrapeJob.objects.select_related("address").get(pk=job_id)
+    try:
+        job.run()
+    except ValidationError:
+        pass
+
+
+@shared_task()
+def ingest_sitemap(
+    sitemap_url: str, scrape: bool = True, limit: Optional[int] = None
+) -> dict:
+    """
+    Stores the pages of a sitemap and enqueues their scrapes in batches
+    Args:
+        sitemap_url: Absolute url of the sitemap or sitemap index
+        scrape: Enqueues a ScrapeJob per page
+        limit: Maximum number of pages
+
+    Returns: Dictionary, `sitemaps.ingest_sitemap` counters
+
+    """
+    from scrapper.core.sitemaps import ingest_sitemap as ingest
+
+    try:
+        stats = ingest(sitemap_url, scrape=scrape, limit=limit)
+    except ValidationError as e:
+        logger.warning("Sitemap ingest of %s failed: %s", sitemap_url, e)
+        return {"error": " ".join(e.messages)}
+    logger.info("Sitemap ingest of %s finished: %s", sitemap_url, stats)
+    return stats
+
+
+@shared_task()
+def delete_files(file_names: List[str]) -> int:
+    """
+    Removes the files of deleted images and renditions
+    Args:
+        file_names: Storage names
+
+    Returns: int, number of removed files
+
+    """
+    return Image.delete_files(file_names)
 
 
 @shared_task()
-def sync_images():
-    Address.sync_url_images()
+def precompute_renditions(image_ids: List[int]) -> int:
+    """
+    Encodes the preset renditions of newly stored images
+    Args:
+        image_ids: Image IDs
+
+    Returns: int, number of stored renditions
+
+    """
+    return Rendition.precompute(image_ids)
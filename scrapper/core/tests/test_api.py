@@ -1,21 +1,50 @@
+import json
 import shutil
 import tempfile
 from io import BytesIO
+from unittest import mock
+from urllib.parse import urlparse
 
+from django.contrib.auth.models import User
 from django.test import Client
 from django.urls import reverse
 from PIL import Image as PILImage
-from rest_framework.test import APITestCase, override_settings
+from rest_framework.request import Request
+from rest_framework.test import (
+    APIRequestFactory,
+    APITestCase,
+    override_settings,
+)
 
-from scrapper.core.models import Image
+from scrapper.core.benchmarks.origin import OriginServer
+from scrapper.core.metrics import (
+    REGISTRY,
+    RENDITION_CACHE,
+    SCRAPE_STAGE_SECONDS,
+)
+from scrapper.core.models import Address, Image, ScrapeJob
+from scrapper.core.renditions import get_rendition_cache
+from scrapper.core.serializers import ImageRowSerializer, ImageSerializer
+from scrapper.core.tests.utils import (
+    PAGE_URL,
+    CeleryEagerMixin,
+    create_image,
+    fake_get,
+)
 
 MEDIA_ROOT = tempfile.mkdtemp()
 
 
 @override_settings(MEDIA_ROOT=MEDIA_ROOT)
-class TestAPI(APITestCase):
+class TestAPI(CeleryEagerMixin, APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.origin = OriginServer(images=3, formats=("jpeg", "png")).start()
+
     @classmethod
     def tearDownClass(cls):
+        cls.origin.stop()
         shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
         super().tearDownClass()
 
@@ -23,10 +52,92 @@ class TestAPI(APITestCase):
         """
         Test API To Return Status Code 200
         """
-        test_url = "https://picsum.photos/"
+        test_url = self.origin.page_url()
         url = reverse("url-view")
         resp = self.client.post(url, {"url": test_url})
         self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["results"]), 3)
+
+    def test_url_api_next_page(self):
+        """
+        Test the next page of a scrape is read from the stored images,
+        the url is not scrapped again
+        """
+        test_url = self.origin.page_url()
+        resp = self.client.post(
+            f"{reverse('url-view')}?page_size=2", {"url": test_url}
+        )
+        self.assertEqual(len(resp.data["results"]), 2)
+        next_url = urlparse(resp.data["next"])
+        self.assertEqual(next_url.path, reverse("image-list-view"))
+        self.assertIn("page_size=2", next_url.query)
+        requests_before = self.origin.requests
+        resp = self.client.post(resp.data["next"], {"url": test_url})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(resp.data["results"]), 1)
+        self.assertIsNone(resp.data["next"])
+        self.assertEqual(self.origin.requests, requests_before)
+
+    @override_settings(SCRAPPER_METRICS=True)
+    def test_metrics(self):
+        """
+        Test the pipeline metrics are exposed to staff users only
+        """
+        REGISTRY.reset()
+        get_rendition_cache().clear()
+        image, url = self.get_image_and_url()
+        self.client.get(url, {"width": "8", "format": "png"})
+        self.client.get(url, {"width": "8", "format": "png"})
+        metrics_url = reverse("metrics-view")
+        self.assertIn(self.client.get(metrics_url).status_code, (401, 403))
+        self.client.force_login(
+            User.objects.create_user("staff", password="staff", is_staff=True)
+        )
+        resp = self.client.get(metrics_url)
+        self.assertEqual(resp.status_code, 200)
+        body = resp.content.decode()
+        self.assertIn(
+            'scrapper_scrape_stage_seconds_count{stage="download"} 3', body
+        )
+        self.assertIn('scrapper_rendition_cache_total{result="hit"} 1', body)
+        self.assertIn('scrapper_rendition_cache_total{result="miss"} 1', body)
+        self.assertIn(
+            'scrapper_image_view_seconds_count{source="rendition"} 2', body
+        )
+        with override_settings(SCRAPPER_METRICS=False):
+            self.assertEqual(self.client.get(metrics_url).status_code, 404)
+
+    @override_settings(SCRAPPER_METRICS=True)
+    def test_metrics_processes(self):
+        """
+        Test the metrics of every process sharing the cache are summed
+        and the metrics of stopped processes are dropped
+        """
+        REGISTRY.reset()
+        RENDITION_CACHE.inc(result="hit")
+        SCRAPE_STAGE_SECONDS.observe(0.2, stage="parse")
+        worker = REGISTRY.snapshot()
+        REGISTRY.store.save("worker", worker)
+        REGISTRY.store.cache.set(
+            REGISTRY.store.processes_key,
+            REGISTRY.store.get_processes() | {"stopped"},
+            None,
+        )
+        body = REGISTRY.expose()
+        self.assertIn('scrapper_rendition_cache_total{result="hit"} 2', body)
+        self.assertIn(
+            'scrapper_scrape_stage_seconds_count{stage="parse"} 2', body
+        )
+        self.assertIn(
+            'scrapper_scrape_stage_seconds_bucket{stage="parse",le="+Inf"} 2',
+            body,
+        )
+        self.assertNotIn("stopped", REGISTRY.store.get_processes())
+        REGISTRY.store.cache.delete(REGISTRY.store.snapshot_key("worker"))
+        REGISTRY.expose()
+        self.assertEqual(
+            REGISTRY.store.get_processes(), {REGISTRY.store.process_id}
+        )
 
     def test_url_api_fail(self):
         """
@@ -50,6 +161,275 @@ class TestAPI(APITestCase):
         image, url = self.get_image_and_url()
         client = Client()
         resp = client.get(url)
-        img = PILImage.open(BytesIO(resp.content))
+        img = PILImage.open(BytesIO(b"".join(resp.streaming_content)))
         self.assertAlmostEqual(img.height, image.height)
         self.assertAlmostEqual(img.width, image.width)
+
+    @mock.patch(
+        "scrapper.core.http_client.ScrapperHTTPClient.get",
+        side_effect=fake_get,
+    )
+    def test_url_api_job(self, _):
+        """
+        Test job mode returns the job right away and reports the progress
+        """
+        resp = self.client.post(
+            reverse("url-view"), {"url": PAGE_URL, "mode": "job"}
+        )
+        self.assertEqual(resp.status_code, 202)
+        job_url = reverse("job-detail-view", kwargs={"pk": resp.data["id"]})
+        resp = self.client.get(job_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["status"], ScrapeJob.Status.SUCCESS)
+        self.assertEqual(resp.data["pages_fetched"], 1)
+        self.assertEqual(resp.data["images_saved"], 2)
+        self.assertEqual(resp.data["failures"], 1)
+        self.assertEqual(len(resp.data["images"]), 2)
+        # The images are paginated through the job status link
+        resp = self.client.get(job_url, {"page_size": 1})
+        self.assertEqual(len(resp.data["images"]), 1)
+        resp = self.client.get(resp.data["images_next"])
+        self.assertEqual(len(resp.data["images"]), 1)
+        self.assertIsNone(resp.data["images_next"])
+
+    def test_url_api_job_fail(self):
+        """
+        Test a job of an unreachable url is reported as failed
+        """
+        resp = self.client.post(
+            reverse("url-view"),
+            {"url": "http://abcdefg.test.test/xyz/", "mode": "job"},
+        )
+        self.assertEqual(resp.status_code, 202)
+        job = ScrapeJob.objects.get(pk=resp.data["id"])
+        self.assertEqual(job.status, ScrapeJob.Status.FAILURE)
+
+    def test_url_api_crawl(self):
+        """
+        Test a crawl job follows the same site links up to max_depth
+        """
+        with OriginServer(images=2, pages=5) as origin:
+            base_url = origin.base_url
+            resp = self.client.post(
+                reverse("url-view"),
+                {
+                    "url": f"{base_url}//gallery/0",
+                    "mode": "job",
+                    "max_depth": 2,
+                },
+            )
+        self.assertEqual(resp.status_code, 202)
+        job = ScrapeJob.objects.get(pk=resp.data["id"])
+        self.assertEqual(job.status, ScrapeJob.Status.SUCCESS)
+        self.assertEqual(job.pages_fetched, 3)
+        self.assertEqual(job.images_saved, 6)
+        self.assertEqual(len(resp.data["images"]), 2)
+        self.assertEqual(
+            Address.objects.filter(url__startswith=base_url).count(), 3
+        )
+
+    def test_sitemap_ingest(self):
+        """
+        Test the pages of a sitemap index are stored and scrapped,
+        external urls are skipped
+        """
+        sitemap_url = reverse("sitemap-view")
+        with OriginServer(images=1, pages=4) as origin:
+            base_url = origin.base_url
+            payload = {"url": origin.sitemap_url()}
+            resp = self.client.post(sitemap_url, payload)
+            self.assertIn(resp.status_code, (401, 403))
+            self.client.force_login(
+                User.objects.create_user("staff", is_staff=True)
+            )
+            resp = self.client.post(sitemap_url, payload)
+        self.assertEqual(resp.status_code, 202)
+        self.assertIn("task_id", resp.data)
+        addresses = Address.objects.filter(url__startswith=base_url)
+        self.assertEqual(addresses.count(), 4)
+        self.assertEqual(
+            set(addresses.values_list("domain", flat=True)), {"127.0.0.1"}
+        )
+        self.assertFalse(Address.objects.filter(domain="external.example.com"))
+        jobs = ScrapeJob.objects.filter(address__in=addresses)
+        self.assertEqual(
+            list(jobs.values_list("status", flat=True).distinct()),
+            [ScrapeJob.Status.SUCCESS],
+        )
+        self.assertEqual(
+            Image.objects.filter(parent_url__in=addresses).count(), 4
+        )
+
+    def test_url_api_crawl_requires_job(self):
+        resp = self.client.post(
+            reverse("url-view"), {"url": PAGE_URL, "max_depth": 1}
+        )
+        self.assertEqual(resp.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestImageListAPI(APITestCase):
+    def setUp(self):
+        self.images = [create_image(name=f"{i}.png") for i in range(5)]
+
+    def test_keyset_pagination(self):
+        """
+        Test pages follow (-created, -id) without gaps or duplicates
+        """
+        url = f"{reverse('image-list-view')}?page_size=2"
+        ids = []
+        while url:
+            with self.assertNumQueries(1):
+                resp = self.client.post(url, {"url": PAGE_URL})
+            self.assertEqual(resp.status_code, 200)
+            self.assertLessEqual(len(resp.data["results"]), 2)
+            ids += [image["id"] for image in resp.data["results"]]
+            url = resp.data["next"]
+        self.assertEqual(ids, [image.pk for image in reversed(self.images)])
+
+    def test_invalid_cursor(self):
+        """
+        Test an invalid cursor returns 404
+        """
+        resp = self.client.post(
+            f"{reverse('image-list-view')}?cursor=abc", {"url": PAGE_URL}
+        )
+        self.assertEqual(resp.status_code, 404)
+
+    def test_sparse_fieldset(self):
+        """
+        Test only the requested fields are serialized
+        """
+        resp = self.client.post(
+            f"{reverse('image-query-view')}?fields=id,width",
+            {"url": self.images[0].original_url},
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            resp.data["results"], [{"id": self.images[0].pk, "width": 400}]
+        )
+
+    def test_row_serializer_matches_model_serializer(self):
+        """
+        Test the fast list serializer has the same output as ImageSerializer
+        """
+        Image.objects.filter(pk=self.images[0].pk).update(parent_url=None)
+        request = Request(APIRequestFactory().get("/api/images/list/"))
+        queryset = Image.objects.order_by("id")
+        expected = ImageSerializer(
+            queryset, many=True, context={"request": request}
+        ).data
+        rows = ImageRowSerializer(request).serialize(
+            ImageRowSerializer.values(queryset)
+        )
+        self.assertEqual(json.dumps(rows), json.dumps(expected))
+        request = Request(
+            APIRequestFactory().get("/api/images/list/?fields=id,image_url")
+        )
+        self.assertEqual(
+            ImageRowSerializer(request).serialize(
+                ImageRowSerializer.values(queryset)
+            ),
+            ImageSerializer(
+                queryset, many=True, context={"request": request}
+            ).data,
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestImageSearchAPI(APITestCase):
+    def setUp(self):
+        self.small = create_image(fmt="PNG", size=(100, 100), name="s.png")
+        self.wide = create_image(fmt="JPEG", size=(800, 400), name="w.jpg")
+        self.tall = create_image(fmt="JPEG", size=(300, 600), name="t.jpg")
+
+    def search(self, **params):
+        return self.client.get(reverse("image-search-view"), params)
+
+    def test_search_filters(self):
+        """
+        Test the metadata filters are combined
+        """
+        self.assertEqual(self.wide.aspect_ratio, 2)
+        self.assertGreater(self.wide.file_size, 0)
+        resp = self.search(image_format="jpeg", min_width=500)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [image["id"] for image in resp.data["results"]], [self.wide.pk]
+        )
+        resp = self.search(max_aspect_ratio=1, domain="www.example.com")
+        self.assertEqual(
+            {image["id"] for image in resp.data["results"]},
+            {self.small.pk, self.tall.pk},
+        )
+        resp = self.search(domain="cdn.example.com")
+        self.assertEqual(resp.data["results"], [])
+
+    def test_search_sort_pagination(self):
+        """
+        Test the results follow the sort column across pages
+        """
+        ids = []
+        params = {"sort": "-width", "page_size": 2}
+        while True:
+            resp = self.search(**params)
+            ids += [image["id"] for image in resp.data["results"]]
+            if resp.data["cursor"] is None:
+                break
+            params["cursor"] = resp.data["cursor"]
+        self.assertEqual(ids, [self.wide.pk, self.tall.pk, self.small.pk])
+
+    def test_search_invalid_range(self):
+        """
+        Test a lower bound above its upper bound returns 400
+        """
+        resp = self.search(min_width=500, max_width=100)
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("min_width", resp.data)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, SCRAPPER_PROFILE_LIMIT=2)
+class TestProfiling(APITestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.settings = override_settings(
+            SCRAPPER_PROFILE_DIR=self.profile_dir
+        )
+        self.settings.enable()
+        self.image = create_image()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def test_profile_staff_only(self):
+        """
+        Test only staff requests are profiled, the last profiles are kept
+        """
+        url = reverse("image-view", kwargs={"pk": self.image.id})
+        resp = self.client.get(url, HTTP_X_PROFILE="1")
+        self.assertNotIn("Server-Timing", resp)
+        self.client.force_login(
+            User.objects.create_user("staff", password="staff", is_staff=True)
+        )
+        for _ in range(3):
+            resp = self.client.get(url, {"profile": "1", "width": "8"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("sql;dur=", resp["Server-Timing"])
+        self.assertIn("profile;desc=", resp["Server-Timing"])
+        resp = self.client.get(reverse("profile-list"))
+        profiles = resp.context["profiles"]
+        self.assertEqual(len(profiles), 2)
+        self.assertGreaterEqual(profiles[0]["sql_count"], 1)
+        download_url = reverse(
+            "profile-download", kwargs={"profile_id": profiles[0]["id"]}
+        )
+        resp = self.client.get(download_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("attachment", resp["Content-Disposition"])
+        resp = self.client.get(download_url, {"summary": ""})
+        self.assertIn(b"cumulative", resp.content)
+        resp = self.client.get(
+            reverse("profile-download", kwargs={"profile_id": "..%2Fsecret"})
+        )
+        self.assertEqual(resp.status_code, 404)
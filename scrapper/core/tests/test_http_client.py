@@ -0,0 +1,137 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import SimpleTestCase, override_settings
+
+from scrapper.core.benchmarks.origin import OriginServer
+from scrapper.core.http_client import ScrapperHTTPClient
+from scrapper.core.politeness import (
+    KEY_PREFIX,
+    HostThrottled,
+    PolitenessScheduler,
+    RobotsDisallowed,
+    parse_retry_after,
+)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = self.headers.get("User-Agent", "").encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPClient(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    @override_settings(SCRAPPER_ROBOTS_TXT=False)
+    def test_connection_reuse(self):
+        """
+        Test connections are kept alive and reused for the same host
+        """
+        client = ScrapperHTTPClient(user_agent="test-agent")
+        for i in range(5):
+            resp = client.get(f"{self.base_url}/{i}.png")
+            self.assertEqual(resp.text, "test-agent")
+        stats = client.pool_stats()[
+            f"http://127.0.0.1:{self.server.server_port}"
+        ]
+        client.close()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["hit_rate"], 0.8)
+
+
+class TestPoliteness(SimpleTestCase):
+    def test_token_bucket(self):
+        """
+        Test requests over the burst wait for their reserved token
+        """
+        scheduler = PolitenessScheduler(rate=20, burst=2, max_wait=1)
+        host = f"bucket-{time.time_ns()}.example.com"
+        waits = [scheduler.reserve_token(host, 20, 2) for _ in range(3)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.05, delta=0.01)
+        with self.assertRaises(HostThrottled):
+            for _ in range(30):
+                scheduler.reserve_token(host, 20, 2)
+
+    def test_bucket_lock(self):
+        """
+        Test the bucket is not updated without its lock and the lock
+        of another process is kept
+        """
+        scheduler = PolitenessScheduler(rate=20, burst=2)
+        host = f"lock-{time.time_ns()}.example.com"
+        key = f"{KEY_PREFIX}:lock:{host}"
+        scheduler.cache.set(key, "other", timeout=5)
+        with self.assertRaises(HostThrottled):
+            scheduler.reserve_token(host, 20, 2)
+        self.assertEqual(scheduler.cache.get(key), "other")
+        scheduler.cache.delete(key)
+        self.assertEqual(scheduler.reserve_token(host, 20, 2), 0.0)
+        self.assertIsNone(scheduler.cache.get(key))
+
+    def test_concurrency_slots(self):
+        """
+        Test a host slot is released after the request
+        """
+        scheduler = PolitenessScheduler(concurrency=1)
+        host = f"slots-{time.time_ns()}.example.com"
+        slot = scheduler.acquire_slot(host, time.monotonic())
+        with self.assertRaises(HostThrottled):
+            scheduler.acquire_slot(host, time.monotonic())
+        scheduler.cache.delete(slot)
+        scheduler.acquire_slot(host, time.monotonic())
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("120", 5), 120)
+        self.assertEqual(parse_retry_after(None, 5), 5)
+        self.assertEqual(parse_retry_after("soon", 5), 5)
+        self.assertEqual(
+            parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", 5), 0
+        )
+
+    def test_retry_after_throttle(self):
+        """
+        Test a 429 response backs off the host and the request is retried
+        """
+        with OriginServer(throttle=1) as origin:
+            client = ScrapperHTTPClient()
+            resp = client.get(origin.image_url(0))
+            client.close()
+        self.assertEqual(resp.status_code, 200)
+        # robots.txt, throttled request, retry
+        self.assertEqual(origin.requests, 3)
+
+    def test_robots_txt(self):
+        """
+        Test robots.txt rules are honored and cached
+        """
+        robots = "User-agent: *\nDisallow: /images/\nCrawl-delay: 1"
+        with OriginServer(robots=robots) as origin:
+            client = ScrapperHTTPClient()
+            with self.assertRaises(RobotsDisallowed):
+                client.get(origin.image_url(0))
+            self.assertEqual(client.get(origin.page_url()).status_code, 200)
+            client.close()
+        self.assertEqual(origin.requests, 2)
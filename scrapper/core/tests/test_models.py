@@ -1,17 +1,38 @@
 import shutil
 import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 from urllib.parse import urlparse
 
+import requests
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.test import TestCase, override_settings
+from PIL import Image as PILImage
 
-from scrapper.core.models import Address, Image
+from scrapper.core.benchmarks import compare, run_pipeline
+from scrapper.core.benchmarks.origin import OriginServer
+from scrapper.core.crawl import Crawler, normalize_link
+from scrapper.core.downloader import ImageDownloader
+from scrapper.core.models import Address, Image, SyncRun
+from scrapper.core.sitemaps import ingest_sitemap
+from scrapper.core.tasks import sync_images
+from scrapper.core.tests.utils import (
+    PAGE_URL,
+    CeleryEagerMixin,
+    FakeResponse,
+    fake_get,
+    make_image_bytes,
+)
+from scrapper.core.utils import hash_url
 
 MEDIA_ROOT = tempfile.mkdtemp()
 
 
 @override_settings(MEDIA_ROOT=MEDIA_ROOT)
-class TestCoreModels(TestCase):
+class TestCoreModels(CeleryEagerMixin, TestCase):
     @classmethod
     def tearDownClass(cls):
         shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
@@ -48,5 +69,310 @@ class TestCoreModels(TestCase):
         """
         Test web scrapping model save method
         """
-        test_url = "https://picsum.photos/"
-        Image.save_multiple_images(Address.objects.create(url=test_url))
+        with OriginServer(images=4, formats=("jpeg", "png", "webp")) as origin:
+            address = Address.objects.create(url=origin.page_url())
+            images = Image.save_multiple_images(address)
+        self.assertEqual(images.count(), 4)
+        self.assertEqual(
+            set(images.values_list("format", flat=True)),
+            {"JPEG", "PNG", "WEBP"},
+        )
+
+    @mock.patch(
+        "scrapper.core.http_client.ScrapperHTTPClient.get",
+        side_effect=fake_get,
+    )
+    def test_save_multiple_images(self, _):
+        """
+        Test concurrent download saves every valid image of the page
+        """
+        address = Address.objects.create(url=PAGE_URL)
+        images = Image.save_multiple_images(address)
+        self.assertEqual(images.count(), 2)
+        self.assertEqual(
+            set(images.values_list("original_url", flat=True)),
+            {f"{PAGE_URL}/a.png", f"{PAGE_URL}/b.jpg"},
+        )
+        self.assertEqual(
+            set(images.values_list("format", flat=True)), {"PNG", "JPEG"}
+        )
+
+    def test_crawl_relative_links(self):
+        """
+        Test page relative links are resolved against the final url
+        of the page, after its redirect
+        """
+        index_url = "https://site.com/gallery/index.html"
+        pages = {
+            index_url: (
+                b'<a href="page2.html">2</a><a href="../x">x</a>'
+                b'<a href="#top">top</a>'
+            ),
+            "https://site.com/gallery/page2.html": (
+                b'<img src="https://cdn.site.com/a.png"/>'
+            ),
+            "https://site.com/x": b"<html></html>",
+        }
+
+        def get(url, *args, **kwargs):
+            if url == "https://site.com/gallery":
+                url = index_url
+            if url in pages:
+                return FakeResponse(pages[url], url=url)
+            return FakeResponse(make_image_bytes(), url=url)
+
+        with mock.patch(
+            "scrapper.core.http_client.ScrapperHTTPClient.get",
+            side_effect=get,
+        ) as http_get:
+            crawler = Crawler(max_depth=1)
+            crawler.crawl(
+                Address.objects.create(url="https://site.com/gallery")
+            )
+        self.assertEqual(
+            normalize_link("page2.html", index_url),
+            "https://site.com/gallery/page2.html",
+        )
+        self.assertEqual(crawler.pages, 3)
+        self.assertEqual(
+            {call.args[0] for call in http_get.call_args_list},
+            {
+                "https://site.com/gallery",
+                "https://site.com/gallery/page2.html",
+                "https://cdn.site.com/a.png",
+                "https://site.com/x",
+            },
+        )
+
+    def test_downloader_limits(self):
+        """
+        Test downloader keeps order and respects the per host limit
+        """
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fetch(url):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            return url
+
+        urls = [f"https://cdn.example.com/{i}.png" for i in range(12)]
+        result = list(
+            ImageDownloader(max_workers=8, per_host=2).download(urls, fetch)
+        )
+        self.assertEqual(result, urls)
+        self.assertLessEqual(peak[0], 2)
+
+    @override_settings(SCRAPPER_SYNC_CHUNK_SIZE=2)
+    @mock.patch(
+        "scrapper.core.http_client.ScrapperHTTPClient.get",
+        side_effect=fake_get,
+    )
+    def test_sync_images(self, _):
+        """
+        Test sync fans out per address chunk by chunk and reports a summary
+        """
+        addresses = [
+            Address.objects.create(url=url)
+            for url in [
+                PAGE_URL,
+                "https://www.example.com/empty",
+                "https://www.example.com/other",
+            ]
+        ]
+        run = SyncRun.objects.get(pk=sync_images.delay().get())
+        self.assertEqual(run.status, SyncRun.Status.SUCCESS)
+        self.assertEqual(run.chunk, 2)
+        self.assertEqual(run.last_address_id, addresses[-1].pk)
+        summary = run.summary()
+        self.assertEqual(summary["addresses_done"], 3)
+        self.assertEqual(summary["new_images"], 2)
+
+    @override_settings(SCRAPPER_SYNC_CHUNK_SIZE=2)
+    def test_sync_images_failure(self):
+        """
+        Test an address failing with any error does not stall the sync
+        """
+        for i in range(4):
+            Address.objects.create(url=f"https://www.example.com/page/{i}")
+
+        def get(url, *args, **kwargs):
+            if url.endswith("/1"):
+                raise requests.TooManyRedirects("Exceeded 30 redirects")
+            return FakeResponse(b"<html></html>")
+
+        with mock.patch(
+            "scrapper.core.http_client.ScrapperHTTPClient.get",
+            side_effect=get,
+        ):
+            run = SyncRun.objects.get(pk=sync_images.delay().get())
+        self.assertEqual(run.status, SyncRun.Status.SUCCESS)
+        self.assertEqual(run.pending, 0)
+        self.assertEqual(run.addresses_done, 4)
+        self.assertEqual(run.failures, 1)
+
+    def test_sync_images_resume(self):
+        """
+        Test a resumed sync starts after the last completed chunk
+        """
+        first = Address.objects.create(url="https://www.example.com/done")
+        run = SyncRun.objects.create(last_address_id=first.pk)
+        with mock.patch.object(
+            Address,
+            "sync_address",
+            side_effect=lambda pk: {
+                "address": pk,
+                "new_images": 1,
+                "error": "",
+                "seconds": 0.1,
+            },
+        ) as sync_address:
+            Address.objects.create(url="https://www.example.com/todo")
+            sync_images.delay(run.pk)
+        run.refresh_from_db()
+        self.assertEqual(sync_address.call_count, 1)
+        self.assertEqual(run.addresses_done, 1)
+        self.assertEqual(run.status, SyncRun.Status.SUCCESS)
+
+    @mock.patch("scrapper.core.http_client.ScrapperHTTPClient.get")
+    def test_fetch_image_keeps_original_bytes(self, get):
+        """
+        Test ingest stores the downloaded bytes without re-encoding
+        """
+        content = make_image_bytes("GIF", size=(20, 10))
+        get.return_value = FakeResponse(content)
+        with mock.patch.object(PILImage.Image, "save") as save:
+            fetched = Image.fetch_image(f"{PAGE_URL}/a.gif")
+            save.assert_not_called()
+        self.assertEqual(fetched.content, content)
+        self.assertEqual((fetched.width, fetched.height), (20, 10))
+        self.assertEqual(fetched.format, "GIF")
+        self.assertTrue(fetched.file_name.endswith(".gif"))
+        with override_settings(SCRAPPER_REENCODE_ON_INGEST=True):
+            fetched = Image.fetch_image(f"{PAGE_URL}/a.gif")
+        self.assertEqual(fetched.format, "GIF")
+
+    @mock.patch(
+        "scrapper.core.http_client.ScrapperHTTPClient.get",
+        side_effect=fake_get,
+    )
+    def test_save_multiple_images_bulk(self, _):
+        """
+        Test image rows of a page are inserted in a single query,
+        along with the known image lookup and the insert check
+        """
+        address = Address.objects.create(url=PAGE_URL)
+        with self.assertNumQueries(3):
+            Image.save_multiple_images(address)
+        for image in Image.get_queryset_by_url(address):
+            self.assertTrue(image.image.storage.exists(image.image.name))
+            self.assertIn(image.image_name, image.image.name)
+            self.assertEqual(
+                image.original_url_hash, hash_url(image.original_url)
+            )
+
+    @mock.patch(
+        "scrapper.core.http_client.ScrapperHTTPClient.get",
+        side_effect=fake_get,
+    )
+    def test_rescrape_skips_known_images(self, get):
+        """
+        Test a re-scrape only downloads images that are not stored yet
+        """
+        address = Address.objects.create(url=PAGE_URL)
+        Image.save_multiple_images(address)
+        Image.objects.filter(original_url=f"{PAGE_URL}/a.png").delete()
+        get.reset_mock()
+        images = Image.save_multiple_images(address)
+        self.assertEqual(images.count(), 2)
+        # The page, the deleted image and the invalid one
+        self.assertEqual(
+            sorted(call.args[0] for call in get.call_args_list),
+            sorted(
+                [
+                    PAGE_URL,
+                    f"{PAGE_URL}/a.png",
+                    "https://cdn.example.com/c.txt",
+                ]
+            ),
+        )
+
+    @mock.patch(
+        "scrapper.core.http_client.ScrapperHTTPClient.get",
+        side_effect=fake_get,
+    )
+    def test_restore_is_scoped(self, _):
+        """
+        Test a restore only replaces the images of its url,
+        the previous files are removed after the commit
+        """
+        address = Address.objects.create(url=PAGE_URL)
+        Image.save_multiple_images(address)
+        other = Image.store_image(
+            Image.fetch_image("https://www.example.org/d.png"),
+            Address.objects.create(url="https://www.example.org/"),
+        )
+        previous = list(Image.get_queryset_by_url(address))
+        with override_settings(SCRAPPER_DELETE_BATCH_SIZE=1):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                images = Image.remove_all_and_restore(address)
+        # Two file batches and the rendition cache invalidation
+        self.assertEqual(len(callbacks), 3)
+        self.assertEqual(images.count(), 2)
+        self.assertTrue(Image.objects.filter(pk=other.pk).exists())
+        self.assertTrue(other.image.storage.exists(other.image.name))
+        for image in previous:
+            self.assertNotIn(image, images)
+            self.assertFalse(image.image.storage.exists(image.image.name))
+        for image in images:
+            self.assertTrue(image.image.storage.exists(image.image.name))
+
+    def test_explain_queries(self):
+        """
+        Test the query plans are printed for every main query
+        """
+        out = StringIO()
+        call_command("explain_queries", stdout=out)
+        self.assertIn("image_by_original_url", out.getvalue())
+        self.assertIn("original_url_hash", out.getvalue())
+
+    def test_ingest_sitemap_batches(self):
+        """
+        Test the sitemap pages are inserted in batches without duplicates
+        """
+        with OriginServer(pages=5) as origin:
+            Address.objects.create(url=origin.page_url(0))
+            stats = ingest_sitemap(
+                origin.sitemap_url(), scrape=False, batch_size=2, limit=4
+            )
+            with self.assertRaises(ValidationError):
+                ingest_sitemap(origin.page_url(0))
+        self.assertEqual(
+            stats,
+            {"sitemaps": 2, "errors": 0, "urls": 4, "created": 3, "jobs": 0},
+        )
+        self.assertEqual(Address.objects.filter(domain="127.0.0.1").count(), 4)
+
+    def test_benchmark_baseline(self):
+        """
+        Test the pipeline benchmark runs offline and catches regressions
+        """
+        results = run_pipeline(
+            pages=1, images=3, sizes=((320, 240),), renditions=2, page_size=2
+        )
+        self.assertEqual(
+            [result["stage"] for result in results],
+            ["scrape", "original", "rendition_cold", "rendition_warm", "list"],
+        )
+        self.assertEqual(results[0]["images"], 3)
+        self.assertEqual(compare(results, results), [])
+        slower = [
+            {**result, "p95_ms": result["p95_ms"] * 2}
+            for result in results
+            if "p95_ms" in result
+        ]
+        self.assertEqual(len(compare(slower, results, tolerance=0.5)), 4)
@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase, override_settings
+
+from scrapper.core.parsers import (
+    EXTRACTORS,
+    SoupImageExtractor,
+    extract_images,
+    generate_document,
+    get_extractor,
+)
+
+DOCUMENT = """
+<html><body>
+    <IMG SRC="/upper.png">
+    <img src="a.jpg?w=1&amp;h=2"/>
+    <img alt="no source">
+    <p><img src='https://cdn.example.com/b.gif'></p>
+    <A HREF="/gallery/2">Next</a><a name="top">Top</a>
+    <script>var html = "<img src=not-an-image>";</script>
+</body></html>
+"""
+
+
+class TestParsers(SimpleTestCase):
+    def test_engines_agree(self):
+        """
+        Test every engine extracts the same image sources as BeautifulSoup
+        """
+        expected = SoupImageExtractor().extract(DOCUMENT)
+        self.assertEqual(
+            expected,
+            ["/upper.png", "a.jpg?w=1&h=2", "https://cdn.example.com/b.gif"],
+        )
+        for name, extractor in EXTRACTORS.items():
+            if extractor.is_available():
+                self.assertEqual(extractor().extract(DOCUMENT), expected, name)
+
+    def test_engines_extract_links(self):
+        """
+        Test every engine extracts the links followed by the crawler
+        """
+        for name, extractor in EXTRACTORS.items():
+            if extractor.is_available():
+                page = extractor().extract_page(DOCUMENT)
+                self.assertEqual(page.links, ["/gallery/2"], name)
+
+    def test_large_document(self):
+        """
+        Test engines agree on a large generated document
+        """
+        html = generate_document(images=1000)
+        images = extract_images(html, "bs4")
+        self.assertEqual(len(images), 1000)
+        self.assertEqual(extract_images(html, "stream"), images)
+        self.assertEqual(extract_images(html), images)
+
+    @override_settings(SCRAPPER_HTML_PARSER="stream")
+    def test_configured_engine(self):
+        """
+        Test the engine is picked from the settings
+        """
+        self.assertEqual(get_extractor().name, "stream")
@@ -0,0 +1,378 @@
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image as PILImage
+
+from scrapper.core import renditions
+from scrapper.core.models import Image, Rendition
+from scrapper.core.renditions import (
+    InlineExecutor,
+    RenditionCache,
+    RenditionKey,
+)
+from scrapper.core.tests.utils import (
+    CeleryEagerMixin,
+    create_image,
+    make_image_bytes,
+)
+from scrapper.core.transcode import (
+    TranscodeBusy,
+    TranscodeService,
+    TranscodeTimeout,
+)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestRenditionCache(CeleryEagerMixin, TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.cache = RenditionCache(
+            directory=Path(MEDIA_ROOT) / "test-renditions", max_bytes=100
+        )
+        self.cache.clear()
+
+    def test_single_flight(self):
+        """
+        Test concurrent requests of a missing rendition render it once
+        """
+        calls = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.05)
+            return b"rendition"
+
+        key = RenditionKey(1, 10, 10, "png", 100)
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    self.cache.get_or_create(key, render)
+                )
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [b"rendition"] * 5)
+
+    def test_single_flight_across_caches(self):
+        """
+        Test caches sharing a directory, like the caches of several
+        processes, render a missing rendition once
+        """
+        calls = []
+
+        def render():
+            calls.append(1)
+            time.sleep(0.05)
+            return b"rendition"
+
+        key = RenditionKey(1, 20, 20, "png", 100)
+        caches = [
+            RenditionCache(directory=self.cache.directory, max_bytes=100)
+            for _ in range(5)
+        ]
+        threads = [
+            threading.Thread(target=cache.get_or_create, args=(key, render))
+            for cache in caches + caches
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        for cache in caches:
+            self.assertEqual(cache._key_locks, {})
+        lock_path = self.cache.path(key).with_name(
+            f"{self.cache.path(key).name}.lock"
+        )
+        self.assertFalse(lock_path.exists())
+
+    def test_lru_eviction(self):
+        """
+        Test least recently used renditions are evicted over the budget
+        """
+        keys = [RenditionKey(1, i, i, "png", 100) for i in range(3)]
+        self.cache.get_or_create(keys[0], lambda: b"a" * 40)
+        self.cache.get_or_create(keys[1], lambda: b"b" * 40)
+        time.sleep(0.01)
+        # Touch the oldest one so the second becomes least recently used
+        self.cache.get(keys[0])
+        self.cache.get_or_create(keys[2], lambda: b"c" * 40)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+    def test_image_view_cache(self):
+        """
+        Test image view stores the rendition and delete invalidates it
+        """
+        image = create_image()
+        url = reverse("image-view", kwargs={"pk": image.pk})
+        resp = self.client.get(url, {"width": 100, "format": "webp"})
+        self.assertEqual(resp["Content-Type"], "image/webp")
+        img = PILImage.open(BytesIO(resp.content))
+        self.assertEqual(img.size, (100, 75))
+        rendition_dir = Path(MEDIA_ROOT) / "renditions" / str(image.pk)
+        self.assertEqual(len(list(rendition_dir.iterdir())), 1)
+        # Served from the cache
+        self.assertEqual(
+            self.client.get(url, {"width": 100, "format": "webp"}).content,
+            resp.content,
+        )
+        image.delete()
+        self.assertFalse(rendition_dir.exists())
+
+    def test_delete_in_batches_invalidates_on_commit(self):
+        """
+        Test the cached renditions of deleted images are only removed
+        once the transaction is committed
+        """
+        image = create_image()
+        url = reverse("image-view", kwargs={"pk": image.pk})
+        self.client.get(url, {"width": 100, "format": "webp"})
+        rendition_dir = Path(MEDIA_ROOT) / "renditions" / str(image.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Image.delete_in_batches(Image.objects.filter(pk=image.pk))
+        self.assertTrue(rendition_dir.exists())
+        for callback in callbacks:
+            callback()
+        self.assertFalse(rendition_dir.exists())
+
+    def test_image_view_conditional(self):
+        """
+        Test image view validators and 304 on revalidation
+        """
+        image = create_image()
+        url = reverse("image-view", kwargs={"pk": image.pk})
+        resp = self.client.get(url, {"width": "small"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("immutable", resp["Cache-Control"])
+        etag = resp["ETag"]
+        # Different rendition, different validator
+        self.assertNotEqual(self.client.get(url, {"width": 100})["ETag"], etag)
+        with mock.patch(
+            "scrapper.core.views.ImageView.transcode"
+        ) as transcode:
+            resp = self.client.get(
+                url, {"width": "small"}, HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp["ETag"], etag)
+            resp = self.client.get(
+                url,
+                {"width": "small"},
+                HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"],
+            )
+            self.assertEqual(resp.status_code, 304)
+            transcode.assert_not_called()
+
+    @override_settings(
+        SCRAPPER_PRECOMPUTE_RENDITIONS=True,
+        SCRAPPER_PRECOMPUTE_FORMATS=["jpeg", "webp"],
+    )
+    def test_precomputed_renditions(self):
+        """
+        Test preset renditions are stored after the ingest
+        and served by the image view without resizing
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            image = create_image(fmt="PNG", size=(2000, 1000))
+        # Presets larger than the image share the original size
+        self.assertEqual(
+            sorted(image.renditions.values_list("width", "format")),
+            sorted(
+                (width, img_format)
+                for width in (256, 1024, 2000)
+                for img_format in ("jpeg", "png", "webp")
+            ),
+        )
+        rendition = image.renditions.get(width=256, format="webp")
+        self.assertEqual(rendition.height, 128)
+        url = reverse("image-view", kwargs={"pk": image.pk})
+        with mock.patch(
+            "scrapper.core.views.ImageView.transcode"
+        ) as transcode:
+            resp = self.client.get(url, {"width": "small", "format": "webp"})
+            transcode.assert_not_called()
+        self.assertEqual(resp["Content-Type"], "image/webp")
+        self.assertIn("immutable", resp["Cache-Control"])
+        with rendition.file.open("rb") as rendition_file:
+            self.assertEqual(
+                b"".join(resp.streaming_content), rendition_file.read()
+            )
+        name = rendition.file.name
+        image.delete()
+        self.assertFalse(rendition.file.storage.exists(name))
+        self.assertFalse(Rendition.objects.exists())
+
+    def test_image_view_wide_image(self):
+        """
+        Test a very wide image is resized to at least 1px high
+        """
+        image = create_image(size=(3000, 10), name="wide.png")
+        resp = self.client.get(
+            reverse("image-view", kwargs={"pk": image.pk}), {"width": "100"}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(PILImage.open(BytesIO(resp.content)).size, (100, 1))
+
+    @override_settings(SCRAPPER_PRECOMPUTE_FORMATS=["jpeg", "webp"])
+    def test_precompute_failing_format(self):
+        """
+        Test a format failing to encode does not drop the other
+        renditions of the image
+        """
+        image = create_image(fmt="PNG", size=(2000, 1000))
+        encode = renditions.encode_rendition
+
+        def encode_rendition(content, size, img_format, quality=100):
+            if img_format == "webp":
+                raise OSError("encoder webp not available")
+            return encode(content, size, img_format, quality)
+
+        with mock.patch(
+            "scrapper.core.models.get_rendition_pool",
+            return_value=InlineExecutor(),
+        ), mock.patch(
+            "scrapper.core.renditions.encode_rendition",
+            side_effect=encode_rendition,
+        ), self.assertLogs(
+            "scrapper.core.models", "WARNING"
+        ) as logs:
+            stored = Rendition.precompute([image.pk])
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(stored, 6)
+        self.assertEqual(
+            set(image.renditions.values_list("format", flat=True)),
+            {"jpeg", "png"},
+        )
+
+    def test_image_view_palette(self):
+        """
+        Test a large downscale of a palette (GIF) image, without
+        precomputed renditions the rendition table is not queried
+        """
+        image = create_image(fmt="GIF", size=(2000, 1000), name="a.gif")
+        with mock.patch("scrapper.core.views.Rendition.find") as find:
+            resp = self.client.get(
+                reverse("image-view", kwargs={"pk": image.pk}),
+                {"width": "small"},
+            )
+            find.assert_not_called()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(PILImage.open(BytesIO(resp.content)).size, (256, 128))
+
+    def test_original_streaming(self):
+        """
+        Test originals are streamed as stored, with byte range support
+        """
+        image = create_image(fmt="PNG", size=(400, 300))
+        with image.image.open("rb") as image_file:
+            content = image_file.read()
+        url = reverse("image-view", kwargs={"pk": image.pk})
+        with mock.patch(
+            "scrapper.core.views.ImageView.transcode"
+        ) as transcode:
+            resp = self.client.get(url)
+            transcode.assert_not_called()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Accept-Ranges"], "bytes")
+        self.assertEqual(resp["Content-Length"], str(len(content)))
+        self.assertEqual(b"".join(resp.streaming_content), content)
+        resp = self.client.get(url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp["Content-Range"], f"bytes 10-19/{len(content)}")
+        self.assertEqual(b"".join(resp.streaming_content), content[10:20])
+        resp = self.client.get(url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(resp.streaming_content), content[-5:])
+        resp = self.client.get(url, HTTP_RANGE=f"bytes={len(content)}-")
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp["Content-Range"], f"bytes */{len(content)}")
+        # Outdated client copy, the full file is sent
+        resp = self.client.get(
+            url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"outdated"'
+        )
+        self.assertEqual(resp.status_code, 200)
+
+    @override_settings(
+        SCRAPPER_SENDFILE="x-accel-redirect",
+        SCRAPPER_SENDFILE_PREFIX="/protected-media/",
+    )
+    def test_original_sendfile(self):
+        """
+        Test the transfer of originals is delegated to the web server
+        """
+        image = create_image()
+        resp = self.client.get(reverse("image-view", kwargs={"pk": image.pk}))
+        self.assertEqual(
+            resp["X-Accel-Redirect"], f"/protected-media/{image.image.name}"
+        )
+        self.assertEqual(resp["Content-Type"], "image/png")
+        self.assertEqual(resp.content, b"")
+
+    def test_image_view_unavailable(self):
+        """
+        Test the image view answers 503 with Retry-After when saturated
+        """
+        image = create_image()
+        with mock.patch(
+            "scrapper.core.views.ImageView.transcode",
+            side_effect=TranscodeBusy("Transcoding queue is full", 3),
+        ):
+            resp = self.client.get(
+                reverse("image-view", kwargs={"pk": image.pk}), {"width": 123}
+            )
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp["Retry-After"], "3")
+        self.assertIn("no-store", resp["Cache-Control"])
+
+
+class TestTranscodeService(SimpleTestCase):
+    def test_transcode(self):
+        """
+        Test images are encoded in the pool from bytes
+        """
+        service = TranscodeService(max_workers=1, max_pending=1, timeout=30)
+        content = service.transcode(
+            make_image_bytes("PNG", size=(400, 300)), (100, 75), "webp"
+        )
+        self.assertEqual(PILImage.open(BytesIO(content)).size, (100, 75))
+        # The slot is released once the transcode is done
+        service.transcode(make_image_bytes(), (20, 15), "jpeg")
+        service.pool.shutdown()
+
+    def test_backpressure(self):
+        """
+        Test a full queue or a slow transcode is rejected with a retry delay
+        """
+        service = TranscodeService(
+            max_workers=0, max_pending=1, timeout=1, retry_after=5
+        )
+        service._slots.acquire()
+        with self.assertRaises(TranscodeBusy) as busy:
+            service.transcode(make_image_bytes(), (20, 15), "png")
+        self.assertEqual(busy.exception.retry_after, 5)
+        service._slots.release()
+        # A fresh pool can not start its process in time
+        service = TranscodeService(max_workers=1, max_pending=1, timeout=0.001)
+        with self.assertRaises(TranscodeTimeout):
+            service.transcode(make_image_bytes(), (20, 15), "png")
+        service.pool.shutdown()
@@ -0,0 +1,68 @@
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image as PILImage
+
+from scrapper.core.resize import PRESETS, resize
+from scrapper.core.tests.utils import make_image_bytes
+
+
+class TestResize(SimpleTestCase):
+    def test_jpeg_draft_decoding(self):
+        """
+        Test a large JPEG downscale decodes a reduced image
+        """
+        content = make_image_bytes("JPEG", size=(4000, 3000))
+        for name, preset in PRESETS.items():
+            pil_image = PILImage.open(BytesIO(content))
+            resized = resize(pil_image, (256, 192), preset)
+            self.assertEqual(resized.size, (256, 192), name)
+            if preset.reducing_gap is None:
+                self.assertEqual(pil_image.size, (4000, 3000))
+            else:
+                # Decoded at 1/4 or 1/8 scale by the JPEG decoder
+                self.assertLessEqual(pil_image.width, 1000, name)
+                self.assertGreaterEqual(
+                    pil_image.width, 256 * preset.reducing_gap, name
+                )
+
+    def test_reduce_and_no_upscale(self):
+        """
+        Test other formats are reduced and images are never upscaled
+        """
+        content = make_image_bytes("PNG", size=(2000, 1000))
+        resized = resize(
+            PILImage.open(BytesIO(content)), (100, 50), PRESETS["balanced"]
+        )
+        self.assertEqual(resized.size, (100, 50))
+        pil_image = PILImage.open(BytesIO(content))
+        self.assertIs(
+            resize(pil_image, (3000, 1500), PRESETS["balanced"]), pil_image
+        )
+
+    def test_reduce_palette_modes(self):
+        """
+        Test modes unsupported by reduce() (GIF palette, 1-bit, I;16)
+        are converted before the reduction
+        """
+        for img_format, mode in (("GIF", "P"), ("PNG", "1"), ("PNG", "I;16")):
+            buffer = BytesIO()
+            PILImage.new(mode, (2000, 1000)).save(buffer, img_format)
+            pil_image = PILImage.open(BytesIO(buffer.getvalue()))
+            self.assertEqual(pil_image.mode, mode)
+            resized = resize(pil_image, (100, 50), PRESETS["balanced"])
+            self.assertEqual(resized.size, (100, 50), mode)
+
+    def test_extreme_aspect_ratio(self):
+        """
+        Test a side rounded down to 0 px is resized to 1 px
+        """
+        for size, target in (((3000, 10), (100, 0)), ((10, 3000), (0, 100))):
+            content = make_image_bytes("PNG", size=size)
+            for name, preset in PRESETS.items():
+                resized = resize(
+                    PILImage.open(BytesIO(content)), target, preset
+                )
+                self.assertEqual(
+                    resized.size, tuple(max(side, 1) for side in target), name
+                )
@@ -0,0 +1,80 @@
+"""
+Offline fixtures shared by the test cases
+"""
+
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+from scrapper.config.celery import app as celery_app
+from scrapper.core.models import Address, FetchedImage, Image
+
+PAGE_URL = "https://www.example.com/gallery"
+
+
+class CeleryEagerMixin:
+    """
+    Runs the Celery tasks of a test case in process, no broker required,
+    the previous configuration is restored after the test case
+    """
+
+    celery_settings = {"task_always_eager": True, "broker_url": "memory://"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._celery_settings = {
+            name: celery_app.conf[name] for name in cls.celery_settings
+        }
+        celery_app.conf.update(cls.celery_settings)
+
+    @classmethod
+    def tearDownClass(cls):
+        celery_app.conf.update(cls._celery_settings)
+        super().tearDownClass()
+
+
+def make_image_bytes(fmt="PNG", size=(40, 30)) -> bytes:
+    buffer = BytesIO()
+    PILImage.new("RGB", size, "red").save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, url: str = ""):
+        self.content = content
+        self.url = url
+        self.text = content.decode("utf-8", errors="ignore")
+
+
+def fake_get(url, *args, **kwargs):
+    """
+    Serves a page with 3 images, one of them is not an image
+    """
+    if url == PAGE_URL:
+        return FakeResponse(
+            b'<html><img src="/a.png"/><img src="b.jpg"/>'
+            b'<img src="https://cdn.example.com/c.txt"/></html>'
+        )
+    if url.endswith(".txt"):
+        return FakeResponse(b"not an image")
+    return FakeResponse(make_image_bytes("JPEG" if "jpg" in url else "PNG"))
+
+
+def create_image(fmt="PNG", size=(400, 300), name="a.png") -> Image:
+    """
+    Stores an image of the test page without any network access
+    """
+    address, created = Address.objects.get_or_create(url=PAGE_URL)
+    return Image.store_image(
+        FetchedImage(
+            original_url=f"{PAGE_URL}/{name}",
+            file_name=name,
+            content=make_image_bytes(fmt, size=size),
+            height=size[1],
+            width=size[0],
+            mode="RGB",
+            format=fmt,
+        ),
+        address,
+    )
@@ -0,0 +1,170 @@
+"""
+Transcoding service, resizes and encodes images out of the web workers
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple, Union
+
+from django.conf import settings
+
+from scrapper.core.renditions import InlineExecutor, encode_rendition
+
+
+class TranscodeUnavailable(Exception):
+    """
+    The transcoding service can not encode the image right now,
+    the client should retry after `retry_after` seconds
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TranscodeBusy(TranscodeUnavailable):
+    """
+    Every slot of the transcoding queue is taken
+    """
+
+
+class TranscodeTimeout(TranscodeUnavailable):
+    """
+    The image was not encoded in time
+    """
+
+
+class TranscodeService:
+    """
+    Encodes renditions in a pool of processes so a large transcode does not
+    hold the GIL of the web worker. The number of transcodes running or
+    waiting for a process is bounded, a request over the limit is rejected
+    right away instead of queueing behind the others
+
+    Attributes:
+        `max_workers`: Number of processes of the pool
+        `max_pending`: Maximum number of transcodes running or queued
+        `timeout`: Seconds a request waits for its transcode
+        `retry_after`: Seconds a rejected client should wait
+
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        timeout: Optional[float] = None,
+        retry_after: Optional[int] = None,
+    ):
+        self.max_workers = (
+            settings.SCRAPPER_TRANSCODE_WORKERS
+            if max_workers is None
+            else max_workers
+        )
+        self.max_pending = (
+            settings.SCRAPPER_TRANSCODE_MAX_PENDING
+            if max_pending is None
+            else max_pending
+        )
+        self.timeout = (
+            settings.SCRAPPER_TRANSCODE_TIMEOUT if timeout is None else timeout
+        )
+        self.retry_after = (
+            settings.SCRAPPER_TRANSCODE_RETRY_AFTER
+            if retry_after is None
+            else retry_after
+        )
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> Executor:
+        """
+        Process pool started with `spawn` on first use, transcodes run
+        inline in daemonic processes which can not start child processes
+        """
+        with self._lock:
+            if self._pool is None:
+                if (
+                    self.max_workers < 1
+                    or multiprocessing.current_process().daemon
+                ):
+                    self._pool = InlineExecutor()
+                else:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+            return self._pool
+
+    def _reset_pool(self, pool: Executor):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def transcode(
+        self,
+        source: Union[bytes, str],
+        size: Tuple[int, int],
+        img_format: str,
+        quality: int = 100,
+    ) -> bytes:
+        """
+        Resizes and encodes an image in the pool
+        Args:
+            source: Encoded original image or path of the image file
+            size: Output (width, height) in px
+            img_format: Output format, Example: 'jpeg', 'webp'
+            quality: Output encoder quality
+
+        Returns: bytes, encoded rendition
+
+        Raises:
+            TranscodeBusy if the queue is full
+            TranscodeTimeout if the image is not encoded within `timeout`
+
+        """
+        if not self._slots.acquire(blocking=False):
+            raise TranscodeBusy("Transcoding queue is full", self.retry_after)
+        pool = self.pool
+        try:
+            future = pool.submit(
+                encode_rendition, source, size, img_format, quality
+            )
+        except BrokenProcessPool:
+            # A worker died, e.g. killed by the OOM killer
+            self._slots.release()
+            self._reset_pool(pool)
+            raise TranscodeBusy("Transcoding pool restarted", self.retry_after)
+        # The slot is held until the worker is done, a timed out
+        # transcode keeps its slot while it still runs in the pool
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TranscodeTimeout("Transcoding timed out", self.retry_after)
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            raise TranscodeBusy("Transcoding pool restarted", self.retry_after)
+
+
+_service: Optional[TranscodeService] = None
+_service_lock = threading.Lock()
+
+
+def get_transcode_service() -> TranscodeService:
+    """
+    Returns: Process wide TranscodeService
+
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TranscodeService()
+        return _service
@@ -4,6 +4,10 @@ from scrapper.core.apis import (
     ImageDetailsAPI,
     ImageListAPI,
     ImageOriginalURLQueryAPI,
+    ImageSearchAPI,
+    MetricsAPI,
+    ScrapeJobDetailAPI,
+    SitemapIngestAPI,
     URLImageScrappingAPI,
     URLImagesDeleteScrapeAPI,
 )
@@ -26,4 +30,16 @@ urlpatterns = [
         ImageOriginalURLQueryAPI.as_view(),
         name="image-query-view",
     ),
+    path(
+        "images/search/",
+        ImageSearchAPI.as_view(),
+        name="image-search-view",
+    ),
+    path(
+        "jobs/<uuid:pk>/",
+        ScrapeJobDetailAPI.as_view(),
+        name="job-detail-view",
+    ),
+    path("sitemap/", SitemapIngestAPI.as_view(), name="sitemap-view"),
+    path("metrics/", MetricsAPI.as_view(), name="metrics-view"),
 ]
@@ -1,4 +1,6 @@
+import hashlib
 import re
+from urllib.parse import urlparse
 
 from django.core.exceptions import ValidationError
 from rest_framework.exceptions import ValidationError as RestValidationError
@@ -82,3 +84,28 @@ def normalize_url(url: str) -> str:
         normalized_url[:-1] if normalized_url[-1] == "/" else normalized_url
     )
     return normalized_url
+
+
+def hash_url(url: str) -> str:
+    """
+    Fixed size digest of a url, long urls are indexed and looked up
+    by their digest instead of the full text
+
+    Args:
+        url: URL String
+
+    Returns: str, hex SHA-1 digest of the url
+
+    """
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+def get_domain(url: str) -> str:
+    """
+    Args:
+        url: URL String
+
+    Returns: str, lower case host name of the url without the port
+
+    """
+    return urlparse(normalize_url(url)).hostname or ""
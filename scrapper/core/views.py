@@ -1,14 +1,26 @@
+import hashlib
+import time
 from typing import Optional
 
 import requests
-from django.http import Http404, HttpResponse
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
 from django.views import View
 from django.views.generic import TemplateView, View
 
-from scrapper.core.const import SUPPORTED_FORMATS
-from scrapper.core.models import Address, Image
+from scrapper.core.const import RENDITION_PRESETS, SUPPORTED_FORMATS
+from scrapper.core.metrics import IMAGE_VIEW_SECONDS, TRANSCODE_SECONDS
+from scrapper.core.models import Address, Image, Rendition
+from scrapper.core.profiling import ProfileStore
+from scrapper.core.renditions import RenditionKey, get_rendition_cache
+from scrapper.core.streaming import serve_file
+from scrapper.core.transcode import TranscodeUnavailable, get_transcode_service
 
 
 class ImageView(View):
@@ -18,7 +30,7 @@ class ImageView(View):
 
     model = Image
     # Query size Dictionary, refers to image width
-    size = {"small": 256, "medium": 1024, "large": 2048}
+    size = RENDITION_PRESETS
 
     # Supported Image formats
 
@@ -51,6 +63,130 @@ class ImageView(View):
             return int(req_size)
         return 100
 
+    @staticmethod
+    def get_etag(image: Image, name: str) -> str:
+        """
+        Strong ETag of a rendition, changes whenever the image record
+        is updated or the rendition parameters differ
+        Args:
+            image: Image instance
+            name: Rendition file name, `original` for the stored file
+
+        Returns: str, quoted ETag
+
+        """
+        value = f"{image.pk}:{image.updated.isoformat()}:{name}"
+        return quote_etag(hashlib.sha1(value.encode()).hexdigest())
+
+    @staticmethod
+    def set_cache_headers(
+        response: HttpResponse, etag: str, last_modified: int
+    ):
+        """
+        Sets validators and long lived Cache-Control headers
+        Args:
+            response: HttpResponse or HttpResponseNotModified
+            etag: Quoted ETag
+            last_modified: Last modification timestamp
+
+        """
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.SCRAPPER_IMAGE_CACHE_MAX_AGE,
+            immutable=True,
+        )
+
+    @staticmethod
+    def is_original(request, image: Image, key: RenditionKey) -> bool:
+        """
+        Args:
+            request: HTTP Request Dictionary
+            image: Image instance
+            key: Requested RenditionKey
+
+        Returns: bool, True if the stored file can be sent as it is,
+                 no resizing, no format change and no quality given
+
+        """
+        return (
+            "quality" not in request.GET
+            and key.format == image.format_lower
+            and (key.width, key.height) == (image.width, image.height)
+        )
+
+    @staticmethod
+    def get_precomputed_response(
+        request, key: RenditionKey, etag: str, last_modified: int
+    ) -> Optional[HttpResponse]:
+        """
+        Streams a rendition precomputed at ingest
+        Args:
+            request: HTTP Request Dictionary
+            key: RenditionKey
+            etag: Quoted ETag of the rendition
+            last_modified: Last modification timestamp
+
+        Returns: HttpResponse | None, None if the rendition is not precomputed
+                 or `SCRAPPER_PRECOMPUTE_RENDITIONS` is disabled
+
+        """
+        if not settings.SCRAPPER_PRECOMPUTE_RENDITIONS:
+            return None
+        rendition = Rendition.find(key)
+        if rendition is None:
+            return None
+        try:
+            return serve_file(
+                request,
+                rendition.file,
+                f"image/{key.format}",
+                etag,
+                last_modified,
+            )
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def transcode(image: Image, key: RenditionKey) -> bytes:
+        """
+        Encodes a rendition in the transcoding process pool,
+        the pool reads local files itself
+        Args:
+            image: Image instance
+            key: RenditionKey
+
+        Returns: bytes, encoded rendition
+
+        """
+        try:
+            source = image.image.path
+        except NotImplementedError:
+            with image.image.open("rb") as image_file:
+                source = image_file.read()
+        with TRANSCODE_SECONDS.time(format=key.format):
+            return get_transcode_service().transcode(
+                source, (key.width, key.height), key.format, key.quality
+            )
+
+    @staticmethod
+    def get_unavailable_response(exc: TranscodeUnavailable) -> HttpResponse:
+        """
+        Args:
+            exc: TranscodeUnavailable raised by the transcoding service
+
+        Returns: HttpResponse, 503 asking the client to retry later
+
+        """
+        response = HttpResponse(
+            str(exc), status=503, content_type="text/plain"
+        )
+        response.headers["Retry-After"] = str(exc.retry_after)
+        patch_cache_control(response, no_store=True)
+        return response
+
     def get(self, request, pk) -> HttpResponse:
         """
         Sends image to client using Image ID
@@ -63,25 +199,69 @@ class ImageView(View):
         Returns:
 
         """
+        start = time.perf_counter()
         image = get_object_or_404(self.model, pk=pk)
         width = self.get_image_size("width", request)
         height = self.get_image_size("height", request)
         quality = self.get_quality(request)
         img_format = request.GET.get("format", image.format)
-        cropped_image = image.get_image_with_size(
-            width=width,
-            height=height,
-        )
         content_type: str = (
             img_format
             if img_format in SUPPORTED_FORMATS
             else image.format_lower
         )
-
-        response = HttpResponse(content_type=f"image/{content_type}")
-        cropped_image.save(
-            response, content_type.capitalize(), quality=quality
+        if content_type == "jpg":
+            content_type = "jpeg"
+        # Renditions are cached by their output size, requests that
+        # end up with the same size share the cached file
+        key = RenditionKey(
+            image.pk,
+            *image.get_rendition_size(width=width, height=height),
+            content_type,
+            quality,
         )
+        original = self.is_original(request, image, key)
+        etag = self.get_etag(image, "original" if original else key.file_name)
+        last_modified = int(image.updated.timestamp())
+        # Revalidation is answered without touching the image file
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        source = "not_modified"
+        if response is None and original:
+            source = "original"
+            # Streamed from the storage, Pillow is not involved
+            try:
+                response = serve_file(
+                    request,
+                    image.image,
+                    f"image/{content_type}",
+                    etag,
+                    last_modified,
+                )
+            except (FileNotFoundError, ValueError):
+                raise Http404("Image file does not exist")
+        if response is None:
+            source = "precomputed"
+            response = self.get_precomputed_response(
+                request, key, etag, last_modified
+            )
+        if response is None:
+            source = "rendition"
+            try:
+                content = get_rendition_cache().get_or_create(
+                    key, lambda: self.transcode(image, key)
+                )
+            except TranscodeUnavailable as exc:
+                IMAGE_VIEW_SECONDS.observe(
+                    time.perf_counter() - start, source="unavailable"
+                )
+                return self.get_unavailable_response(exc)
+            response = HttpResponse(
+                content, content_type=f"image/{content_type}"
+            )
+        self.set_cache_headers(response, etag, last_modified)
+        IMAGE_VIEW_SECONDS.observe(time.perf_counter() - start, source=source)
         return response
 
 
@@ -110,6 +290,48 @@ class ScrapeFormView(View):
             return render(
                 request,
                 template_name="image_list.html",
-                context={"data": resp.json()},
+                context={"data": resp.json()["results"]},
             )
         return Http404("Invalid URL")
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class ProfileListView(View):
+    """
+    Lists the recent request profiles, admin and staff users only
+    """
+
+    template_name = "admin/profiles.html"
+
+    def get(self, request):
+        return render(
+            request,
+            self.template_name,
+            {"title": "Request profiles", "profiles": ProfileStore().list()},
+        )
+
+
+@method_decorator(staff_member_required, name="dispatch")
+class ProfileDownloadView(View):
+    """
+    Downloads a request profile as a `pstats` dump, readable with
+    `python -m pstats` or snakeviz, `?summary` returns the functions
+    with the highest cumulative time as text
+    """
+
+    @staticmethod
+    def get(request, profile_id: str):
+        store = ProfileStore()
+        path = store.path(profile_id)
+        if path is None:
+            raise Http404("Profile does not exist")
+        if "summary" in request.GET:
+            return HttpResponse(
+                store.summary(profile_id), content_type="text/plain"
+            )
+        return FileResponse(
+            path.open("rb"),
+            as_attachment=True,
+            filename=path.name,
+            content_type="application/octet-stream",
+        )